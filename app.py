@@ -1,24 +1,38 @@
-from flask import Flask, request, jsonify, g, send_from_directory
+from flask import Flask, Response, request, jsonify, g, make_response, send_from_directory, stream_with_context
 from flask_cors import CORS
 from functools import wraps
-from rental_calculator import parse_request, calculate_rental
+from rental_calculator import calculate_rental, expand_saved_results
+from request_parser import parse_message
+from boat_index import suggest_boats
+from pricing_snapshot import get_snapshot, refresh_snapshot
+from tariff_coverage import analyze_coverage, coverage_summary, format_summary, get_coverage
+from usage_stats import get_usage_stats, update_usage_stats
+from avatars import (
+    AVATAR_MAX_BYTES, CACHE_MAX_AGE, AvatarError, avatar_urls, migrate_legacy_avatars, remove_avatar, save_avatar,
+)
+import history_queue
+import events
+from simulator import SimulationBusy, fail_interrupted, get_simulation, get_simulations, simulation_running, start_simulation
+import maintenance
+import json_codec
 from database import (
     init_db, get_user_by_username, get_user_by_id, verify_password,
     get_all_users, create_user, update_user, delete_user, update_avatar,
-    save_calculation, get_user_calculations, delete_calculation,
+    get_user_calculations, delete_calculation,
     get_all_boats, get_boat_by_id, get_boat_by_name, create_boat, update_boat, delete_boat,
-    get_prices_for_boat, replace_prices_for_boat,
+    get_prices_for_boat, replace_prices_bulk,
+    get_active_pricing_version, get_pricing_version, get_pricing_versions, activate_pricing_version,
     get_boat_count, get_price_count, get_last_sync, log_sync,
-    migrate_from_excel
+    get_catalog_version, get_bootstrap, migrate_from_excel,
+    get_holidays, create_holiday, delete_holiday
 )
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import jwt
 import datetime
 import logging
 import os
-import json
-import uuid
 
 load_dotenv()
 
@@ -33,6 +47,7 @@ AVATARS_DIR = os.path.join(BASE_DIR, 'avatars')
 os.makedirs(AVATARS_DIR, exist_ok=True)
 
 app = Flask(__name__, static_folder=os.path.join(BASE_DIR, 'frontend', 'dist'), static_url_path='')
+app.json = json_codec.FastJSONProvider(app)
 CORS(app)
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'navibot-dev-secret-change-me')
@@ -47,10 +62,14 @@ def create_token(user_id):
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
 
+def _request_token():
+    return request.headers.get('Authorization', '').replace('Bearer ', '')
+
+
 def auth_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        token = _request_token()
         if not token:
             return jsonify({'error': 'Требуется авторизация'}), 401
         try:
@@ -88,6 +107,61 @@ def editor_required(f):
     return decorated
 
 
+def token_required(f):
+    """
+    Только подпись токена, без чтения пользователя из БД — для горячих
+    эндпоинтов, которые отдают каталог (подсказки на каждое нажатие клавиши).
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = _request_token()
+        if not token:
+            return jsonify({'error': 'Требуется авторизация'}), 401
+        try:
+            jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Токен истёк'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Неверный токен'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+def catalog_etag(f):
+    """
+    ETag по версии каталога (boats / prices / sync_log).
+    If-None-Match с текущей версией, валидным токеном и существующим пользователем → 304
+    без запросов к таблицам: версия читается из файла, пользователь — из кеша процесса
+    (get_user_by_id). Роль здесь не проверяется: ставится снаружи @auth_required,
+    а с @editor_required / @admin_required — под ними.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        version = get_catalog_version()
+        # Слабое сравнение: сжатый ответ уходит со слабым ETag (json_codec.compress_response)
+        if request.if_none_match.contains_weak(version):
+            try:
+                payload = jwt.decode(_request_token(), JWT_SECRET, algorithms=['HS256'])
+            except jwt.InvalidTokenError:
+                payload = None
+            if payload and get_user_by_id(payload.get('user_id')):
+                resp = Response(status=304)
+                resp.set_etag(version)
+                resp.headers['Cache-Control'] = 'private, no-cache'
+                return resp
+        resp = make_response(f(*args, **kwargs))
+        if resp.status_code == 200:
+            resp.set_etag(version)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp
+    return decorated
+
+
+@app.after_request
+def _compress(response):
+    return json_codec.compress_response(response, request.accept_encodings)
+
+
 # === Auth ===
 
 @app.route('/api/login', methods=['POST'])
@@ -104,30 +178,83 @@ def login():
         return jsonify({'error': 'Неверный логин или пароль'}), 401
 
     token = create_token(user['id'])
-    return jsonify({
-        'token': token,
-        'user': {
-            'id': user['id'],
-            'username': user['username'],
-            'display_name': user['display_name'],
-            'role': user['role'],
-            'avatar': user.get('avatar')
-        }
-    })
+    return jsonify({'token': token, 'user': _user_payload(user)})
+
+
+def _user_payload(user):
+    return {
+        'id': user['id'],
+        'username': user['username'],
+        'display_name': user['display_name'],
+        'role': user['role'],
+        'avatar': user.get('avatar'),
+        'avatar_urls': avatar_urls(user.get('avatar')),
+    }
 
 
 @app.route('/api/me', methods=['GET'])
 @auth_required
 def me():
-    return jsonify({
-        'user': {
-            'id': g.user['id'],
-            'username': g.user['username'],
-            'display_name': g.user['display_name'],
-            'role': g.user['role'],
-            'avatar': g.user.get('avatar')
+    return jsonify({'user': _user_payload(g.user)})
+
+
+# === Bootstrap ===
+
+@app.route('/api/bootstrap', methods=['GET'])
+@auth_required
+def bootstrap():
+    """
+    Всё, что нужно SPA при старте, одним запросом: me, boats, sync, history
+    и users (админу). У каждой секции свой ETag; секции, ETag которых клиент
+    прислал в If-None-Match, не читаются и не отдаются (попадают в not_modified).
+    """
+    # Расчёты этого процесса, ещё лежащие в очереди, должны попасть в историю
+    history_queue.flush()
+    sections = get_bootstrap(g.user['id'], g.user['role'] == 'admin', request.if_none_match)
+
+    formatters = {'me': _user_payload, 'history': _history_payload, 'users': _users_payload}
+    body = {'etags': {}, 'not_modified': []}
+    for name, (etag, data) in sections.items():
+        body['etags'][name] = etag
+        if data is None:
+            body['not_modified'].append(name)
+        else:
+            body[name] = formatters[name](data) if name in formatters else data
+
+    resp = make_response(jsonify(body))
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+# === Events ===
+
+@app.route('/api/events', methods=['GET'])
+@auth_required
+def event_stream():
+    """
+    Поток Server-Sent Events: sync (прогресс синхронизации), catalog (новая
+    версия каталога), users (изменились пользователи). Клиент по событию
+    перечитывает только нужное (/api/bootstrap с ETag секций). Потоков в
+    процессе уже events.MAX_SUBSCRIBERS — 503 с Retry-After.
+    """
+    try:
+        q = events.subscribe()
+    except events.EventsBusy as e:
+        resp = jsonify({'error': str(e)})
+        resp.headers['Retry-After'] = str(events.BUSY_RETRY_AFTER)
+        return resp, 503
+    resp = Response(
+        events.stream(q),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Nginx не буферизует поток — события уходят клиенту сразу
+            'X-Accel-Buffering': 'no',
         }
-    })
+    )
+    # Клиент ушёл до первого чтения — генератор не запускался, отписка здесь
+    resp.call_on_close(lambda: events.unsubscribe(q))
+    return resp
 
 
 # === Calculate ===
@@ -141,28 +268,45 @@ def calculate():
     if not text:
         return jsonify({'error': 'Пустое сообщение.'}), 400
 
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    if not lines:
-        return jsonify({'error': 'Пустое сообщение.'}), 400
-
-    if len(lines) % 3 != 0:
-        return jsonify({
-            'error': 'Общее число непустых строк должно быть кратно 3 (дата, название, временной интервал для каждого запроса).'
-        }), 400
+    # Необязательно: посчитать по сохранённой версии цен, а не по активной
+    pricing_version = data.get('pricing_version')
+    if pricing_version is not None:
+        if not isinstance(pricing_version, int) or isinstance(pricing_version, bool):
+            return jsonify({'error': 'pricing_version — номер версии цен'}), 400
+        if not get_pricing_version(pricing_version):
+            return jsonify({'error': f'Версия цен {pricing_version} не найдена'}), 404
+    else:
+        # Все блоки — по одной версии, даже если её сменят посреди запроса:
+        # в истории у расчёта одна версия (calculations.version_id)
+        snap = get_snapshot()
+        pricing_version = snap.pricing_version if snap is not None else get_active_pricing_version()
 
     responses = []
-    for i in range(0, len(lines), 3):
-        block_lines = lines[i:i+3]
-        block_text = "\n".join(block_lines)
+    saved = []
+    for block in parse_message(text):
+        if not block.ok:
+            error = {
+                'error': f"Ошибка: {block.error_message()}",
+                'input': block.text,
+                'line': block.error_line,
+                'column': block.error_column,
+            }
+            responses.append(error)
+            saved.append(error)
+            continue
         try:
-            date_obj, boat_name, times = parse_request(block_text)
-            result = calculate_rental(date_obj, boat_name, times)
-            responses.append({'result': result})
+            quote = calculate_rental(block.date, block.boat_name, block.times, pricing_version)
+            responses.append({'result': quote.to_markdown(), 'quote': quote.to_dict()})
+            saved.append({'quote': quote.to_compact()})
         except Exception as e:
             logger.error("Ошибка при обработке блока: %s", e)
-            responses.append({'error': f"Ошибка: {e}", 'input': block_text})
+            error = {'error': f"Ошибка: {e}", 'input': block.text}
+            responses.append(error)
+            saved.append(error)
 
-    save_calculation(g.user['id'], text, responses)
+    # В историю — компактная форма, текст строится при чтении.
+    # Запись отложенная: ответ не ждёт commit (history_queue.py)
+    history_queue.enqueue_calculation(g.user['id'], text, saved)
     return jsonify({'results': responses})
 
 
@@ -171,16 +315,22 @@ def calculate():
 @app.route('/api/history', methods=['GET'])
 @auth_required
 def history():
-    calcs = get_user_calculations(g.user['id'])
+    # Расчёты этого процесса, ещё лежащие в очереди, должны попасть в ответ
+    history_queue.flush()
+    return jsonify({'history': _history_payload(get_user_calculations(g.user['id']))})
+
+
+def _history_payload(calcs):
     result = []
     for c in calcs:
         result.append({
             'id': c['id'],
             'input_text': c['input_text'],
-            'results': json.loads(c['results_json']),
+            # Текст результата SPA строит из quote (quoteMarkdown) — не рендерим его здесь
+            'results': expand_saved_results(json_codec.loads(c['results_json']), markdown=False),
             'created_at': c['created_at']
         })
-    return jsonify({'history': result})
+    return result
 
 
 @app.route('/api/history/<int:calc_id>', methods=['DELETE'])
@@ -193,13 +343,23 @@ def delete_history_entry(calc_id):
 # === Boats API ===
 
 @app.route('/api/boats', methods=['GET'])
+@catalog_etag
 @auth_required
 def list_boats():
     boats = get_all_boats()
     return jsonify({'boats': boats})
 
 
+@app.route('/api/boats/suggest', methods=['GET'])
+@token_required
+def boats_suggest():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 8, type=int)
+    return jsonify({'suggestions': suggest_boats(query, limit)})
+
+
 @app.route('/api/boats/<int:boat_id>', methods=['GET'])
+@catalog_etag
 @auth_required
 def get_boat(boat_id):
     boat = get_boat_by_id(boat_id)
@@ -247,9 +407,93 @@ def remove_boat(boat_id):
     return jsonify({'message': 'Теплоход удалён'})
 
 
+# === Prices import ===
+
+def _read_price_file():
+    """Файл цен из запроса (поле file, CSV/XLSX) → (строки, None) или (None, ответ с ошибкой)."""
+    from importer import read_price_upload
+    import tempfile
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return None, (jsonify({'error': 'Файл не найден'}), 400)
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ('csv', 'xlsx'):
+        return None, (jsonify({'error': 'Допустимые форматы: csv, xlsx'}), 400)
+
+    fd, path = tempfile.mkstemp(suffix=f'.{ext}')
+    os.close(fd)
+    try:
+        file.save(path)
+        rows = read_price_upload(path)
+    except Exception as e:
+        logger.error("Ошибка чтения файла цен: %s", e)
+        return None, (jsonify({'error': f'Не удалось прочитать файл: {e}'}), 400)
+    finally:
+        os.remove(path)
+
+    if not rows:
+        return None, (jsonify({'error': 'В файле нет строк с ценами'}), 400)
+    return rows, None
+
+
+def _validate_prices(rows):
+    """Строки цен → ((prices_by_boat, warnings, {boat_id: имя}), None) или (None, ответ 400 с ошибками)."""
+    from importer import validate_price_rows
+
+    boats = {b['id']: b['name'] for b in get_all_boats()}
+    boat_ids = {name.strip().lower(): boat_id for boat_id, name in boats.items()}
+    prices_by_boat, errors, warnings = validate_price_rows(rows, boat_ids)
+    if errors:
+        return None, (jsonify({
+            'error': f'Ошибок в файле: {len(errors)}. Цены не изменены.',
+            'errors': errors[:500],
+            'warnings': warnings[:500]
+        }), 400)
+    return (prices_by_boat, warnings, boats), None
+
+
+@app.route('/api/prices/import', methods=['POST'])
+@editor_required
+def import_prices():
+    """Загрузка тарифной сетки (CSV/XLSX) для части теплоходов. dry_run=1 — только показать разницу."""
+    from importer import diff_prices
+
+    dry_run = (request.form.get('dry_run') or request.args.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    rows, error = _read_price_file()
+    if error:
+        return error
+    validated, error = _validate_prices(rows)
+    if error:
+        return error
+    prices_by_boat, warnings, boats = validated
+
+    diff = []
+    for boat_id, prices_list in prices_by_boat.items():
+        added, removed, unchanged = diff_prices(get_prices_for_boat(boat_id), prices_list)
+        diff.append({'boat_id': boat_id, 'name': boats[boat_id], 'added': added, 'removed': removed, 'unchanged': unchanged})
+    diff.sort(key=lambda d: d['name'])
+
+    if not dry_run:
+        version_id = replace_prices_bulk(prices_by_boat, 'import', request.files['file'].filename)
+        summary = coverage_summary(prices_by_boat.keys())
+        details = f'Загрузка цен: теплоходов {len(prices_by_boat)}, строк {len(rows)}, версия цен {version_id}'
+        if format_summary(summary):
+            details += f'; {format_summary(summary)}'
+        log_sync('import', 'success', details)
+        refresh_snapshot()
+        return jsonify({
+            'dry_run': False, 'rows': len(rows), 'boats': diff, 'warnings': warnings[:500], 'coverage': summary,
+            'pricing_version': version_id,
+        })
+
+    return jsonify({'dry_run': dry_run, 'rows': len(rows), 'boats': diff, 'warnings': warnings[:500]})
+
+
 # === Sync / Update ===
 
 @app.route('/api/sync/status', methods=['GET'])
+@catalog_etag
 @auth_required
 def sync_status():
     last = get_last_sync()
@@ -270,14 +514,19 @@ def sync_from_wp():
 
     try:
         import requests
+        events.publish('sync', {'stage': 'fetch', 'message': 'Загрузка цен с сайта...'})
         resp = requests.get(WP_PRICES_URL, timeout=60)
         resp.raise_for_status()
         wp_data = resp.json()
 
-        updated = 0
+        # Цены всех теплоходов пишутся в конце одной версией: сбой посреди
+        # синхронизации не оставляет половину сетки новой
+        prices_by_boat = {}
         skipped = []
-        for boat_data in wp_data.get('boats', []):
+        wp_boats = wp_data.get('boats', [])
+        for i, boat_data in enumerate(wp_boats, 1):
             boat_name = boat_data.get('name', '').strip()
+            events.publish('sync', {'stage': 'boats', 'done': i, 'total': len(wp_boats), 'boat': boat_name})
             if not boat_name:
                 continue
 
@@ -294,21 +543,32 @@ def sync_from_wp():
 
             prices_list = parse_wp_boat(boat_data)
             if prices_list:
-                replace_prices_for_boat(boat['id'], prices_list)
-                updated += 1
+                prices_by_boat[boat['id']] = prices_list
 
+        updated = len(prices_by_boat)
+        version_id = replace_prices_bulk(prices_by_boat, 'wordpress') if prices_by_boat else None
         details = f'Обновлено: {updated}'
+        if version_id:
+            details += f', версия цен {version_id}'
         if skipped:
             details += f', не найдено в БД: {len(skipped)} ({", ".join(skipped[:5])})'
+        summary = coverage_summary(prices_by_boat.keys())
+        if format_summary(summary):
+            details += f'; {format_summary(summary)}'
         log_sync('wordpress', 'success', details)
+        refresh_snapshot()
+        events.publish('sync', {'stage': 'done', 'message': details})
         return jsonify({
             'message': f'Синхронизация завершена. Обновлено: {updated} теплоходов',
             'updated': updated,
-            'skipped': skipped
+            'skipped': skipped,
+            'coverage': summary,
+            'pricing_version': version_id
         })
 
     except Exception as e:
         log_sync('wordpress', 'error', str(e))
+        events.publish('sync', {'stage': 'error', 'message': str(e)})
         logger.error("Ошибка синхронизации с WP: %s", e)
         return jsonify({'error': f'Ошибка синхронизации: {e}'}), 500
 
@@ -322,23 +582,237 @@ def migrate_excel():
         return jsonify({'error': 'Файл rental_data.xlsx не найден'}), 404
 
     try:
-        migrate_from_excel(excel_path)
+        report = migrate_from_excel(excel_path)
+        refresh_snapshot()
         return jsonify({
             'message': 'Миграция из Excel завершена',
             'boats_count': get_boat_count(),
-            'prices_count': get_price_count()
+            'prices_count': get_price_count(),
+            'report': report,
+            'coverage': coverage_summary()
         })
     except Exception as e:
         logger.error("Ошибка миграции: %s", e)
         return jsonify({'error': f'Ошибка миграции: {e}'}), 500
 
 
+@app.route('/api/admin/coverage', methods=['GET'])
+@editor_required
+@catalog_etag
+def tariff_coverage():
+    """Дыры, пересечения и дубли в тарифной сетке (пересчитываются при записи цен)."""
+    boat_id = request.args.get('boat_id', type=int)
+    return jsonify({
+        'coverage': get_coverage(boat_id),
+        'summary': coverage_summary([boat_id] if boat_id else None)
+    })
+
+
+# === Admin: Pricing versions ===
+
+@app.route('/api/admin/pricing-versions', methods=['GET'])
+@editor_required
+def admin_list_pricing_versions():
+    """Версии цен (синхронизации, загрузки, импорт), новые первыми; ?drafts=1 — с черновиками симулятора."""
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    drafts = request.args.get('drafts', '0') in ('1', 'true')
+    return jsonify({'versions': get_pricing_versions(limit, drafts)})
+
+
+@app.route('/api/admin/pricing-versions/<int:version_id>/activate', methods=['POST'])
+@editor_required
+def admin_activate_pricing_version(version_id):
+    """Откат на сохранённую версию цен — переключение указателя, без переимпорта."""
+    if not activate_pricing_version(version_id):
+        return jsonify({'error': 'Версия цен не найдена'}), 404
+    logger.info("Версия цен %d сделана активной (%s)", version_id, g.user['username'])
+    refresh_snapshot()
+    return jsonify({'message': f'Активна версия цен {version_id}', 'pricing_version': version_id})
+
+
+# === Admin: Tariff simulator ===
+
+def _scaled_prices(percent, boat_ids=None):
+    """Текущие цены теплоходов boat_ids (None — всех), изменённые на percent процентов."""
+    factor = 1 + percent / 100
+    if boat_ids is None:
+        boat_ids = [b['id'] for b in get_all_boats()]
+    prices_by_boat = {}
+    for boat_id in boat_ids:
+        prices = get_prices_for_boat(boat_id)
+        if prices:
+            prices_by_boat[boat_id] = [dict(p, price_per_hour=round(p['price_per_hour'] * factor)) for p in prices]
+    return prices_by_boat
+
+
+@app.route('/api/admin/simulations', methods=['POST'])
+@admin_required
+def admin_start_simulation():
+    """
+    Пересчитать историю расчётов по предлагаемой сетке цен (фоновое задание).
+    Сетка: файл (поле file, как /prices/import), JSON prices — новые строки цен
+    теплоходов, JSON percent (+ boat_ids) — текущие цены на процент,
+    JSON pricing_version — сохранённая версия. date_from / date_to (query) — период истории.
+    """
+    from importer import price_records
+
+    try:
+        date_from = _parse_date_param('date_from')
+        date_to = _parse_date_param('date_to')
+    except ValueError:
+        return jsonify({'error': 'Даты в формате YYYY-MM-DD'}), 400
+    if simulation_running():
+        return jsonify({'error': 'Уже идёт симуляция — дождитесь её окончания'}), 409
+
+    version_id = None
+    warnings = []
+    if request.files:
+        rows, error = _read_price_file()
+        if error:
+            return error
+        comment = request.files['file'].filename
+    else:
+        data = request.get_json(silent=True) or {}
+        rows = None
+        if data.get('pricing_version') is not None:
+            version_id = data['pricing_version']
+            if not isinstance(version_id, int) or not get_pricing_version(version_id):
+                return jsonify({'error': 'Версия цен не найдена'}), 404
+        elif isinstance(data.get('prices'), list) and data['prices']:
+            rows = price_records(data['prices'])
+            comment = f"Правка цен: строк {len(rows)}"
+        elif isinstance(data.get('percent'), (int, float)) and not isinstance(data['percent'], bool):
+            boat_ids = data.get('boat_ids')
+            if boat_ids is not None and not (isinstance(boat_ids, list) and all(isinstance(b, int) for b in boat_ids)):
+                return jsonify({'error': 'boat_ids — список id теплоходов'}), 400
+            prices_by_boat = _scaled_prices(data['percent'], boat_ids)
+            if not prices_by_boat:
+                return jsonify({'error': 'У выбранных теплоходов нет цен'}), 400
+            comment = f"Цены {data['percent']:+g}%" + (f", теплоходов {len(prices_by_boat)}" if boat_ids is not None else '')
+        else:
+            return jsonify({'error': 'Укажите файл, prices, percent или pricing_version'}), 400
+
+    if rows is not None:
+        validated, error = _validate_prices(rows)
+        if error:
+            return error
+        prices_by_boat, warnings, _ = validated
+    if version_id is None:
+        version_id = replace_prices_bulk(prices_by_boat, 'simulation', comment, activate=False)
+
+    try:
+        job_id = start_simulation(version_id, g.user['id'], date_from, date_to)
+    except SimulationBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'id': job_id, 'pricing_version': version_id, 'warnings': warnings[:500]}), 202
+
+
+@app.route('/api/admin/simulations', methods=['GET'])
+@admin_required
+def admin_list_simulations():
+    return jsonify({'simulations': get_simulations()})
+
+
+@app.route('/api/admin/simulations/<int:job_id>', methods=['GET'])
+@admin_required
+def admin_get_simulation(job_id):
+    """Ход задания (done / total) и, когда готово, итоги по теплоходам и месяцам."""
+    job = get_simulation(job_id)
+    if not job:
+        return jsonify({'error': 'Симуляция не найдена'}), 404
+    return jsonify({'simulation': job})
+
+
+# === Admin: Database maintenance ===
+
+@app.before_request
+def _start_maintenance_scheduler():
+    # Поток расписания — свой в каждом воркере; после первого запроса — одна проверка pid
+    maintenance.ensure_scheduler()
+
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+@admin_required
+def admin_maintenance_status():
+    """Размер БД, свободные страницы, WAL, бекапы и последние запуски обслуживания."""
+    runs = maintenance.get_maintenance_runs()
+    return jsonify({
+        'database': maintenance.database_info(),
+        'backups': maintenance.get_backups(),
+        'last_run': runs[0] if runs else None,
+        'runs': runs,
+        'interval_hours': maintenance.INTERVAL_HOURS,
+    })
+
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+@admin_required
+def admin_run_maintenance():
+    """Бекап и обслуживание БД сейчас, не дожидаясь расписания (в фоне)."""
+    try:
+        job_id = maintenance.start_maintenance()
+    except maintenance.MaintenanceBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'id': job_id}), 202
+
+
+# === Admin: Holidays ===
+
+HOLIDAY_WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+
+def _holiday_payload(h):
+    date = f"{h['day']:02d}.{h['month']:02d}" + (f".{h['year']}" if h['year'] else '')
+    return dict(h, date=date, priced_as_name=HOLIDAY_WEEKDAYS[h['priced_as']])
+
+
+@app.route('/api/admin/holidays', methods=['GET'])
+@editor_required
+def admin_list_holidays():
+    """Праздники: дата считается по тарифу выбранного дня недели."""
+    return jsonify({'holidays': [_holiday_payload(h) for h in get_holidays()]})
+
+
+@app.route('/api/admin/holidays', methods=['POST'])
+@editor_required
+def admin_create_holiday():
+    data = request.get_json() or {}
+    parts = str(data.get('date', '')).strip().split('.')
+    try:
+        day, month = int(parts[0]), int(parts[1])
+        year = int(parts[2]) if len(parts) == 3 else None
+        if len(parts) not in (2, 3):
+            raise ValueError
+        # Без года — проверяем по високосному году, чтобы 29.02 был допустим
+        datetime.date(2000 if year is None else year, month, day)
+    except (ValueError, IndexError):
+        return jsonify({'error': 'Дата праздника: dd.mm (каждый год) или dd.mm.yyyy'}), 400
+    priced_as = data.get('priced_as')
+    if not isinstance(priced_as, int) or not 0 <= priced_as <= 6:
+        return jsonify({'error': 'priced_as — день недели тарифа: 0 (Пн) … 6 (Вс)'}), 400
+    holiday_id = create_holiday(month, day, priced_as, year, str(data.get('name', '')).strip())
+    return jsonify({'id': holiday_id}), 201
+
+
+@app.route('/api/admin/holidays/<int:holiday_id>', methods=['DELETE'])
+@editor_required
+def admin_delete_holiday(holiday_id):
+    delete_holiday(holiday_id)
+    return jsonify({'message': 'Праздник удалён'})
+
+
 # === Admin: Users ===
 
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def admin_list_users():
-    return jsonify({'users': get_all_users()})
+    return jsonify({'users': _users_payload(get_all_users())})
+
+
+def _users_payload(users):
+    for u in users:
+        u['avatar_urls'] = avatar_urls(u.get('avatar'))
+    return users
 
 
 @app.route('/api/admin/users', methods=['POST'])
@@ -387,39 +861,115 @@ def admin_delete_user(user_id):
     return jsonify({'message': 'Пользователь удалён'})
 
 
+# === Admin: Export ===
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _parse_date_param(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _export_response(kind, **filters):
+    from exporter import export_stream
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'Формат должен быть csv или xlsx'}), 400
+    filename = f"{kind}_{datetime.date.today():%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(export_stream(kind, fmt, **filters)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            # Nginx не буферизует ответ — первые байты уходят клиенту сразу
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+@app.route('/api/admin/export/calculations', methods=['GET'])
+@admin_required
+def export_calculations():
+    try:
+        date_from = _parse_date_param('date_from')
+        date_to = _parse_date_param('date_to')
+    except ValueError:
+        return jsonify({'error': 'Даты в формате YYYY-MM-DD'}), 400
+    user_id = request.args.get('user_id', type=int)
+    return _export_response('calculations', user_id=user_id, date_from=date_from, date_to=date_to)
+
+
+@app.route('/api/admin/stats', methods=['GET'])
+@admin_required
+def admin_stats():
+    try:
+        date_from = _parse_date_param('date_from')
+        date_to = _parse_date_param('date_to')
+    except ValueError:
+        return jsonify({'error': 'Даты в формате YYYY-MM-DD'}), 400
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    return jsonify(get_usage_stats(date_from, date_to, top))
+
+
+@app.route('/api/admin/export/prices', methods=['GET'])
+@admin_required
+def export_prices():
+    return _export_response('prices')
+
+
 # === Avatars ===
 
 @app.route('/api/avatars/<filename>', methods=['GET'])
 def serve_avatar(filename):
-    return send_from_directory(AVATARS_DIR, filename)
+    # Имена файлов не переиспользуются (хеш содержимого) — кешировать можно навсегда
+    response = send_from_directory(AVATARS_DIR, filename, max_age=CACHE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+    return response
+
+
+def _avatars_in_use(exclude_user_id):
+    return {u['avatar'] for u in get_all_users() if u.get('avatar') and u['id'] != exclude_user_id}
 
 
 @app.route('/api/admin/users/<int:user_id>/avatar', methods=['POST'])
 @admin_required
 def upload_avatar(user_id):
-    if 'avatar' not in request.files:
-        return jsonify({'error': 'Файл не найден'}), 400
+    user = get_user_by_id(user_id)
+    if not user:
+        return jsonify({'error': 'Пользователь не найден'}), 404
 
-    file = request.files['avatar']
+    # Лимит проверяется при чтении тела: лишнее не дочитывается и не попадает на диск
+    # (запас — на заголовки multipart)
+    request.max_content_length = AVATAR_MAX_BYTES + 64 * 1024
+    try:
+        file = request.files.get('avatar')
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Файл больше 5 МБ'}), 413
+    if file is None:
+        return jsonify({'error': 'Файл не найден'}), 400
     if not file.filename:
         return jsonify({'error': 'Пустой файл'}), 400
 
-    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in ('png', 'jpg', 'jpeg', 'webp'):
-        return jsonify({'error': 'Допустимые форматы: png, jpg, jpeg, webp'}), 400
-
-    filename = f"{user_id}_{uuid.uuid4().hex[:8]}.{ext}"
-    filepath = os.path.join(AVATARS_DIR, filename)
+    data = file.read(AVATAR_MAX_BYTES + 1)
+    if len(data) > AVATAR_MAX_BYTES:
+        return jsonify({'error': 'Файл больше 5 МБ'}), 413
 
-    user = get_user_by_id(user_id)
-    if user and user.get('avatar'):
-        old_path = os.path.join(AVATARS_DIR, user['avatar'])
-        if os.path.exists(old_path):
-            os.remove(old_path)
+    try:
+        key = save_avatar(data, AVATARS_DIR)
+    except AvatarError as e:
+        return jsonify({'error': str(e)}), 400
 
-    file.save(filepath)
-    update_avatar(user_id, filename)
-    return jsonify({'avatar': filename, 'message': 'Аватар обновлён'})
+    update_avatar(user_id, key)
+    if user.get('avatar') != key:
+        remove_avatar(user.get('avatar'), AVATARS_DIR, _avatars_in_use(user_id))
+    return jsonify({'avatar': key, 'avatar_urls': avatar_urls(key), 'message': 'Аватар обновлён'})
 
 
 @app.route('/api/admin/users/<int:user_id>/avatar', methods=['DELETE'])
@@ -427,9 +977,7 @@ def upload_avatar(user_id):
 def delete_avatar(user_id):
     user = get_user_by_id(user_id)
     if user and user.get('avatar'):
-        old_path = os.path.join(AVATARS_DIR, user['avatar'])
-        if os.path.exists(old_path):
-            os.remove(old_path)
+        remove_avatar(user['avatar'], AVATARS_DIR, _avatars_in_use(user_id))
     update_avatar(user_id, None)
     return jsonify({'message': 'Аватар удалён'})
 
@@ -460,6 +1008,24 @@ if get_boat_count() == 0:
         logger.info("БД пуста — запускаю миграцию из Excel...")
         migrate_from_excel(excel_path)
 
+# БД без покрытия (создана до tariff_coverage или покрытие сброшено миграцией) — посчитать один раз
+if get_price_count() and not get_coverage():
+    analyze_coverage()
+
+# История, записанная до появления сводных таблиц, — досчитать статистику
+update_usage_stats()
+
+# Симуляции и обслуживание БД, оборванные остановкой сервера, не останутся «идущими» навсегда
+fail_interrupted()
+maintenance.fail_interrupted()
+
+# Аватарки, загруженные до появления вариантов по размерам, — сконвертировать
+migrate_legacy_avatars(AVATARS_DIR)
+
+# Снимок тарифов готовим до форка воркеров (gunicorn --preload):
+# воркеры наследуют отображение и делят его страницы
+refresh_snapshot()
+
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
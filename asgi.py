@@ -0,0 +1,246 @@
+"""
+ASGI-режим: API и Telegram-бот в одном процессе, на одном цикле событий.
+
+    uvicorn asgi:app --host 127.0.0.1 --port 5001
+
+Маршруты /api/* — прежнее Flask-приложение (app.py), вызываемое через мост
+WSGI → ASGI: запрос целиком читается в цикле, обработчик Flask выполняется в
+общем пуле потоков (EXECUTOR_THREADS). Ответ с Content-Length собирается там
+же одним переходом; потоковый (/api/events, выгрузки) один поток пула читает
+до конца и передаёт по частям в цикл, клиент ушёл — генератор закрывается.
+
+Бот (telegram_bot.build_application) запускается на старте (lifespan) на
+этом же цикле. С TELEGRAM_WEBHOOK_URL и TELEGRAM_WEBHOOK_SECRET обновления
+приходят webhook-запросами на /tg/<секрет> (tg_webhook.py) и принимаются прямо
+в цикле, без пула и Flask; иначе — polling. Пул — пул по умолчанию цикла,
+поэтому расчёты бота (run_in_executor(None, ...)) идут туда же, что и запросы
+API. Снимок тарифов, кеши чтения, индекс теплоходов и очередь истории — одни на процесс.
+
+Режим для маленького сервера: один процесс вместо gunicorn + отдельного бота.
+Нет токена или ASGI_TELEGRAM_BOT=0 — только API.
+"""
+import asyncio
+import concurrent.futures
+import io
+import logging
+import os
+import sys
+import threading
+
+import config
+import telegram_bot
+import tg_webhook
+from app import app as flask_app
+
+logger = logging.getLogger(__name__)
+
+# Потоков в общем пуле (как --threads у gunicorn: открытый /api/events держит поток)
+EXECUTOR_THREADS = int(os.environ.get('ASGI_THREADS', '32'))
+
+# Запускать ли бота в этом процессе
+RUN_BOT = os.environ.get('ASGI_TELEGRAM_BOT', '1') == '1'
+
+# Частей потокового ответа, прочитанных впрок
+STREAM_QUEUE_SIZE = 16
+
+_END = object()
+
+
+def _environ(scope, body):
+    """ASGI scope HTTP-запроса → WSGI environ (PEP 3333)."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        if key in environ and key.startswith('HTTP_'):
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+    if not body:
+        environ.pop('CONTENT_LENGTH')
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+class NaviBotASGI:
+    """ASGI-приложение: HTTP — в Flask через пул, lifespan — пул и бот."""
+
+    def __init__(self, wsgi_app, threads=EXECUTOR_THREADS, run_bot=RUN_BOT):
+        self.wsgi_app = wsgi_app
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='navibot')
+        self.run_bot = run_bot
+        self.bot = None
+        self.webhook = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    # === HTTP ===
+
+    def _call_wsgi(self, environ):
+        """Вызов Flask в потоке пула → (status, headers, тело целиком | итератор)."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        if any(name == b'content-length' for name, _ in started['headers']):
+            # Обычный ответ — собрать здесь же, без лишних переходов между потоками
+            try:
+                return started['status'], started['headers'], b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return started['status'], started['headers'], result
+
+    async def _webhook(self, scope, body, send):
+        if self.bot is None or not self.webhook:
+            status = 404
+        elif scope['method'] != 'POST':
+            status = 405
+        else:
+            secret = dict(scope['headers']).get(tg_webhook.SECRET_HEADER.encode(), b'').decode('latin-1')
+            status = await tg_webhook.accept_update(self.bot, scope['path'], secret, body)
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-length', b'0')]})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _http(self, scope, receive, send):
+        body = await _read_body(receive)
+        if body is None:
+            return
+        if scope['path'].startswith(tg_webhook.PATH_PREFIX):
+            await self._webhook(scope, body, send)
+            return
+        loop = asyncio.get_running_loop()
+        status, headers, result = await loop.run_in_executor(self.executor, self._call_wsgi, _environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if isinstance(result, bytes):
+            await send({'type': 'http.response.body', 'body': result})
+            return
+
+        # Потоковый ответ читается одним потоком пула от начала до конца: генератор
+        # с stream_with_context держит контекст Flask в своём потоке
+        chunks = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+        pump = loop.run_in_executor(self.executor, self._pump, result, loop, chunks, stop)
+        # receive после тела запроса вернёт только http.disconnect
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                get = asyncio.ensure_future(chunks.get())
+                await asyncio.wait((get, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    break
+                chunk = get.result()
+                if chunk is _END:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            stop.set()
+            # Освободить место в очереди, если поток ждёт в put
+            while not pump.done():
+                try:
+                    chunks.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.05)
+            await pump
+
+    @staticmethod
+    def _pump(result, loop, chunks, stop):
+        try:
+            for chunk in result:
+                if stop.is_set():
+                    break
+                if chunk:
+                    asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(chunks.put(_END), loop).result()
+
+    # === Lifespan ===
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                asyncio.get_running_loop().set_default_executor(self.executor)
+                try:
+                    await self._start_bot()
+                except Exception as e:
+                    logger.error("Бот не запущен: %s", e)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self._stop_bot()
+                finally:
+                    self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _start_bot(self):
+        if not self.run_bot or not config.TOKEN:
+            logger.info("Telegram-бот в этом процессе не запускается (нет токена или ASGI_TELEGRAM_BOT=0)")
+            return
+        self.bot = telegram_bot.build_application()
+        await self.bot.initialize()
+        await self.bot.start()
+        self.webhook = tg_webhook.configured() and await tg_webhook.set_webhook(self.bot)
+        if not self.webhook:
+            await self.bot.updater.start_polling()
+        logger.info("Telegram-бот запущен на общем цикле событий (%s)", 'webhook' if self.webhook else 'polling')
+
+    async def _stop_bot(self):
+        if self.bot is None:
+            return
+        if not self.webhook:
+            await self.bot.updater.stop()
+        # stop() дожидается обработки уже принятых обновлений
+        await self.bot.stop()
+        await self.bot.shutdown()
+        self.bot = None
+
+
+app = NaviBotASGI(flask_app)
@@ -0,0 +1,164 @@
+"""
+Аватарки пользователей: нормализация при загрузке и раздача по размерам.
+
+Загруженная картинка не хранится как есть: из неё делаются квадратные
+варианты SIZES в WebP и JPEG. Имя файла — хеш содержимого:
+    <ключ>-<px>.webp / <ключ>-<px>.jpg
+В users.avatar лежит только ключ. Одинаковые картинки дают одни и те же файлы,
+а новая картинка — новое имя, поэтому файлы кешируются как immutable навсегда.
+
+Размер загрузки ограничивается при чтении тела запроса (AVATAR_MAX_BYTES),
+картинки больше AVATAR_MAX_PIXELS не декодируются.
+"""
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from database import get_all_users, update_avatar
+
+logger = logging.getLogger(__name__)
+
+# Имя варианта → сторона квадрата, px. sm — списки и шапка (до 36px на экранах 2x), lg — крупный показ
+SIZES = {'sm': 72, 'lg': 256}
+
+# Форматы вариантов: расширение → (формат Pillow, параметры сохранения)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 82, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+AVATAR_MAX_BYTES = 5 * 1024 * 1024
+AVATAR_MAX_PIXELS = 40_000_000
+
+ALLOWED_FORMATS = ('PNG', 'JPEG', 'WEBP')
+
+# Меняется вместе с SIZES / FORMATS — новые параметры дают новые имена файлов
+PIPELINE_VERSION = b'1'
+
+# Год — файлы с хешем в имени не меняются
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+
+class AvatarError(ValueError):
+    """Картинку нельзя принять как аватарку."""
+
+
+def _variant_name(key, px, ext):
+    return f"{key}-{px}.{ext}"
+
+
+def is_legacy(avatar):
+    """Аватарка из старой схемы — один файл как загрузили (с расширением в имени)."""
+    return '.' in avatar
+
+
+def avatar_urls(avatar, base='/api/avatars'):
+    """Ключ из users.avatar → {'sm': {'webp': url, 'jpg': url}, 'lg': {...}} или None."""
+    if not avatar:
+        return None
+    if is_legacy(avatar):
+        url = f"{base}/{avatar}"
+        return {name: {ext: url for ext in FORMATS} for name in SIZES}
+    return {
+        name: {ext: f"{base}/{_variant_name(avatar, px, ext)}" for ext in FORMATS}
+        for name, px in SIZES.items()
+    }
+
+
+def _load(data):
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        # Pillow отказывается открыть картинку уже по размеру из заголовка
+        raise AvatarError('Слишком большое изображение')
+    except UnidentifiedImageError:
+        raise AvatarError('Не удалось прочитать картинку')
+    if image.format not in ALLOWED_FORMATS:
+        raise AvatarError('Допустимые форматы: png, jpg, jpeg, webp')
+    if image.width * image.height > AVATAR_MAX_PIXELS:
+        raise AvatarError('Слишком большое изображение')
+    try:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, Image.DecompressionBombError):
+        raise AvatarError('Не удалось прочитать картинку')
+    return image
+
+
+def _flatten(image):
+    """RGB на белом фоне — для JPEG, который не умеет прозрачность."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def save_avatar(data, avatars_dir):
+    """
+    Байты загруженной картинки → ключ аватарки. Варианты пишутся во временные
+    файлы и переименовываются — читатель не увидит недописанный файл.
+    """
+    image = _load(data)
+    key = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()[:24]
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    square = ImageOps.fit(image.convert('RGBA' if has_alpha else 'RGB'), (max(SIZES.values()),) * 2,
+                          method=Image.LANCZOS)
+    for px in sorted(SIZES.values(), reverse=True):
+        variant = square if px == square.width else square.resize((px, px), Image.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            path = os.path.join(avatars_dir, _variant_name(key, px, ext))
+            if os.path.exists(path):
+                continue
+            out = variant if fmt == 'WEBP' else _flatten(variant)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            out.save(tmp, fmt, **options)
+            os.replace(tmp, path)
+    return key
+
+
+def avatar_files(avatar):
+    """Файлы аватарки (для удаления)."""
+    if is_legacy(avatar):
+        return [avatar]
+    return [_variant_name(avatar, px, ext) for px in SIZES.values() for ext in FORMATS]
+
+
+def remove_avatar(avatar, avatars_dir, in_use=()):
+    """Удалить файлы аватарки, если ключ больше никому не принадлежит."""
+    if not avatar or avatar in in_use:
+        return
+    for name in avatar_files(avatar):
+        path = os.path.join(avatars_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def convert_legacy(avatar, avatars_dir):
+    """Старый файл аватарки → ключ новой схемы (None, если файла нет или он не читается)."""
+    path = os.path.join(avatars_dir, avatar)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        return save_avatar(data, avatars_dir)
+    except (OSError, AvatarError) as e:
+        logger.warning("Аватарка %s не сконвертирована: %s", avatar, e)
+        return None
+
+
+def migrate_legacy_avatars(avatars_dir):
+    """Перевести аватарки старой схемы (файл как загрузили) на варианты по размерам."""
+    for user in get_all_users():
+        avatar = user.get('avatar')
+        if not avatar or not is_legacy(avatar):
+            continue
+        key = convert_legacy(avatar, avatars_dir)
+        if key:
+            update_avatar(user['id'], key)
+            remove_avatar(avatar, avatars_dir)
+            logger.info("Аватарка пользователя %s переведена на варианты по размерам", user['username'])
@@ -0,0 +1,99 @@
+"""
+Ответ /api/history (200 записей): разбор results_json, сборка JSON и сжатие —
+прежний путь (json.loads, jsonify с ensure_ascii и sort_keys) против json_codec.
+
+    python3 benchmarks/json_bench.py [записей] [повторов]
+
+История синтетическая: компактные QuoteResult (формат 2) по нескольким
+теплоходам, у части записей ошибка. Перед замером проверяется, что оба пути
+дают один и тот же объект.
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+from rental_calculator import expand_saved_results  # noqa: E402
+
+BOATS = [
+    ('Адмирал', 'https://teplohod-restoran.ru/product/admiral/', 'Фонтанка 34', 50000),
+    ('Шустрый бобер', 'https://teplohod-restoran.ru/product/shustryj-bober/', 'Английская набережная 22', 18000),
+    ('Нева Мажестик', 'https://teplohod-restoran.ru/product/neva-majestic/', 'Адмиралтейская набережная 2', 95000),
+]
+
+
+def build_row(i):
+    results = []
+    for j in range(3):
+        name, link, dock, price = BOATS[(i + j) % len(BOATS)]
+        if (i + j) % 7 == 0:
+            results.append({'error': f"Ошибка: Теплоход '{name}-{j}' не найден.", 'input': f"16.08.26\n{name}-{j}\n18-22"})
+            continue
+        start = 18 * 60
+        end = start + 4 * 60
+        segments = [['prep', start - 60, start, 0.5, price / 2], ['main', start, end, 1, price * 4], ['unload', end, end + 30, 0.5, price / 4]]
+        total = price * 4.75 + 5000
+        results.append({'quote': [2, 740000 + i, name, link, dock, 1, [start - 60, start, end, end + 30],
+                                  segments, [[price, 4.75]], 5000, total, 12]})
+    return {
+        'id': i,
+        'input_text': "\n\n".join(f"16.08.26\n{BOATS[(i + j) % len(BOATS)][0]}\n17-18-22-22:30" for j in range(3)),
+        'results_json': json.dumps(results, ensure_ascii=False, separators=(',', ':')),
+        'created_at': '2026-08-01 12:00:00',
+    }
+
+
+def payload(rows, loads):
+    return {'history': [
+        {'id': r['id'], 'input_text': r['input_text'], 'results': expand_saved_results(loads(r['results_json']), markdown=False),
+         'created_at': r['created_at']}
+        for r in rows
+    ]}
+
+
+def legacy_dumps(obj):
+    # Как DefaultJSONProvider Flask: ensure_ascii и sort_keys, компактно
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode()
+
+
+def fast_dumps(obj):
+    if json_codec.orjson is not None:
+        return json_codec.orjson.dumps(obj, option=json_codec._OPTIONS)
+    return json_codec.dumps(obj).encode()
+
+
+def best(fn, repeat):
+    return min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = [build_row(i) for i in range(count)]
+    texts = [r['results_json'] for r in rows]
+
+    body = payload(rows, json.loads)
+    if payload(rows, json_codec.loads) != body or json.loads(fast_dumps(body)) != json.loads(legacy_dumps(body)):
+        sys.exit("Результаты json_codec не совпадают со стандартным json")
+
+    old_bytes, new_bytes = legacy_dumps(body), fast_dumps(body)
+    print(f"История: {count} записей, {repeat} повторов, orjson: {'да' if json_codec.orjson else 'нет'}")
+    print(f"  разбор results_json:  json {best(lambda: [json.loads(t) for t in texts], repeat):6.2f} мс"
+          f"   json_codec {best(lambda: [json_codec.loads(t) for t in texts], repeat):6.2f} мс")
+    print(f"  сборка ответа:        json {best(lambda: payload(rows, json.loads), repeat):6.2f} мс"
+          f"   json_codec {best(lambda: payload(rows, json_codec.loads), repeat):6.2f} мс")
+    print(f"  сериализация:         json {best(lambda: legacy_dumps(body), repeat):6.2f} мс"
+          f"   json_codec {best(lambda: fast_dumps(body), repeat):6.2f} мс")
+    print(f"  байт:                 json {len(old_bytes):>8}   json_codec {len(new_bytes):>8}")
+    level = json_codec.COMPRESS_LEVEL
+    packed = gzip.compress(new_bytes, compresslevel=level, mtime=0)
+    print(f"  gzip {level}:               {best(lambda: gzip.compress(new_bytes, compresslevel=level, mtime=0), repeat):6.2f} мс"
+          f"   {len(packed)} байт ({len(packed) / len(old_bytes):.1%} от прежнего ответа)")
+
+
+if __name__ == '__main__':
+    main()
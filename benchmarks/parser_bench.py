@@ -0,0 +1,93 @@
+"""
+Сравнение разбора запросов: прежний (split + strptime по блокам из 3 строк)
+и request_parser.parse_message (один проход по сообщению).
+
+    python3 benchmarks/parser_bench.py [число блоков в сообщении] [повторов]
+
+Прежний разбор скопирован сюда как эталон; входы в старом формате должны
+давать одинаковый результат — это проверяется перед замером.
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_parser import parse_message  # noqa: E402
+
+
+def legacy_parse_request(message_text):
+    lines = [line.strip() for line in message_text.splitlines() if line.strip()]
+    if len(lines) < 3:
+        raise ValueError("Некорректный формат запроса. Должны быть не менее 3 строк.")
+    date_str = lines[0]
+    boat_name = lines[1]
+    times_str = lines[2]
+    time_parts = times_str.split("-")
+    normalized_times = []
+    for part in time_parts:
+        if ":" in part:
+            normalized_times.append(part)
+        else:
+            normalized_times.append(part + ":00")
+    if len(normalized_times) not in [2, 4]:
+        raise ValueError("Ожидается 2 или 4 временных значения.")
+    try:
+        date_obj = datetime.datetime.strptime(date_str, "%d.%m.%y").date()
+    except Exception as e:
+        raise ValueError("Неверный формат даты, ожидается dd.mm.yy.") from e
+    times = []
+    for t_str in normalized_times:
+        try:
+            times.append(datetime.datetime.strptime(t_str, "%H:%M").time())
+        except Exception as e:
+            raise ValueError(f"Неверный формат времени: {t_str}") from e
+    return date_obj, boat_name, times
+
+
+def legacy_parse_message(text):
+    """Как прежний /api/calculate: строки группами по 3, каждая группа — parse_request."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    results = []
+    for i in range(0, len(lines), 3):
+        try:
+            results.append(legacy_parse_request("\n".join(lines[i:i + 3])))
+        except ValueError as e:
+            results.append(str(e))
+    return results
+
+
+SAMPLES = [
+    "16.08.26\nШустрый бобер\n16-17-23-23:30",
+    "17.08.26\nАдмирал\n18-22",
+    "01.09.26\nХемингуэй\n18:30-23:30",
+    "31.12.26\nНева Мажестик\n22-02",
+]
+
+
+def build_message(blocks):
+    return "\n\n".join(SAMPLES[i % len(SAMPLES)] for i in range(blocks))
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    text = build_message(blocks)
+
+    expected = legacy_parse_message(text)
+    got = [(b.date, b.boat_name, b.times) for b in parse_message(text)]
+    if got != expected:
+        sys.exit("Результаты разбора не совпадают с прежним разбором")
+
+    legacy = min(timeit.repeat(lambda: legacy_parse_message(text), number=repeat, repeat=5))
+    current = min(timeit.repeat(lambda: parse_message(text), number=repeat, repeat=5))
+    per_block = 1e6 / (repeat * blocks)
+    print(f"Сообщение: {blocks} блоков, {repeat} повторов")
+    print(f"  strptime:       {legacy * per_block:7.2f} мкс/блок")
+    print(f"  parse_message:  {current * per_block:7.2f} мкс/блок")
+    print(f"  ускорение:      {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Задержка ответа бота: webhook (tg_webhook.py) против polling.
+
+    python3 benchmarks/webhook_bench.py [обновлений]
+
+Вместо Telegram — локальная заглушка Bot API (getMe, setWebhook, getUpdates,
+sendMessage …). Она отдаёт записанные обновления /start двумя способами:
+POST-запросом на webhook (как Telegram — по keep-alive соединению, с заголовком
+секрета) и ответом на висящий getUpdates. Задержка — от выдачи обновления до
+прихода sendMessage с ответом бота. Замеры: по одному обновлению подряд и пачкой
+(все сразу — проверка одновременной обработки). Заглушка работает на том же
+цикле, что и бот, поэтому пачка упирается в одно ядро на обоих. Сеть до Telegram
+в замер не входит: на сервере к обоим режимам добавляется RTT до api.telegram.org.
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+import telegram_bot  # noqa: E402
+import tg_webhook  # noqa: E402
+
+TOKEN = '123456:BENCH'
+SECRET = 'bench-secret'
+HOST = '127.0.0.1'
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: обновления для getUpdates и время ответов sendMessage."""
+
+    def __init__(self):
+        self.pending = []
+        self.arrived = asyncio.Event()
+        self.waiters = {}
+
+    def expect(self, chat_id):
+        self.waiters[chat_id] = asyncio.get_running_loop().create_future()
+        return self.waiters[chat_id]
+
+    def push(self, update):
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset', 0))
+        self.pending = [u for u in self.pending if u['update_id'] >= offset]
+        if not self.pending:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), float(params.get('timeout', 0)))
+            except asyncio.TimeoutError:
+                pass
+        return [u for u in self.pending if u['update_id'] >= offset]
+
+    async def call(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'NaviBot', 'username': 'navibot_bench_bot'}
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            waiter = self.waiters.pop(chat_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+            return {'message_id': 1, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+                    'text': params.get('text', '')}
+        return True
+
+    async def connection(self, reader, writer):
+        try:
+            while True:
+                request = await tg_webhook._read_request(reader)
+                if request is None:
+                    break
+                _, path, _, body = request
+                params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                result = await self.call(path.rsplit('/', 1)[-1], params)
+                data = json_codec.dumps({'ok': True, 'result': result}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(data), data))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # CancelledError — висящий getUpdates при завершении замера
+            pass
+        finally:
+            writer.close()
+
+
+def make_update(n):
+    chat_id = 1000 + n
+    return {'update_id': n, 'message': {
+        'message_id': n, 'date': int(time.time()), 'text': '/start',
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    }}
+
+
+class WebhookSender:
+    """Как Telegram: POST на webhook по keep-alive соединениям."""
+
+    def __init__(self, port, connections):
+        self.port = port
+        self.free = asyncio.Queue()
+        self.connections = connections
+
+    async def open(self):
+        for _ in range(self.connections):
+            self.free.put_nowait(await asyncio.open_connection(HOST, self.port))
+
+    async def send(self, update):
+        reader, writer = await self.free.get()
+        body = json_codec.dumps(update).encode()
+        writer.write(
+            f"POST {tg_webhook.webhook_path()} HTTP/1.1\r\nHost: {HOST}\r\nContent-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        status = (await reader.readuntil(b'\r\n\r\n')).split(b' ', 2)[1]
+        self.free.put_nowait((reader, writer))
+        if status != b'200':
+            raise RuntimeError(f"Webhook ответил {status.decode()}")
+
+    async def close(self):
+        while not self.free.empty():
+            _, writer = self.free.get_nowait()
+            writer.close()
+
+
+async def measure(api, deliver, first_id, count, burst):
+    """Задержки (мс) count обновлений: по одному или все сразу."""
+    updates = [make_update(first_id + i) for i in range(count)]
+
+    async def one(update):
+        waiter = api.expect(update['message']['chat']['id'])
+        started = time.perf_counter()
+        await deliver(update)
+        return (await asyncio.wait_for(waiter, 10) - started) * 1000
+
+    if burst:
+        return await asyncio.gather(*(one(u) for u in updates))
+    return [await one(u) for u in updates]
+
+
+def report(title, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"  {title:<26} медиана {statistics.median(ordered):6.2f} мс   p95 {p95:6.2f} мс   макс {ordered[-1]:6.2f} мс")
+
+
+async def run_webhook(api, api_port, count):
+    application = telegram_bot.build_application(TOKEN, base_url=f"http://{HOST}:{api_port}/bot")
+    await application.initialize()
+    if not await tg_webhook.set_webhook(application):
+        sys.exit("Заглушка не приняла setWebhook")
+    server = await tg_webhook.start_server(application, HOST, 0)
+    await application.start()
+    sender = WebhookSender(server.sockets[0].getsockname()[1], tg_webhook.MAX_CONNECTIONS)
+    await sender.open()
+    try:
+        report('webhook, по одному', await measure(api, sender.send, 1, count, burst=False))
+        report('webhook, пачкой', await measure(api, sender.send, 1 + count, count, burst=True))
+    finally:
+        await sender.close()
+        await tg_webhook.stop_server(server)
+        await application.stop()
+        await application.shutdown()
+
+
+async def run_polling(api, api_port, count):
+    application = telegram_bot.build_application(TOKEN, base_url=f"http://{HOST}:{api_port}/bot")
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(timeout=10)
+
+    async def deliver(update):
+        api.push(update)
+
+    first_id = 1 + 2 * count
+    try:
+        report('polling, по одному', await measure(api, deliver, first_id, count, burst=False))
+        report('polling, пачкой', await measure(api, deliver, first_id + count, count, burst=True))
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Логи httpx / PTB о каждом запросе искажают замер
+    logging.disable(logging.INFO)
+    tg_webhook.WEBHOOK_SECRET = SECRET
+
+    api = FakeBotAPI()
+    server = await asyncio.start_server(api.connection, HOST, 0)
+    api_port = server.sockets[0].getsockname()[1]
+    tg_webhook.WEBHOOK_URL = f"http://{HOST}:{api_port}"
+
+    print(f"Обновлений: {count}, одновременно обрабатывается: {telegram_bot.CONCURRENT_UPDATES}")
+    try:
+        await run_webhook(api, api_port, count)
+        await run_polling(api, api_port, count)
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Подсказки названий теплоходов (/api/boats/suggest) — префиксное дерево в памяти.
+
+Ключи — нормализованные имена (normalize_name: регистр и ё/е не различаются,
+пробелы схлопнуты): всё имя и каждое слово с его начала до конца имени,
+так что «бобер» находит «Шустрый бобер». В каждом узле дерева заранее лежат
+лучшие SUGGEST_MAX совпадений, поэтому запрос — проход по символам строки
+и срез готового списка, без сортировки и без SQLite.
+
+Порядок: сначала совпадение с начала имени, потом с начала слова; внутри —
+короче имя, затем по алфавиту.
+
+Дерево строится из снимка тарифов (pricing_snapshot) и помечено версией
+каталога: после синхронизации, импорта или правки теплохода первый запрос
+в процессе строит его заново (проверка версии — один stat()).
+"""
+import logging
+import threading
+
+from database import get_all_boats, get_catalog_version
+from pricing_snapshot import get_snapshot, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Сколько совпадений хранит узел (и максимум limit в запросе)
+SUGGEST_MAX = 20
+
+_lock = threading.Lock()
+_state = {'version': None, 'index': None}
+
+
+def _fold(text):
+    return ' '.join(normalize_name(text).split())
+
+
+class _Node:
+    __slots__ = ('children', 'hits', 'best')
+
+    def __init__(self):
+        self.children = {}
+        self.hits = ()
+        self.best = {}      # индекс теплохода → лучший ранг (только при сборке)
+
+
+class BoatIndex:
+    """Префиксное дерево по именам теплоходов."""
+
+    def __init__(self, boats):
+        self.entries = [{'id': b['id'], 'name': b['name'], 'dock': b.get('dock') or ''} for b in boats]
+        self.root = _Node()
+        for idx, boat in enumerate(self.entries):
+            folded = _fold(boat['name'])
+            if not folded:
+                continue
+            self._insert(folded, (0, len(folded), folded), idx)
+            for pos, ch in enumerate(folded):
+                if ch == ' ':
+                    self._insert(folded[pos + 1:], (1, len(folded), folded), idx)
+        self._finish(self.root)
+
+    def _insert(self, key, rank, idx):
+        node = self.root
+        for ch in key:
+            child = node.children.get(ch)
+            if child is None:
+                child = node.children[ch] = _Node()
+            node = child
+            if rank < node.best.get(idx, (2,)):
+                node.best[idx] = rank
+
+    def _finish(self, root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            ranked = sorted(node.best.items(), key=lambda item: item[1])[:SUGGEST_MAX]
+            node.hits = tuple(self.entries[idx] for idx, _ in ranked)
+            node.best = None
+            stack.extend(node.children.values())
+
+    def suggest(self, query, limit=8):
+        key = _fold(query)
+        if not key:
+            return []
+        node = self.root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return list(node.hits[:limit])
+
+
+def _load_boats():
+    snap = get_snapshot()
+    if snap is not None:
+        return snap.boats()
+    # Снимок не собрался — один раз читаем каталог из SQLite
+    return get_all_boats()
+
+
+def get_boat_index():
+    """Дерево текущей версии каталога; устарело — пересобирается."""
+    version = get_catalog_version()
+    if _state['version'] == version:
+        return _state['index']
+    with _lock:
+        if _state['version'] != version:
+            index = BoatIndex(_load_boats())
+            _state['index'], _state['version'] = index, version
+            logger.info("Индекс подсказок теплоходов построен: %d", len(index.entries))
+    return _state['index']
+
+
+def suggest_boats(query, limit=8):
+    """Строка пользователя → [{'id', 'name', 'dock'}] в порядке ранга."""
+    return get_boat_index().suggest(query, max(1, min(limit, SUGGEST_MAX)))
@@ -1,9 +1,17 @@
 # config.py
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # Пути к файлам
 RENTAL_DATA_FILE = 'rental_data.xlsx'
 LOG_FILE = 'bot.log'
 
+# Telegram-бот: токен от @BotFather, в .env (TELEGRAM_BOT_TOKEN)
+TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+
 # Flask
 FLASK_HOST = '0.0.0.0'
 FLASK_PORT = 5001
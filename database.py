@@ -3,12 +3,21 @@ import hashlib
 import os
 import json
 import logging
+import threading
+import time
 from datetime import datetime
+from functools import wraps
+
+from tariff_days import season_rule
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'navibot.db')
 
+# Версия каталога (теплоходы, цены, синхронизации) хранится в файле рядом с БД:
+# её читают все воркеры и бот, а проверка ETag не трогает SQLite.
+_catalog_version_cache = {'stat': None, 'version': None}
+
 
 def get_db():
     conn = sqlite3.connect(DB_PATH)
@@ -18,6 +27,128 @@ def get_db():
     return conn
 
 
+def _catalog_version_path():
+    return os.path.splitext(DB_PATH)[0] + '.catalog'
+
+
+def bump_catalog_version():
+    """Новая версия каталога — вызывается после каждой записи в boats / prices / sync_log."""
+    version = f"{time.time_ns():x}-{os.getpid():x}"
+    path = _catalog_version_path()
+    # Своё имя временного файла на поток: воркер gthread повышает версию из разных потоков
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(version)
+    os.replace(tmp, path)
+    return version
+
+
+def get_catalog_version():
+    """Текущая версия каталога. Пока файл не менялся — один stat(), без чтения."""
+    path = _catalog_version_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return bump_catalog_version()
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _catalog_version_cache['stat'] != key:
+        with open(path) as f:
+            _catalog_version_cache['version'] = f.read().strip()
+        _catalog_version_cache['stat'] = key
+    return _catalog_version_cache['version']
+
+
+# === Согласованность кешей между процессами ===
+#
+# Таблица cache_versions хранит счётчик на каждое пространство имён. Запись в
+# database.py увеличивает счётчик в той же транзакции, что и сами данные, поэтому
+# другой воркер или бот не увидит новые данные со старой версией.
+# Проверка на чтении дешёвая: PRAGMA data_version на отдельном соединении
+# меняется, только если БД кто-то изменил — тогда перечитываем счётчики.
+
+CACHE_NAMESPACES = ('catalog', 'prices', 'users')
+
+# Сколько результатов держит одна кешированная функция
+CACHE_MAX_ENTRIES = 256
+
+_cache_local = threading.local()
+
+
+def bump_cache_version(conn, *namespaces):
+    """Увеличить версии пространств имён — внутри транзакции записи, до commit()."""
+    conn.executemany(
+        "UPDATE cache_versions SET version = version + 1 WHERE namespace = ?",
+        [(ns,) for ns in namespaces]
+    )
+
+
+def _watch_connection():
+    """Соединение для PRAGMA data_version: своё на поток и процесс (после fork — новое)."""
+    local = _cache_local
+    key = (os.getpid(), DB_PATH)
+    if getattr(local, 'key', None) != key:
+        local.conn = sqlite3.connect(DB_PATH)
+        local.key = key
+        local.data_version = None
+        local.versions = {}
+    return local
+
+
+def get_cache_versions():
+    """{namespace: version}. Пока БД не менялась — один PRAGMA без чтения таблицы."""
+    local = _watch_connection()
+    data_version = local.conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version != local.data_version:
+        try:
+            rows = local.conn.execute("SELECT namespace, version FROM cache_versions").fetchall()
+        except sqlite3.OperationalError:
+            # Таблицы ещё нет (до init_db) — кеш просто не используется
+            rows = []
+        local.versions = dict(rows)
+        local.data_version = data_version
+    return local.versions
+
+
+def _copy_result(value):
+    """Копия результата, чтобы вызывающий код не испортил закешированные dict."""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_copy_result(v) for v in value]
+    return value
+
+
+def cached(*namespaces):
+    """
+    Кеш результатов функции чтения в памяти процесса. Сбрасывается целиком,
+    как только версия любого из namespaces изменилась (в этом или другом процессе).
+    """
+    def decorator(f):
+        state = {'stamp': None, 'entries': {}}
+
+        @wraps(f)
+        def wrapper(*args):
+            versions = get_cache_versions()
+            stamp = tuple(versions.get(ns) for ns in namespaces)
+            if None in stamp:
+                return f(*args)
+            if stamp != state['stamp']:
+                state['entries'] = {}
+                state['stamp'] = stamp
+            entries = state['entries']
+            if args in entries:
+                return _copy_result(entries[args])
+            result = f(*args)
+            if len(entries) >= CACHE_MAX_ENTRIES:
+                entries.clear()
+            entries[args] = result
+            return _copy_result(result)
+
+        wrapper.uncached = f
+        return wrapper
+    return decorator
+
+
 def _get_columns(conn, table):
     cursor = conn.execute(f"PRAGMA table_info({table})")
     return [row[1] for row in cursor.fetchall()]
@@ -25,6 +156,12 @@ def _get_columns(conn, table):
 
 def init_db():
     conn = get_db()
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # Новая БД: освобождённые страницы возвращаются по частям (maintenance.py).
+        # Существующую БД переводит первое обслуживание — нужен полный VACUUM
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL: читатели не ждут запись, онлайн-бекап не блокирует воркеры
+    conn.execute("PRAGMA journal_mode = WAL")
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,6 +178,7 @@ def init_db():
             user_id INTEGER NOT NULL,
             input_text TEXT NOT NULL,
             results_json TEXT NOT NULL,
+            version_id INTEGER DEFAULT NULL,
             created_at TEXT NOT NULL DEFAULT (datetime('now')),
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
@@ -67,9 +205,72 @@ def init_db():
             time_start TEXT NOT NULL,
             time_end TEXT NOT NULL,
             price_per_hour REAL NOT NULL,
+            date_start_ord INTEGER,
+            date_end_ord INTEGER,
+            time_start_min INTEGER,
+            time_end_min INTEGER,
+            weekday_mask INTEGER,
+            season_start_md INTEGER,
+            season_end_md INTEGER,
+            version_id INTEGER,
             FOREIGN KEY (boat_id) REFERENCES boats(id) ON DELETE CASCADE
         );
 
+        CREATE TABLE IF NOT EXISTS pricing_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            comment TEXT NOT NULL DEFAULT '',
+            prices_count INTEGER NOT NULL DEFAULT 0,
+            draft INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE TABLE IF NOT EXISTS pricing_active (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version_id INTEGER NOT NULL,
+            activated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE TABLE IF NOT EXISTS simulations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            done INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            date_from TEXT DEFAULT NULL,
+            date_to TEXT DEFAULT NULL,
+            result_json TEXT DEFAULT NULL,
+            error TEXT DEFAULT NULL,
+            created_by INTEGER,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            finished_at TEXT DEFAULT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL DEFAULT 'schedule',
+            status TEXT NOT NULL DEFAULT 'running',
+            backup_name TEXT DEFAULT NULL,
+            backup_bytes INTEGER DEFAULT NULL,
+            size_before INTEGER DEFAULT NULL,
+            size_after INTEGER DEFAULT NULL,
+            freelist_before INTEGER DEFAULT NULL,
+            freelist_after INTEGER DEFAULT NULL,
+            checkpoint TEXT DEFAULT NULL,
+            error TEXT DEFAULT NULL,
+            started_at TEXT NOT NULL DEFAULT (datetime('now')),
+            finished_at TEXT DEFAULT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS holidays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL DEFAULT '',
+            month INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            year INTEGER DEFAULT NULL,
+            priced_as INTEGER NOT NULL
+        );
+
         CREATE TABLE IF NOT EXISTS sync_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             sync_type TEXT NOT NULL,
@@ -78,10 +279,69 @@ def init_db():
             created_at TEXT NOT NULL DEFAULT (datetime('now'))
         );
 
+        CREATE TABLE IF NOT EXISTS tariff_coverage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            boat_id INTEGER NOT NULL,
+            date_start TEXT NOT NULL,
+            date_end TEXT NOT NULL,
+            day_range TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            time_start TEXT NOT NULL,
+            time_end TEXT NOT NULL,
+            prices TEXT NOT NULL DEFAULT '',
+            analyzed_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY (boat_id) REFERENCES boats(id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            namespace TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS stats_user_daily (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            calculations INTEGER NOT NULL DEFAULT 0,
+            quotes INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            priced INTEGER NOT NULL DEFAULT 0,
+            total_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS stats_boat_daily (
+            day TEXT NOT NULL,
+            boat_name TEXT NOT NULL,
+            quotes INTEGER NOT NULL DEFAULT 0,
+            priced INTEGER NOT NULL DEFAULT 0,
+            total_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, boat_name)
+        );
+
+        CREATE TABLE IF NOT EXISTS stats_date_daily (
+            day TEXT NOT NULL,
+            rental_date TEXT NOT NULL,
+            quotes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, rental_date)
+        );
+
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE TABLE IF NOT EXISTS stats_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+
         CREATE INDEX IF NOT EXISTS idx_calculations_user_id ON calculations(user_id);
         CREATE INDEX IF NOT EXISTS idx_calculations_created_at ON calculations(created_at);
         CREATE INDEX IF NOT EXISTS idx_prices_boat_id ON prices(boat_id);
         CREATE INDEX IF NOT EXISTS idx_boats_name ON boats(name);
+        CREATE INDEX IF NOT EXISTS idx_tariff_coverage_boat_id ON tariff_coverage(boat_id);
     """)
 
     # Миграции
@@ -89,6 +349,58 @@ def init_db():
     if 'avatar' not in user_cols:
         conn.execute("ALTER TABLE users ADD COLUMN avatar TEXT DEFAULT NULL")
 
+    # Целочисленные колонки цен для фильтрации расписания в SQL и сезонных правил
+    price_cols = _get_columns(conn, 'prices')
+    missing = [col for col in PRICE_INT_COLUMNS if col not in price_cols]
+    if missing:
+        for col in missing:
+            conn.execute(f"ALTER TABLE prices ADD COLUMN {col} INTEGER")
+        rows = conn.execute("SELECT id, date_start, date_end, day_range, time_start, time_end FROM prices").fetchall()
+        conn.executemany(
+            f"UPDATE prices SET {', '.join(f'{col}=?' for col in PRICE_INT_COLUMNS)} WHERE id=?",
+            [encode_price_row(r['date_start'], r['date_end'], r['day_range'], r['time_start'], r['time_end']) + (r['id'],) for r in rows]
+        )
+    # Расписание фильтруется по версии (idx_prices_version_boat), индекс по датам не используется,
+    # а обновлялся при каждой записи версии целиком
+    conn.execute("DROP INDEX IF EXISTS idx_prices_boat_dates")
+
+    # Версии цен: строки до появления версий становятся первой версией
+    if 'version_id' not in price_cols:
+        conn.execute("ALTER TABLE prices ADD COLUMN version_id INTEGER")
+    if conn.execute("SELECT COUNT(*) FROM pricing_active").fetchone()[0] == 0:
+        cur = conn.execute("INSERT INTO pricing_versions (source, comment) VALUES ('initial', 'Цены до появления версий')")
+        conn.execute("UPDATE prices SET version_id = ? WHERE version_id IS NULL", (cur.lastrowid,))
+        conn.execute(
+            "UPDATE pricing_versions SET prices_count = (SELECT COUNT(*) FROM prices WHERE version_id = ?) WHERE id = ?",
+            (cur.lastrowid, cur.lastrowid)
+        )
+        conn.execute("INSERT INTO pricing_active (id, version_id) VALUES (1, ?)", (cur.lastrowid,))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prices_version_boat ON prices(version_id, boat_id)")
+    # Версия цен расчёта — отдельной колонкой: по ней обслуживание не удаляет версии, на которые ссылается история
+    if 'version_id' not in _get_columns(conn, 'calculations'):
+        conn.execute("ALTER TABLE calculations ADD COLUMN version_id INTEGER DEFAULT NULL")
+        rows = conn.execute("SELECT id, results_json FROM calculations").fetchall()
+        conn.executemany(
+            "UPDATE calculations SET version_id = ? WHERE id = ?",
+            [(v, r['id']) for r in rows if (v := calculation_version(json.loads(r['results_json']))) is not None]
+        )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_calculations_version ON calculations(version_id)")
+
+    # Черновые версии симулятора не показываются в списке для отката
+    if 'draft' not in _get_columns(conn, 'pricing_versions'):
+        conn.execute("ALTER TABLE pricing_versions ADD COLUMN draft INTEGER NOT NULL DEFAULT 0")
+        conn.execute("UPDATE pricing_versions SET draft = 1 WHERE source = 'simulation' "
+                     "AND id != (SELECT version_id FROM pricing_active)")
+
+    # Покрытие по датам с годом (до таблицы тарифных дней) — сбросить, app.py посчитает заново
+    conn.execute("DELETE FROM tariff_coverage WHERE day_range NOT LIKE 'праздник%' AND date_start LIKE '____-__-__'")
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO cache_versions (namespace, version) VALUES (?, 0)",
+        [(ns,) for ns in CACHE_NAMESPACES]
+    )
+    conn.execute("INSERT OR IGNORE INTO stats_state (key, value) VALUES ('last_calculation_id', 0)")
+
     # Создать дефолтного админа если нет пользователей
     existing = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
     if existing == 0:
@@ -117,6 +429,7 @@ def get_user_by_username(username):
     return dict(user) if user else None
 
 
+@cached('users')
 def get_user_by_id(user_id):
     conn = get_db()
     user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
@@ -124,11 +437,17 @@ def get_user_by_id(user_id):
     return dict(user) if user else None
 
 
+def _select_all_users(conn):
+    users = conn.execute("SELECT id, username, display_name, role, avatar, created_at FROM users ORDER BY id").fetchall()
+    return [dict(u) for u in users]
+
+
+@cached('users')
 def get_all_users():
     conn = get_db()
-    users = conn.execute("SELECT id, username, display_name, role, avatar, created_at FROM users ORDER BY id").fetchall()
+    users = _select_all_users(conn)
     conn.close()
-    return [dict(u) for u in users]
+    return users
 
 
 def create_user(username, password, display_name, role='manager'):
@@ -138,6 +457,7 @@ def create_user(username, password, display_name, role='manager'):
             "INSERT INTO users (username, password_hash, display_name, role) VALUES (?, ?, ?, ?)",
             (username, hash_password(password), display_name, role)
         )
+        bump_cache_version(conn, 'users')
         conn.commit()
         user_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
         conn.close()
@@ -155,6 +475,7 @@ def update_user(user_id, display_name=None, password=None, role=None):
         conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hash_password(password), user_id))
     if role:
         conn.execute("UPDATE users SET role = ? WHERE id = ?", (role, user_id))
+    bump_cache_version(conn, 'users')
     conn.commit()
     conn.close()
 
@@ -162,6 +483,7 @@ def update_user(user_id, display_name=None, password=None, role=None):
 def update_avatar(user_id, avatar_filename):
     conn = get_db()
     conn.execute("UPDATE users SET avatar = ? WHERE id = ?", (avatar_filename, user_id))
+    bump_cache_version(conn, 'users')
     conn.commit()
     conn.close()
 
@@ -169,32 +491,70 @@ def update_avatar(user_id, avatar_filename):
 def delete_user(user_id):
     conn = get_db()
     conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    bump_cache_version(conn, 'users')
     conn.commit()
     conn.close()
 
 
 # === Calculations ===
 
-def save_calculation(user_id, input_text, results):
-    conn = get_db()
-    conn.execute(
-        "INSERT INTO calculations (user_id, input_text, results_json) VALUES (?, ?, ?)",
-        (user_id, input_text, json.dumps(results, ensure_ascii=False))
-    )
-    conn.commit()
-    conn.close()
+def save_calculation(user_id, input_text, results, created_at=None):
+    save_calculations_batch([(user_id, input_text, results, created_at)])
 
 
-def get_user_calculations(user_id, limit=200):
+def calculation_version(results):
+    """Версия цен, по которой посчитан расчёт (из компактной формы результатов), или None."""
+    for item in results:
+        quote = item.get('quote')
+        if quote and len(quote) > 11:
+            return quote[11]
+    return None
+
+
+def save_calculations_batch(rows):
+    """
+    Записать несколько расчётов одной транзакцией.
+    rows — [(user_id, input_text, results, created_at)]; created_at=None — текущее время.
+    Версия цен (все результаты одного расчёта — по одной) пишется в calculations.version_id.
+    В той же транзакции обновляется статистика использования (usage_stats.py).
+    """
+    from usage_stats import update_usage_stats
+
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
     conn = get_db()
+    try:
+        conn.executemany(
+            "INSERT INTO calculations (user_id, input_text, results_json, version_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (user_id, input_text, json.dumps(results, ensure_ascii=False, separators=(',', ':')),
+                 calculation_version(results), created_at or now)
+                for user_id, input_text, results, created_at in rows
+            ]
+        )
+        update_usage_stats(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _select_user_calculations(conn, user_id, limit):
     rows = conn.execute(
         "SELECT id, input_text, results_json, created_at FROM calculations WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
         (user_id, limit)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
+def get_user_calculations(user_id, limit=200):
+    conn = get_db()
+    calcs = _select_user_calculations(conn, user_id, limit)
+    conn.close()
+    return calcs
+
+
 def delete_calculation(calc_id, user_id):
     conn = get_db()
     conn.execute("DELETE FROM calculations WHERE id = ? AND user_id = ?", (calc_id, user_id))
@@ -202,15 +562,62 @@ def delete_calculation(calc_id, user_id):
     conn.close()
 
 
+def iter_calculations(user_id=None, date_from=None, date_to=None, batch_size=1000):
+    """
+    Генератор истории расчётов для выгрузки (с логином и именем пользователя).
+    date_from / date_to — date, включительно. Строки читаются пачками,
+    соединение закрывается, когда генератор исчерпан или закрыт.
+    """
+    import datetime as dt
+    where = []
+    params = []
+    if user_id is not None:
+        where.append("c.user_id = ?")
+        params.append(user_id)
+    if date_from is not None:
+        where.append("c.created_at >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        where.append("c.created_at < ?")
+        params.append((date_to + dt.timedelta(days=1)).isoformat())
+    sql = (
+        "SELECT c.id, c.created_at, u.username, u.display_name, c.input_text, c.results_json "
+        "FROM calculations c JOIN users u ON u.id = c.user_id"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY c.id"
+    yield from _iter_query(sql, params, batch_size)
+
+
+def _iter_query(sql, params, batch_size):
+    conn = get_db()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
 # === Boats ===
 
+def _select_all_boats(conn):
+    return [dict(r) for r in conn.execute("SELECT * FROM boats ORDER BY name").fetchall()]
+
+
+@cached('catalog')
 def get_all_boats():
     conn = get_db()
-    rows = conn.execute("SELECT * FROM boats ORDER BY name").fetchall()
+    boats = _select_all_boats(conn)
     conn.close()
-    return [dict(r) for r in rows]
+    return boats
 
 
+@cached('catalog')
 def get_boat_by_id(boat_id):
     conn = get_db()
     row = conn.execute("SELECT * FROM boats WHERE id = ?", (boat_id,)).fetchone()
@@ -218,6 +625,7 @@ def get_boat_by_id(boat_id):
     return dict(row) if row else None
 
 
+@cached('catalog')
 def get_boat_by_name(name):
     conn = get_db()
     row = conn.execute(
@@ -248,8 +656,10 @@ def create_boat(name, link='', dock='', cleaning_cost=0, prep_hours=1.0, unload_
             "INSERT INTO boats (name, link, dock, cleaning_cost, prep_hours, unload_hours, wp_slug) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (name.strip(), link, dock, cleaning_cost, prep_hours, unload_hours, wp_slug)
         )
-        conn.commit()
         boat_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        bump_cache_version(conn, 'catalog')
+        conn.commit()
+        bump_catalog_version()
         conn.close()
         return boat_id
     except sqlite3.IntegrityError:
@@ -270,88 +680,173 @@ def update_boat(boat_id, **fields):
         updates.append("updated_at = datetime('now')")
         values.append(boat_id)
         conn.execute(f"UPDATE boats SET {', '.join(updates)} WHERE id = ?", values)
+        bump_cache_version(conn, 'catalog')
         conn.commit()
+        bump_catalog_version()
     conn.close()
 
 
 def delete_boat(boat_id):
     conn = get_db()
     conn.execute("DELETE FROM boats WHERE id = ?", (boat_id,))
+    bump_cache_version(conn, 'catalog', 'prices')
     conn.commit()
     conn.close()
+    bump_catalog_version()
 
 
 # === Prices ===
 
+# Строки цен активной версии (см. «Версии цен» ниже)
+ACTIVE_PRICES = "version_id = (SELECT version_id FROM pricing_active)"
+
+
+@cached('prices')
 def get_prices_for_boat(boat_id):
     conn = get_db()
     rows = conn.execute(
-        "SELECT * FROM prices WHERE boat_id = ? ORDER BY date_start, time_start",
+        f"SELECT * FROM prices WHERE boat_id = ? AND {ACTIVE_PRICES} ORDER BY date_start, time_start",
         (boat_id,)
     ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
-def get_pricing_schedule_db(boat_name, boarding_date):
-    """Получить тарифные интервалы для теплохода на дату — аналог get_pricing_schedule из rental_calculator."""
+def iter_prices_with_boats(batch_size=1000):
+    """Генератор всей тарифной сетки (активная версия) вместе с названием теплохода — для выгрузки."""
+    yield from _iter_query(
+        "SELECT b.name, p.season_name, p.date_start, p.date_end, p.day_range, p.time_start, p.time_end, p.price_per_hour "
+        f"FROM prices p JOIN boats b ON b.id = p.boat_id WHERE p.{ACTIVE_PRICES} "
+        "ORDER BY b.name, p.date_start, p.time_start",
+        (), batch_size
+    )
+
+
+@cached('catalog', 'prices')
+def get_pricing_schedule_db(boat_name, boarding_date, version_id=None):
+    """
+    Тарифные интервалы теплохода на дату — то же, что PricingSnapshot.schedule,
+    запросом в SQLite (когда снимка нет или нужна не активная версия цен).
+    Сезон — правило по месяцу-дню, праздник считается по тарифу своего дня недели.
+    version_id — версия цен (None — активная).
+    """
     import datetime as dt
     boat = get_boat_by_name(boat_name)
     if not boat:
         return []
 
-    day_map = {0: "Пн", 1: "Вт", 2: "Ср", 3: "Чт", 4: "Пт", 5: "Сб", 6: "Вс"}
     if isinstance(boarding_date, dt.datetime):
         boarding_date = boarding_date.date()
-    day_short = day_map[boarding_date.weekday()]
 
+    weekday = get_holiday_weekday(boarding_date)
+    if weekday is None:
+        weekday = boarding_date.weekday()
+    md = boarding_date.month * 100 + boarding_date.day
+
+    # Сезон, день недели и время отфильтрованы в SQL по целочисленным колонкам
     conn = get_db()
     rows = conn.execute(
-        "SELECT * FROM prices WHERE boat_id = ? ORDER BY time_start",
-        (boat['id'],)
+        "SELECT time_start_min, time_end_min, price_per_hour FROM prices "
+        "WHERE version_id = COALESCE(?, (SELECT version_id FROM pricing_active)) "
+        "AND boat_id = ? AND (weekday_mask & ?) != 0 "
+        "AND ((season_start_md <= season_end_md AND ? BETWEEN season_start_md AND season_end_md) "
+        "OR (season_start_md > season_end_md AND (? >= season_start_md OR ? <= season_end_md))) "
+        "AND time_start_min IS NOT NULL AND time_end_min IS NOT NULL "
+        "ORDER BY time_start_min, id",
+        (version_id, boat['id'], 1 << weekday, md, md, md)
     ).fetchall()
     conn.close()
 
+    day_start = dt.datetime.combine(boarding_date, dt.time())
     schedule = []
-    for row in rows:
-        try:
-            d_start = dt.datetime.strptime(row['date_start'], "%Y-%m-%d").date()
-            d_end = dt.datetime.strptime(row['date_end'], "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            continue
+    for t_start, t_end, price in rows:
+        dt_start = day_start + dt.timedelta(minutes=t_start)
+        dt_end = day_start + dt.timedelta(minutes=t_end)
+        if t_start >= t_end:
+            dt_end += dt.timedelta(days=1)
+        schedule.append((dt_start, dt_end, float(price)))
+    return schedule
 
-        if not (d_start <= boarding_date <= d_end):
-            continue
 
-        if not _weekday_in_range(day_short, row['day_range']):
-            continue
+# === Holidays ===
 
-        try:
-            t_start = dt.datetime.strptime(row['time_start'].strip(), "%H:%M").time()
-            t_end = dt.datetime.strptime(row['time_end'].strip(), "%H:%M").time()
-        except (ValueError, TypeError):
-            continue
+@cached('prices')
+def get_holidays():
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT * FROM holidays ORDER BY year IS NOT NULL, year, month, day"
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
 
-        dt_start = dt.datetime.combine(boarding_date, t_start)
-        dt_end = dt.datetime.combine(boarding_date, t_end)
-        if t_start >= t_end:
-            dt_end += dt.timedelta(days=1)
 
-        schedule.append((dt_start, dt_end, float(row['price_per_hour'])))
+@cached('prices')
+def get_holiday_weekday(day):
+    """День недели, по тарифу которого считается дата (праздник), или None. Разовый важнее ежегодного."""
+    conn = get_db()
+    row = conn.execute(
+        "SELECT priced_as FROM holidays WHERE month = ? AND day = ? AND (year = ? OR year IS NULL) "
+        "ORDER BY year IS NULL LIMIT 1",
+        (day.month, day.day, day.year)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def create_holiday(month, day, priced_as, year=None, name=''):
+    """
+    Праздник (year None — каждый год). Такая же дата заменяется. Возвращает id.
+    Покрытие тарифов пересчитывается после.
+    """
+    from tariff_coverage import analyze_coverage
+
+    conn = get_db()
+    try:
+        conn.execute("DELETE FROM holidays WHERE month = ? AND day = ? AND year IS ?", (month, day, year))
+        cur = conn.execute(
+            "INSERT INTO holidays (name, month, day, year, priced_as) VALUES (?, ?, ?, ?, ?)",
+            (name, month, day, year, priced_as)
+        )
+        bump_cache_version(conn, 'prices')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_catalog_version()
+    analyze_coverage()
+    return cur.lastrowid
+
+
+def delete_holiday(holiday_id):
+    from tariff_coverage import analyze_coverage
+
+    conn = get_db()
+    try:
+        conn.execute("DELETE FROM holidays WHERE id = ?", (holiday_id,))
+        bump_cache_version(conn, 'prices')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_catalog_version()
+    analyze_coverage()
 
-    schedule.sort(key=lambda x: x[0])
-    return schedule
+
+WEEK_DAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 
 
 def _weekday_in_range(day_short, range_str):
-    week = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
     options = [opt.strip() for opt in range_str.split(",")]
     for opt in options:
         if "-" in opt:
             start, end = opt.split("-")
-            si = week.index(start.strip())
-            ei = week.index(end.strip())
-            di = week.index(day_short)
+            si = WEEK_DAYS.index(start.strip())
+            ei = WEEK_DAYS.index(end.strip())
+            di = WEEK_DAYS.index(day_short)
             if si <= ei:
                 if si <= di <= ei:
                     return True
@@ -364,19 +859,293 @@ def _weekday_in_range(day_short, range_str):
     return False
 
 
-def replace_prices_for_boat(boat_id, prices_list):
+def day_range_mask(range_str):
+    """
+    'Пт-Вс' → битовая маска дней недели (бит 0 — Пн, бит 6 — Вс).
+    Те же правила, что у _weekday_in_range; неизвестный день → ValueError.
+    """
+    mask = 0
+    for opt in range_str.split(","):
+        opt = opt.strip()
+        if not opt:
+            continue
+        parts = [p.strip() for p in opt.split("-")]
+        if len(parts) > 2 or any(p not in WEEK_DAYS for p in parts):
+            raise ValueError(f"Неизвестный день недели: '{opt}'")
+        si = WEEK_DAYS.index(parts[0])
+        ei = WEEK_DAYS.index(parts[-1])
+        di = si
+        while True:
+            mask |= 1 << di
+            if di == ei:
+                break
+            di = (di + 1) % 7
+    return mask
+
+
+def mask_to_day_range(mask):
+    """Обратное к day_range_mask: 0b0011111 → 'Пн-Пт', 0b1010001 → 'Пн,Пт,Вс'."""
+    parts = []
+    day = 0
+    while day < 7:
+        if not mask & (1 << day):
+            day += 1
+            continue
+        start = day
+        while day + 1 < 7 and mask & (1 << (day + 1)):
+            day += 1
+        parts.append(WEEK_DAYS[start] if start == day else f"{WEEK_DAYS[start]}-{WEEK_DAYS[day]}")
+        day += 1
+    return ",".join(parts)
+
+
+def _time_to_minutes(time_str):
+    """'10:00' → 600, '24:00' → 1440; неразборчивое время → None."""
+    try:
+        h, m = time_str.strip().split(':')
+        h, m = int(h), int(m)
+    except (ValueError, AttributeError):
+        return None
+    if 0 <= h <= 24 and 0 <= m < 60 and h * 60 + m <= 1440:
+        return h * 60 + m
+    return None
+
+
+PRICE_INT_COLUMNS = ('date_start_ord', 'date_end_ord', 'time_start_min', 'time_end_min', 'weekday_mask',
+                     'season_start_md', 'season_end_md')
+
+
+def encode_price_row(date_start, date_end, day_range, time_start, time_end):
+    """
+    Целочисленное представление строки цены, вычисляется при записи (PRICE_INT_COLUMNS):
+    ординалы дат, минуты, маска дней недели и сезонное правило ММДД (tariff_days.season_rule).
+    Неразборчивые значения → NULL, такие строки не попадают в расписание.
+    """
+    import datetime as dt
+    try:
+        d_start = dt.date.fromisoformat(date_start)
+        d_end = dt.date.fromisoformat(date_end)
+        ds, de = d_start.toordinal(), d_end.toordinal()
+        md_start, md_end = season_rule(d_start, d_end)
+    except (ValueError, TypeError):
+        ds = de = md_start = md_end = None
+    try:
+        mask = day_range_mask(day_range) or None
+    except (ValueError, AttributeError):
+        mask = None
+    return ds, de, _time_to_minutes(time_start), _time_to_minutes(time_end), mask, md_start, md_end
+
+
+PRICE_DATA_COLUMNS = ('boat_id', 'season_name', 'date_start', 'date_end', 'day_range', 'time_start', 'time_end',
+                      'price_per_hour') + PRICE_INT_COLUMNS
+
+PRICE_INSERT_SQL = (
+    f"INSERT INTO prices ({', '.join(PRICE_DATA_COLUMNS)}, version_id) "
+    f"VALUES ({', '.join('?' * (len(PRICE_DATA_COLUMNS) + 1))})"
+)
+
+
+def insert_price_rows(conn, rows, version_id):
+    """
+    Пакетная вставка цен в версию version_id: rows — кортежи
+    (boat_id, season_name, date_start, date_end, day_range, time_start, time_end, price_per_hour).
+    Целочисленные колонки заполняются здесь же.
+    """
+    conn.executemany(PRICE_INSERT_SQL, [tuple(r) + encode_price_row(*r[2:7]) + (version_id,) for r in rows])
+
+
+def _price_tuple(boat_id, p):
+    return (boat_id, p['season_name'], p['date_start'], p['date_end'], p['day_range'], p['time_start'], p['time_end'], p['price_per_hour'])
+
+
+def replace_prices_for_boat(boat_id, prices_list, source='manual'):
     """Заменить все цены теплохода. prices_list = [{season_name, date_start, date_end, day_range, time_start, time_end, price_per_hour}]"""
+    return replace_prices_bulk({boat_id: prices_list}, source)
+
+
+def replace_prices_bulk(prices_by_boat, source='manual', comment='', activate=True):
+    """
+    Заменить цены нескольких теплоходов одной транзакцией. prices_by_boat = {boat_id: prices_list}
+    Пишется новая версия цен (остальные теплоходы копируются из активной) и
+    становится активной. Возвращает id версии.
+    После записи пересчитывается покрытие тарифов этих теплоходов (tariff_coverage.py).
+    activate=False — черновая версия (симулятор тарифов): сохраняется, но не действует.
+    """
+    from tariff_coverage import analyze_coverage
+
     conn = get_db()
-    conn.execute("DELETE FROM prices WHERE boat_id = ?", (boat_id,))
-    for p in prices_list:
-        conn.execute(
-            "INSERT INTO prices (boat_id, season_name, date_start, date_end, day_range, time_start, time_end, price_per_hour) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (boat_id, p['season_name'], p['date_start'], p['date_end'], p['day_range'], p['time_start'], p['time_end'], p['price_per_hour'])
-        )
-    conn.commit()
+    try:
+        version_id = create_pricing_version(conn, source, comment, replaced_boat_ids=prices_by_boat.keys())
+        for boat_id, prices_list in prices_by_boat.items():
+            insert_price_rows(conn, [_price_tuple(boat_id, p) for p in prices_list], version_id)
+        if activate:
+            set_active_pricing_version(conn, version_id)
+        else:
+            conn.execute("UPDATE pricing_versions SET draft = 1 WHERE id = ?", (version_id,))
+            _count_pricing_version(conn, version_id)
+            bump_cache_version(conn, 'prices')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if activate:
+        bump_catalog_version()
+        analyze_coverage(prices_by_boat.keys())
+    return version_id
+
+
+# === Версии цен ===
+#
+# Строки prices не меняются: каждая синхронизация, загрузка или импорт пишет
+# новую версию (pricing_versions) целиком — цены затронутых теплоходов новые,
+# остальных скопированы из активной. Какая версия действует, решает одна строка
+# pricing_active: откат — UPDATE этой строки, без переимпорта. Праздники и
+# свойства теплоходов (уборка, причал) не версионируются. Старые версии удаляет
+# prune_pricing_versions (обслуживание БД, maintenance.py).
+
+def create_pricing_version(conn, source, comment='', replaced_boat_ids=()):
+    """
+    Новая версия внутри транзакции conn: копия активной без цен replaced_boat_ids.
+    Активной её делает set_active_pricing_version (в той же транзакции). Возвращает id.
+    """
+    replaced = list(replaced_boat_ids)
+    version_id = conn.execute(
+        "INSERT INTO pricing_versions (source, comment) VALUES (?, ?)", (source, comment)
+    ).lastrowid
+    columns = ', '.join(PRICE_DATA_COLUMNS)
+    conn.execute(
+        f"INSERT INTO prices ({columns}, version_id) SELECT {columns}, ? FROM prices "
+        f"WHERE {ACTIVE_PRICES} AND boat_id NOT IN ({', '.join('?' * len(replaced))}) ORDER BY id",
+        [version_id] + replaced
+    )
+    return version_id
+
+
+def _switch_pricing_version(conn, version_id):
+    conn.execute("UPDATE pricing_active SET version_id = ?, activated_at = datetime('now') WHERE id = 1", (version_id,))
+    # Активированный черновик становится обычной версией — в списке для отката
+    conn.execute("UPDATE pricing_versions SET draft = 0 WHERE id = ?", (version_id,))
+    bump_cache_version(conn, 'prices')
+
+
+def _count_pricing_version(conn, version_id):
+    conn.execute(
+        "UPDATE pricing_versions SET prices_count = (SELECT COUNT(*) FROM prices WHERE version_id = ?) WHERE id = ?",
+        (version_id, version_id)
+    )
+
+
+def set_active_pricing_version(conn, version_id):
+    """Дописанную версию сделать активной внутри транзакции conn (commit и bump_catalog_version — за вызывающим)."""
+    _count_pricing_version(conn, version_id)
+    _switch_pricing_version(conn, version_id)
+
+
+def activate_pricing_version(version_id):
+    """
+    Откат (или возврат) на сохранённую версию цен: переключение указателя.
+    Возвращает False, если такой версии нет. Покрытие тарифов пересчитывается после.
+    """
+    from tariff_coverage import analyze_coverage
+
+    conn = get_db()
+    try:
+        if not conn.execute("SELECT 1 FROM pricing_versions WHERE id = ?", (version_id,)).fetchone():
+            return False
+        _switch_pricing_version(conn, version_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_catalog_version()
+    analyze_coverage()
+    return True
+
+
+@cached('prices')
+def get_active_pricing_version():
+    conn = get_db()
+    version_id = conn.execute("SELECT version_id FROM pricing_active").fetchone()[0]
+    conn.close()
+    return version_id
+
+
+@cached('prices')
+def get_pricing_activated_at():
+    """Когда активная версия цен стала активной (UTC, 'YYYY-mm-dd HH:MM:SS')."""
+    conn = get_db()
+    activated_at = conn.execute("SELECT activated_at FROM pricing_active").fetchone()[0]
+    conn.close()
+    return activated_at
+
+
+@cached('prices')
+def get_pricing_version(version_id):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM pricing_versions WHERE id = ?", (version_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+@cached('prices')
+def get_pricing_versions(limit=100, drafts=False):
+    """
+    Последние версии цен, новые первыми; у активной active = True.
+    Черновики симулятора (draft) — только при drafts=True.
+    """
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT v.*, v.id = a.version_id AS active FROM pricing_versions v, pricing_active a "
+        "WHERE ? OR v.draft = 0 OR v.id = a.version_id ORDER BY v.id DESC LIMIT ?",
+        (bool(drafts), limit)
+    ).fetchall()
     conn.close()
+    return [dict(r, active=bool(r['active']), draft=bool(r['draft'])) for r in rows]
 
 
+def prune_pricing_versions(keep):
+    """
+    Удалить старые версии цен вместе с их строками prices. Остаются keep последних
+    не-черновых версий, активная, черновики не старше последней из оставленных и
+    версии, на которые ссылаются история (calculations.version_id — по ней старый
+    расчёт можно пересчитать) и симуляции (simulations.version_id).
+    Возвращает число удалённых версий.
+    """
+    conn = get_db()
+    try:
+        boundary = conn.execute(
+            "SELECT MIN(id) FROM (SELECT id FROM pricing_versions WHERE draft = 0 ORDER BY id DESC LIMIT ?)",
+            (max(keep, 1),)
+        ).fetchone()[0]
+        if boundary is None:
+            return 0
+        doomed = [r[0] for r in conn.execute(
+            "SELECT id FROM pricing_versions WHERE id < ? "
+            "AND id != (SELECT version_id FROM pricing_active) "
+            "AND NOT EXISTS (SELECT 1 FROM calculations c WHERE c.version_id = pricing_versions.id) "
+            "AND NOT EXISTS (SELECT 1 FROM simulations s WHERE s.version_id = pricing_versions.id)",
+            (boundary,)
+        )]
+        if not doomed:
+            return 0
+        conn.executemany("DELETE FROM prices WHERE version_id = ?", [(v,) for v in doomed])
+        conn.executemany("DELETE FROM pricing_versions WHERE id = ?", [(v,) for v in doomed])
+        bump_cache_version(conn, 'prices')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info("Удалено старых версий цен: %d (до версии %d)", len(doomed), boundary)
+    return len(doomed)
+
+
+@cached('catalog')
 def get_boat_count():
     conn = get_db()
     count = conn.execute("SELECT COUNT(*) FROM boats").fetchone()[0]
@@ -384,9 +1153,10 @@ def get_boat_count():
     return count
 
 
+@cached('prices')
 def get_price_count():
     conn = get_db()
-    count = conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+    count = conn.execute(f"SELECT COUNT(*) FROM prices WHERE {ACTIVE_PRICES}").fetchone()[0]
     conn.close()
     return count
 
@@ -399,110 +1169,81 @@ def log_sync(sync_type, status, details=None):
     )
     conn.commit()
     conn.close()
+    bump_catalog_version()
 
 
-def get_last_sync():
-    conn = get_db()
+def _select_last_sync(conn):
     row = conn.execute(
         "SELECT * FROM sync_log WHERE status = 'success' ORDER BY created_at DESC LIMIT 1"
     ).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
-# === Migration from Excel ===
-
-def migrate_from_excel(excel_path):
-    """Одноразовая миграция данных из rental_data.xlsx в SQLite."""
-    import pandas as pd
-
-    logger.info("Начинаю миграцию из Excel: %s", excel_path)
-
-    boats_df = pd.read_excel(excel_path, sheet_name="Теплоходы", engine="openpyxl")
-    prices_df = pd.read_excel(excel_path, sheet_name="Цены", engine="openpyxl")
-
+def get_last_sync():
     conn = get_db()
-    boats_added = 0
-    prices_added = 0
-
-    for _, row in boats_df.iterrows():
-        name = str(row["Название теплохода"]).strip()
-        if not name:
-            continue
-        link = str(row.get("Ссылка", "")).strip()
-        dock = str(row.get("Адрес причала", "")).strip()
-        cleaning = float(row.get("Стоимость уборки", 3000))
-        prep = float(row.get("Время подготовки (ч)", 1.0))
-        unload = float(row.get("Время разгрузки (ч)", 0.5))
-
-        # Извлечь slug из ссылки
-        wp_slug = None
-        if 'product/' in link:
-            wp_slug = link.rstrip('/').split('product/')[-1].strip('/')
-
-        existing = conn.execute("SELECT id FROM boats WHERE LOWER_PY(TRIM(name)) = LOWER_PY(TRIM(?))", (name,)).fetchone()
-        if existing:
-            conn.execute(
-                "UPDATE boats SET link=?, dock=?, cleaning_cost=?, prep_hours=?, unload_hours=?, wp_slug=?, updated_at=datetime('now') WHERE id=?",
-                (link, dock, cleaning, prep, unload, wp_slug, existing[0])
-            )
-        else:
-            conn.execute(
-                "INSERT INTO boats (name, link, dock, cleaning_cost, prep_hours, unload_hours, wp_slug) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (name, link, dock, cleaning, prep, unload, wp_slug)
-            )
-            boats_added += 1
+    last = _select_last_sync(conn)
+    conn.close()
+    return last
 
-    conn.commit()
 
-    for _, row in prices_df.iterrows():
-        boat_name = str(row["Название теплохода"]).strip()
-        if not boat_name:
-            continue
+# === Стартовые данные SPA ===
 
-        boat_row = conn.execute(
-            "SELECT id FROM boats WHERE LOWER_PY(TRIM(name)) = LOWER_PY(TRIM(?))",
-            (boat_name,)
+def get_bootstrap(user_id, is_admin, known=(), history_limit=200):
+    """
+    Данные для /api/bootstrap: одно соединение, одна транзакция чтения — секции
+    согласованы между собой. known — ETag секций, которые уже есть у клиента;
+    такие секции не читаются.
+    Возвращает {секция: (etag, данные | None)}, None — у клиента актуальная копия.
+    Секции: me (строка users), boats, sync, history (строки calculations), users (только админу).
+    """
+    catalog = get_catalog_version()
+    conn = get_db()
+    try:
+        conn.execute("BEGIN")
+        users_version = conn.execute(
+            "SELECT version FROM cache_versions WHERE namespace = 'users'"
+        ).fetchone()[0]
+        last_id, count = conn.execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM calculations WHERE user_id = ?", (user_id,)
         ).fetchone()
-        if not boat_row:
-            logger.warning("Теплоход '%s' не найден при импорте цен — пропуск", boat_name)
-            continue
-
-        boat_id = boat_row[0]
-        season = str(row.get("Сезон", "")).strip()
-        try:
-            d_start = pd.to_datetime(row["Дата начала"]).strftime("%Y-%m-%d")
-            d_end = pd.to_datetime(row["Дата окончания"]).strftime("%Y-%m-%d")
-        except Exception:
-            continue
-
-        day_range = str(row.get("День недели", "")).strip()
-        time_range = str(row.get("Время", "")).strip()
 
-        # Парсим "10:00 - 18:00" → "10:00", "18:00"
-        time_parts = [t.strip() for t in time_range.replace(" ", "").split("-")]
-        if len(time_parts) != 2:
-            time_parts = [t.strip() for t in time_range.split("-")]
-        if len(time_parts) != 2:
-            logger.warning("Не удалось распарсить время '%s' — пропуск", time_range)
-            continue
-        t_start = time_parts[0].strip()
-        t_end = time_parts[1].strip()
+        readers = {
+            'me': (f"me-{user_id}-{users_version}",
+                   lambda: dict(conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone())),
+            'boats': (f"boats-{catalog}", lambda: _select_all_boats(conn)),
+            'sync': (f"sync-{catalog}", lambda: {
+                'boats_count': conn.execute("SELECT COUNT(*) FROM boats").fetchone()[0],
+                'prices_count': conn.execute(f"SELECT COUNT(*) FROM prices WHERE {ACTIVE_PRICES}").fetchone()[0],
+                'last_sync': _select_last_sync(conn),
+            }),
+            'history': (f"history-{user_id}-{last_id}-{count}",
+                        lambda: _select_user_calculations(conn, user_id, history_limit)),
+        }
+        if is_admin:
+            readers['users'] = (f"users-{users_version}", lambda: _select_all_users(conn))
+
+        sections = {}
+        for name, (etag, read) in readers.items():
+            sections[name] = (etag, None if etag in known else read())
+        return sections
+    finally:
+        conn.rollback()
+        conn.close()
 
-        price_raw = str(row.get("Стоимость (руб/ч)", "0")).replace(" ", "").replace(",", ".")
-        try:
-            price = float(price_raw)
-        except ValueError:
-            price = 0.0
 
-        conn.execute(
-            "INSERT INTO prices (boat_id, season_name, date_start, date_end, day_range, time_start, time_end, price_per_hour) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (boat_id, season, d_start, d_end, day_range, t_start, t_end, price)
-        )
-        prices_added += 1
+# === Migration from Excel ===
 
-    conn.commit()
-    conn.close()
+def migrate_from_excel(excel_path):
+    """Импорт теплоходов и цен из rental_data.xlsx (или CSV) в SQLite. Возвращает отчёт импорта."""
+    from importer import import_tariff_file
 
-    log_sync('excel_migration', 'success', f'Теплоходов: {boats_added}, цен: {prices_added}')
-    logger.info("Миграция завершена. Теплоходов: %d, цен: %d", boats_added, prices_added)
+    logger.info("Начинаю миграцию из Excel: %s", excel_path)
+    report = import_tariff_file(excel_path)
+
+    details = f'Теплоходов: {report.boats_added}, цен: {report.prices_added}'
+    if report.errors_total:
+        details += f', ошибок: {report.errors_total}'
+    log_sync('excel_migration', 'success', details)
+    logger.info("Миграция завершена. Теплоходов: %d, цен: %d, ошибок: %d",
+                report.boats_added, report.prices_added, report.errors_total)
+    return report.to_dict()
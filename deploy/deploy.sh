@@ -6,7 +6,7 @@
 # 1. Забирает свежий код из GitHub
 # 2. Обновляет Python-зависимости
 # 3. Пересобирает фронтенд
-# 4. Перезапускает бэкенд (graceful reload — без даунтайма)
+# 4. Перезапускает бэкенд (restart — с --preload reload не подхватывает новый код)
 
 set -e
 
@@ -32,9 +32,9 @@ npm install --silent
 npm run build
 cd ..
 
-# 4. Перезапуск бэкенда (graceful — текущие запросы дообработаются)
+# 4. Перезапуск бэкенда (Gunicorn с --preload: код загружен в мастере, нужен restart)
 echo "[4/4] Перезапускаю бэкенд..."
-sudo systemctl reload navibot || sudo systemctl restart navibot
+sudo systemctl restart navibot
 
 echo "=== Деплой завершён ==="
 echo "$(date '+%Y-%m-%d %H:%M:%S')"
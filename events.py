@@ -0,0 +1,169 @@
+"""
+Живые события для SPA (Server-Sent Events): прогресс синхронизации, смена
+версии каталога, изменения пользователей.
+
+Рассылка между воркерами Gunicorn идёт через SQLite, без отдельного брокера:
+    sync      — publish() пишет строку в таблицу events (из любого процесса);
+    catalog   — файл версии каталога (database.get_catalog_version) сменился;
+    users     — версия пространства users в cache_versions выросла.
+В каждом воркере, где есть подписчики, один фоновый поток раз в POLL_INTERVAL
+проверяет PRAGMA data_version и stat() файла каталога — пока ничего не менялось,
+это всё, что он делает. Новое раздаётся по очередям подписчиков этого воркера.
+
+Подписчик — открытое соединение /api/events; медленному подписчику события,
+не влезшие в очередь, не доставляются (клиент всё равно перечитает данные по ETag).
+Каждый подписчик держит поток воркера gthread до STREAM_MAX_AGE, поэтому их число
+в процессе ограничено MAX_SUBSCRIBERS — доля --threads, остальные потоки остаются
+обычным /api/*. Сверх лимита subscribe() бросает EventsBusy: /api/events отвечает
+503 с Retry-After, SPA до переподключения перечитывает данные по ETag.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from database import get_db, get_cache_versions, get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Как часто фоновый поток проверяет изменения, секунд
+POLL_INTERVAL = 0.5
+
+# Комментарий-пинг в потоке, если событий нет, секунд (держит соединение через прокси)
+KEEPALIVE_INTERVAL = 15
+
+# Сколько живёт одно соединение; клиент переподключается сам (retry)
+STREAM_MAX_AGE = 600
+
+# Сколько потоков событий держит один процесс: четверть --threads (32) gunicorn
+MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_STREAMS', '8'))
+
+# Через сколько секунд клиенту, получившему 503, пробовать снова
+BUSY_RETRY_AFTER = 60
+
+# Сколько строк events хранить
+EVENTS_KEEP = 1000
+
+# Очередь одного подписчика
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_lock = threading.Lock()
+_state = {'pid': None, 'thread': None, 'subscribers': set()}
+
+
+class EventsBusy(RuntimeError):
+    """Потоков событий в процессе уже MAX_SUBSCRIBERS."""
+
+
+def publish(kind, data):
+    """Событие для всех воркеров — одна строка в events своей транзакцией."""
+    conn = get_db()
+    try:
+        cur = conn.execute(
+            "INSERT INTO events (kind, data) VALUES (?, ?)",
+            (kind, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        )
+        if cur.lastrowid % 100 == 0:
+            conn.execute("DELETE FROM events WHERE id <= ?", (cur.lastrowid - EVENTS_KEEP,))
+        conn.commit()
+    except Exception as e:
+        # События — подсказка клиенту, из-за них основная операция не падает
+        conn.rollback()
+        logger.warning("Событие %s не опубликовано: %s", kind, e)
+    finally:
+        conn.close()
+
+
+def _dispatch(kind, data):
+    with _lock:
+        subscribers = list(_state['subscribers'])
+    for q in subscribers:
+        try:
+            q.put_nowait((kind, data))
+        except queue.Full:
+            pass
+
+
+def _poll():
+    conn = get_db()
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    catalog = get_catalog_version()
+    users = get_cache_versions().get('users')
+
+    while True:
+        time.sleep(POLL_INTERVAL)
+        try:
+            current = conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != data_version:
+                data_version = current
+                for row in conn.execute("SELECT id, kind, data FROM events WHERE id > ? ORDER BY id", (last_id,)):
+                    last_id = row['id']
+                    _dispatch(row['kind'], json.loads(row['data']))
+                version = get_cache_versions().get('users')
+                if version != users:
+                    users = version
+                    _dispatch('users', {'version': version})
+            version = get_catalog_version()
+            if version != catalog:
+                catalog = version
+                _dispatch('catalog', {'version': version})
+        except Exception as e:
+            logger.error("Ошибка опроса событий: %s", e)
+
+
+def _ensure_poller():
+    # Поток — свой в каждом воркере (после fork потоки мастера не существуют)
+    pid = os.getpid()
+    with _lock:
+        if _state['pid'] == pid and _state['thread'].is_alive():
+            return
+        if _state['pid'] != pid:
+            _state['subscribers'] = set()
+        thread = threading.Thread(target=_poll, name='events-poller', daemon=True)
+        thread.start()
+        _state['pid'] = pid
+        _state['thread'] = thread
+
+
+def subscribe():
+    """Очередь нового подписчика; подписчиков уже MAX_SUBSCRIBERS — EventsBusy."""
+    _ensure_poller()
+    q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        if len(_state['subscribers']) >= MAX_SUBSCRIBERS:
+            raise EventsBusy("Слишком много открытых потоков событий")
+        _state['subscribers'].add(q)
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        _state['subscribers'].discard(q)
+
+
+def _format(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def stream(q):
+    """
+    Генератор text/event-stream для очереди q (subscribe() — до ответа, чтобы
+    при EventsBusy успеть ответить 503). Отписка — при закрытии (клиент ушёл —
+    запись пинга или события падает не позже KEEPALIVE_INTERVAL).
+    """
+    try:
+        yield "retry: 3000\n\n"
+        yield _format('ready', {'catalog': get_catalog_version(), 'users': get_cache_versions().get('users')})
+        deadline = time.monotonic() + STREAM_MAX_AGE
+        while time.monotonic() < deadline:
+            try:
+                kind, data = q.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield _format(kind, data)
+    finally:
+        unsubscribe(q)
@@ -0,0 +1,194 @@
+"""
+Потоковая выгрузка тарифов и истории расчётов в CSV/XLSX.
+
+Строки читаются из SQLite пачками и сразу отдаются генератором —
+в память воркера вся выгрузка не загружается. XLSX тоже идёт потоком: zip
+пишется по мере чтения строк (stream_xlsx), первые байты уходят клиенту сразу,
+а не после сборки всей книги.
+
+Тарифная сетка выгружается в формате листа "Цены" (см. importer.py),
+поэтому выгрузку можно поправить и загрузить обратно.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import json_codec
+from database import iter_calculations, iter_prices_with_boats
+from importer import PRICES_SHEET
+from rental_calculator import expand_saved_results
+
+CALCULATIONS_HEADER = ['ID', 'Дата (UTC)', 'Логин', 'Пользователь', 'Запрос', 'Результат']
+PRICES_HEADER = ['Название теплохода', 'Сезон', 'Дата начала', 'Дата окончания', 'День недели', 'Время', 'Стоимость (руб/ч)']
+
+# Сколько строк CSV копить перед отправкой клиенту
+CSV_FLUSH_ROWS = 500
+
+# Сколько строк листа XLSX писать перед отправкой клиенту
+XLSX_FLUSH_ROWS = 500
+
+# Минимальный набор частей книги с одним листом (SpreadsheetML)
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="1"><xf xfId="0"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+# Управляющие символы, недопустимые в XML
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def calculation_rows(**filters):
+    for row in iter_calculations(**filters):
+        results = expand_saved_results(json_codec.loads(row['results_json']))
+        text = "\n\n".join(r.get('result') or r.get('error', '') for r in results)
+        yield [row['id'], row['created_at'], row['username'], row['display_name'], row['input_text'], text]
+
+
+def price_rows():
+    for row in iter_prices_with_boats():
+        yield [
+            row['name'], row['season_name'], row['date_start'], row['date_end'],
+            row['day_range'], f"{row['time_start']} - {row['time_end']}", row['price_per_hour'],
+        ]
+
+
+def stream_csv(header, rows):
+    """CSV (';', UTF-8 с BOM — открывается в Excel без мастера импорта) кусками."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';')
+    buf.write('\ufeff')
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+
+class _ZipSink:
+    """Файл без seek для zipfile: записанное копится до take()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>'
+
+
+def stream_xlsx(sheet_title, header, rows):
+    """
+    XLSX потоком: zip пишется в память по ходу чтения строк (размеры частей — в
+    дескрипторах после данных, seek не нужен) и отдаётся каждые XLSX_FLUSH_ROWS
+    строк. Строки — inline-строки без общей таблицы, поэтому книгу не нужно
+    держать целиком.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_PARTS.items():
+            zf.writestr(name, xml)
+        zf.writestr('xl/workbook.xml', _WORKBOOK.format(title=escape(sheet_title, {'"': '&quot;'})))
+        yield sink.take()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header).encode('utf-8'))
+            buf = []
+            for i, row in enumerate(rows, start=1):
+                buf.append(_xlsx_row(row))
+                if i % XLSX_FLUSH_ROWS == 0:
+                    sheet.write(''.join(buf).encode('utf-8'))
+                    buf = []
+                    # Сжатые данные выходят блоками — не на каждую пачку строк
+                    data = sink.take()
+                    if data:
+                        yield data
+            sheet.write(''.join(buf).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.take()
+
+
+def export_stream(kind, fmt, **filters):
+    """Генератор байтов выгрузки. kind: 'calculations' | 'prices', fmt: 'csv' | 'xlsx'."""
+    if kind == 'calculations':
+        header, rows, title = CALCULATIONS_HEADER, calculation_rows(**filters), 'Расчёты'
+    else:
+        header, rows, title = PRICES_HEADER, price_rows(), PRICES_SHEET
+    if fmt == 'xlsx':
+        return stream_xlsx(title, header, rows)
+    return stream_csv(header, rows)
@@ -1,11 +1,22 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import './App.css'
 
 const API_URL = '/api'
 
 function getToken() { return localStorage.getItem('navibot_token') }
 function setToken(t) { localStorage.setItem('navibot_token', t) }
-function removeToken() { localStorage.removeItem('navibot_token') }
+function removeToken() {
+  localStorage.removeItem('navibot_token')
+  clearCache()
+}
+
+const CACHE_PREFIX = 'navibot_cache:'
+
+function clearCache() {
+  Object.keys(localStorage)
+    .filter(k => k.startsWith(CACHE_PREFIX))
+    .forEach(k => localStorage.removeItem(k))
+}
 
 async function apiFetch(path, options = {}) {
   const token = getToken()
@@ -13,23 +24,120 @@ async function apiFetch(path, options = {}) {
   if (!options.isFormData) headers['Content-Type'] = 'application/json'
   if (token) headers['Authorization'] = `Bearer ${token}`
   const res = await fetch(`${API_URL}${path}`, { ...options, headers })
-  const data = await res.json()
+  const data = res.status === 304 ? null : await res.json()
   if (res.status === 401) {
     removeToken()
     window.location.reload()
   }
-  return { ok: res.ok, status: res.status, data }
+  return { ok: res.ok, status: res.status, data, etag: res.headers.get('ETag') }
+}
+
+// GET справочников (теплоходы, статус синхронизации) с кешем в localStorage:
+// отправляем If-None-Match, при 304 берём сохранённый ответ
+async function cachedFetch(path) {
+  const key = CACHE_PREFIX + path
+  let cached = null
+  try { cached = JSON.parse(localStorage.getItem(key)) } catch { cached = null }
+  const headers = cached?.etag ? { 'If-None-Match': cached.etag } : {}
+  const res = await apiFetch(path, { headers })
+  if (res.status === 304 && cached) return { ok: true, status: 200, data: cached.data }
+  if (res.ok && res.etag) {
+    try { localStorage.setItem(key, JSON.stringify({ etag: res.etag, data: res.data })) } catch { /* квота */ }
+  }
+  return res
+}
+
+// Стартовые данные (me, boats, sync, history, users) одним запросом. Секции лежат
+// в localStorage со своими ETag — неизменившиеся сервер не читает и не присылает
+async function fetchBootstrap() {
+  const key = CACHE_PREFIX + '/bootstrap'
+  let cached = {}
+  try { cached = JSON.parse(localStorage.getItem(key)) || {} } catch { cached = {} }
+  const etags = Object.values(cached).map(section => `"${section.etag}"`).join(', ')
+  const res = await apiFetch('/bootstrap', { headers: etags ? { 'If-None-Match': etags } : {} })
+  if (!res.ok) return res
+  const sections = {}
+  const data = {}
+  for (const [name, etag] of Object.entries(res.data.etags)) {
+    data[name] = res.data.not_modified.includes(name) ? cached[name]?.data : res.data[name]
+    sections[name] = { etag, data: data[name] }
+  }
+  try { localStorage.setItem(key, JSON.stringify(sections)) } catch { /* квота */ }
+  return { ok: true, status: res.status, data }
+}
+
+// События сервера (/api/events, Server-Sent Events). Поток читается через fetch,
+// а не EventSource — так уходит заголовок Authorization. Разрыв → переподключение через 3 с.
+// 503 (потоков на воркере слишком много) → событие poll: данные перечитываются по ETag,
+// новая попытка — через Retry-After
+const serverEvents = new EventTarget()
+
+async function listenServerEvents(signal) {
+  while (!signal.aborted) {
+    let delay = 3000
+    try {
+      const res = await fetch(`${API_URL}/events`, {
+        headers: { 'Authorization': `Bearer ${getToken()}` },
+        signal
+      })
+      if (res.status === 401) return
+      if (res.status === 503) {
+        delay = (Number(res.headers.get('Retry-After')) || 60) * 1000
+        serverEvents.dispatchEvent(new CustomEvent('poll', { detail: null }))
+      } else if (res.ok) {
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffer = ''
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += value
+          let end
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, end)
+            buffer = buffer.slice(end + 2)
+            let type = 'message'
+            let data = ''
+            for (const line of block.split('\n')) {
+              if (line.startsWith('event: ')) type = line.slice(7)
+              else if (line.startsWith('data: ')) data += line.slice(6)
+            }
+            if (data) serverEvents.dispatchEvent(new CustomEvent(type, { detail: JSON.parse(data) }))
+          }
+        }
+      }
+    } catch {
+      if (signal.aborted) return
+    }
+    await new Promise(resolve => setTimeout(resolve, delay))
+  }
 }
 
-function avatarUrl(avatar) {
-  if (!avatar) return null
-  return `${API_URL}/avatars/${avatar}`
+function useServerEvent(type, handler) {
+  const handlerRef = useRef(handler)
+  handlerRef.current = handler
+  useEffect(() => {
+    const listener = e => handlerRef.current(e.detail)
+    serverEvents.addEventListener(type, listener)
+    return () => serverEvents.removeEventListener(type, listener)
+  }, [type])
+}
+
+// Сервер отдаёт варианты аватарки по размерам: sm (72px) — до 36px на экранах 2x
+function avatarVariant(urls, size) {
+  if (!urls) return null
+  return size <= 36 ? urls.sm : urls.lg
 }
 
-function UserAvatar({ avatar, name, size = 32 }) {
-  const src = avatarUrl(avatar)
-  if (src) {
-    return <img src={src} alt={name} className="user-avatar" style={{ width: size, height: size }} />
+function UserAvatar({ urls, name, size = 32 }) {
+  const variant = avatarVariant(urls, size)
+  if (variant) {
+    return (
+      <picture className="user-avatar-picture">
+        <source srcSet={variant.webp} type="image/webp" />
+        <img src={variant.jpg} alt={name} className="user-avatar" style={{ width: size, height: size }}
+          width={size} height={size} loading="lazy" decoding="async" />
+      </picture>
+    )
   }
   const initial = (name || '?')[0].toUpperCase()
   return (
@@ -53,6 +161,28 @@ function CopyButton({ text, label = 'Скопировать' }) {
   )
 }
 
+// Текст результата из quote — как QuoteResult.to_markdown() на сервере
+// (история приходит без готового текста, только quote)
+function quoteMarkdown(quote) {
+  const money = (value) => String(Math.trunc(value)).replace(/\B(?=(\d{3})+(?!\d))/g, ' ')
+  const time = (iso) => iso.slice(11, 16)
+  const bold = (text) => `**${text}**`
+  const { times } = quote
+  const rates = quote.rates.map(r => `(${money(r.price)}₽/ч x ${r.hours.toFixed(2)}ч)`).join(' + ')
+  const lines = [
+    bold(`${quote.date.slice(8, 10)}.${quote.date.slice(5, 7)}.${quote.date.slice(2, 4)}`),
+    '',
+    `${bold(quote.boat)} - ${quote.link}`,
+  ]
+  if (times.prep_start) lines.push(`${time(times.prep_start)} - Подготовка (50%)`)
+  lines.push(`${time(times.boarding)} - Посадка`)
+  lines.push(`${time(times.disembarking)} - Высадка`)
+  if (times.unloading) lines.push(`${time(times.unloading)} - Разгрузка (50%)`)
+  lines.push(`Причал: ${quote.dock}`)
+  lines.push(`Аренда: ${rates} + ${Math.trunc(quote.cleaning_cost)}₽ (уборка) = ${bold(money(quote.total))}₽`)
+  return lines.map(line => line.replaceAll(',', ' ')).join('\n')
+}
+
 function formatResult(text) {
   return text
     .replace(/&/g, '&amp;')
@@ -62,8 +192,44 @@ function formatResult(text) {
     .replace(/\*([^*]+)\*/g, '<strong>$1</strong>')
 }
 
+const WEEKDAY_LABELS = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+
 const ROLE_LABELS = { admin: 'Админ', editor: 'Редактор', manager: 'Менеджер' }
 
+// Строка запроса, похожая на дату: dd.mm.yy / dd/mm/yyyy, день недели, «завтра»
+const DATE_LINE = /^(\d{1,2}([./])\d{1,2}\2\d{2,4}|(в |во )?(пн|вт|ср|чт|пт|сб|вс|понедельник|вторник|среда|среду|четверг|пятница|пятницу|суббота|субботу|воскресенье|сегодня|завтра|послезавтра)(?![а-яё]))/i
+
+// Строка с курсором, если это строка теплохода (следующая непустая после даты)
+function boatLineAt(text, caret) {
+  const start = text.lastIndexOf('\n', caret - 1) + 1
+  let end = text.indexOf('\n', caret)
+  if (end < 0) end = text.length
+  const query = text.slice(start, end).trim()
+  if (!query || /^\d/.test(query) || DATE_LINE.test(query)) return null
+  const previous = text.slice(0, start).split('\n').map(l => l.trim()).filter(Boolean).pop()
+  if (!previous || !DATE_LINE.test(previous)) return null
+  return { start, end, query }
+}
+
+function isoDaysAgo(days) {
+  const d = new Date()
+  d.setDate(d.getDate() - days)
+  return d.toISOString().slice(0, 10)
+}
+
+function formatMoney(value) {
+  return value == null ? '—' : `${value.toLocaleString('ru-RU')} ₽`
+}
+
+function formatBytes(value) {
+  if (value < 1024 * 1024) return `${Math.round(value / 1024)} КБ`
+  return `${(value / 1024 / 1024).toLocaleString('ru-RU', { maximumFractionDigits: 1 })} МБ`
+}
+
+const COVERAGE_LABELS = { gap: 'Нет тарифа', overlap: 'Пересечение цен', duplicate: 'Дубль строк', no_tariff: 'День без тарифа' }
+
+const PRICING_SOURCES = { initial: 'Начальная', wordpress: 'Синхронизация', import: 'Загрузка файла', excel_migration: 'Импорт Excel', manual: 'Вручную', simulation: 'Симуляция' }
+
 // === Login Screen ===
 function LoginScreen({ onLogin }) {
   const [username, setUsername] = useState('')
@@ -119,11 +285,12 @@ function BoatsPanel() {
   const [saving, setSaving] = useState(false)
 
   const loadBoats = async () => {
-    const { ok, data } = await apiFetch('/boats')
+    const { ok, data } = await cachedFetch('/boats')
     if (ok) setBoats(data.boats)
   }
 
   useEffect(() => { loadBoats() }, [])
+  useServerEvent('catalog', loadBoats)
 
   const startEdit = (boat) => {
     setEditBoat(boat)
@@ -229,15 +396,26 @@ function BoatsPanel() {
 }
 
 // === Admin Panel ===
-function AdminPanel({ onBack, user }) {
+function AdminPanel({ onBack, user, initial }) {
   const [tab, setTab] = useState(user.role === 'admin' ? 'users' : 'boats')
-  const [users, setUsers] = useState([])
+  const [users, setUsers] = useState(initial?.users || [])
   const [showForm, setShowForm] = useState(false)
   const [editUser, setEditUser] = useState(null)
   const [form, setForm] = useState({ username: '', password: '', display_name: '', role: 'manager' })
   const [error, setError] = useState('')
-  const [syncStatus, setSyncStatus] = useState(null)
+  const [syncStatus, setSyncStatus] = useState(initial?.sync || null)
   const [syncMsg, setSyncMsg] = useState('')
+  const [coverage, setCoverage] = useState([])
+  const [pricingVersions, setPricingVersions] = useState([])
+  const [stats, setStats] = useState(null)
+  const [statsRange, setStatsRange] = useState(() => ({ from: isoDaysAgo(30), to: isoDaysAgo(0) }))
+  const [holidays, setHolidays] = useState([])
+  const [holidayForm, setHolidayForm] = useState({ date: '', priced_as: 6, name: '' })
+  const [holidayError, setHolidayError] = useState('')
+  const [simForm, setSimForm] = useState(() => ({ percent: '10', file: null, from: isoDaysAgo(365), to: isoDaysAgo(0) }))
+  const [simJob, setSimJob] = useState(null)
+  const [simError, setSimError] = useState('')
+  const [maintenance, setMaintenance] = useState(null)
 
   const loadUsers = async () => {
     const { ok, data } = await apiFetch('/admin/users')
@@ -245,11 +423,145 @@ function AdminPanel({ onBack, user }) {
   }
 
   const loadSyncStatus = async () => {
-    const { ok, data } = await apiFetch('/sync/status')
+    const { ok, data } = await cachedFetch('/sync/status')
     if (ok) setSyncStatus(data)
   }
 
-  useEffect(() => { loadUsers(); loadSyncStatus() }, [])
+  const loadCoverage = async () => {
+    const { ok, data } = await cachedFetch('/admin/coverage')
+    if (ok) setCoverage(data.coverage)
+  }
+
+  const loadPricingVersions = async () => {
+    const { ok, data } = await apiFetch('/admin/pricing-versions?limit=20')
+    if (ok) setPricingVersions(data.versions)
+  }
+
+  const handleActivateVersion = async (version) => {
+    if (!confirm(`Сделать активной версию цен ${version.id}? Расчёты сразу пойдут по ней.`)) return
+    const { ok, data } = await apiFetch(`/admin/pricing-versions/${version.id}/activate`, { method: 'POST' })
+    setSyncMsg(ok ? data.message : data.error)
+    loadPricingVersions()
+  }
+
+  const loadStats = async () => {
+    const params = new URLSearchParams()
+    if (statsRange.from) params.set('date_from', statsRange.from)
+    if (statsRange.to) params.set('date_to', statsRange.to)
+    const { ok, data } = await apiFetch(`/admin/stats?${params}`)
+    if (ok) setStats(data)
+  }
+
+  useEffect(() => {
+    if (tab === 'stats') loadStats()
+  }, [tab, statsRange])
+
+  const loadMaintenance = async () => {
+    const { ok, data } = await apiFetch('/admin/maintenance')
+    if (!ok) return
+    setMaintenance(data)
+    // Идущее обслуживание — перечитать через пару секунд
+    if (data.last_run?.status === 'running') setTimeout(loadMaintenance, 2000)
+  }
+
+  useEffect(() => {
+    if (tab === 'stats') loadMaintenance()
+  }, [tab])
+
+  const handleRunMaintenance = async () => {
+    const { ok, data } = await apiFetch('/admin/maintenance', { method: 'POST' })
+    if (!ok) alert(data.error)
+    loadMaintenance()
+  }
+
+  const loadHolidays = async () => {
+    const { ok, data } = await apiFetch('/admin/holidays')
+    if (ok) setHolidays(data.holidays)
+  }
+
+  useEffect(() => {
+    if (tab === 'holidays') loadHolidays()
+  }, [tab])
+
+  const handleAddHoliday = async () => {
+    setHolidayError('')
+    const { ok, data } = await apiFetch('/admin/holidays', {
+      method: 'POST', body: JSON.stringify({ ...holidayForm, priced_as: Number(holidayForm.priced_as) })
+    })
+    if (!ok) { setHolidayError(data.error); return }
+    setHolidayForm({ date: '', priced_as: holidayForm.priced_as, name: '' })
+    loadHolidays()
+  }
+
+  const handleDeleteHoliday = async (id) => {
+    await apiFetch(`/admin/holidays/${id}`, { method: 'DELETE' })
+    loadHolidays()
+  }
+
+  const loadSimulation = async (id) => {
+    const { ok, data } = await apiFetch(`/admin/simulations/${id}`)
+    if (ok) setSimJob(data.simulation)
+  }
+
+  useEffect(() => {
+    if (tab !== 'simulation' || simJob) return
+    // Последнее задание — в том числе идущее, если вкладку открыли заново
+    apiFetch('/admin/simulations').then(({ ok, data }) => {
+      if (ok && data.simulations.length > 0) loadSimulation(data.simulations[0].id)
+    })
+  }, [tab])
+
+  const handleStartSimulation = async () => {
+    setSimError('')
+    const params = new URLSearchParams()
+    if (simForm.from) params.set('date_from', simForm.from)
+    if (simForm.to) params.set('date_to', simForm.to)
+    let options
+    if (simForm.file) {
+      const formData = new FormData()
+      formData.append('file', simForm.file)
+      options = { method: 'POST', body: formData, isFormData: true }
+    } else {
+      options = { method: 'POST', body: JSON.stringify({ percent: Number(simForm.percent) }) }
+    }
+    const { ok, data } = await apiFetch(`/admin/simulations?${params}`, options)
+    if (!ok) { setSimError(data.error); return }
+    loadSimulation(data.id)
+  }
+
+  useServerEvent('simulation', (progress) => {
+    if (!simJob || progress.id !== simJob.id) return
+    if (progress.stage === 'running') setSimJob({ ...simJob, done: progress.done, total: progress.total })
+    else loadSimulation(progress.id)
+  })
+
+  useServerEvent('sync', (progress) => {
+    if (progress.stage === 'boats') {
+      setSyncMsg(`Синхронизация: ${progress.done} из ${progress.total} — ${progress.boat}`)
+    } else if (progress.stage === 'fetch') {
+      setSyncMsg(progress.message)
+    }
+  })
+  useServerEvent('catalog', () => {
+    loadSyncStatus()
+    if (user.role === 'admin' || user.role === 'editor') {
+      loadCoverage()
+      loadPricingVersions()
+    }
+  })
+  useServerEvent('users', () => {
+    if (user.role === 'admin') loadUsers()
+  })
+
+  useEffect(() => {
+    // Пользователи и статус уже пришли в /bootstrap — повторно не запрашиваем
+    if (!initial?.users) loadUsers()
+    if (!initial?.sync) loadSyncStatus()
+    if (user.role === 'admin' || user.role === 'editor') {
+      loadCoverage()
+      loadPricingVersions()
+    }
+  }, [])
 
   const resetForm = () => {
     setForm({ username: '', password: '', display_name: '', role: 'manager' })
@@ -319,6 +631,7 @@ function AdminPanel({ onBack, user }) {
     const { ok, data } = await apiFetch('/sync/migrate-excel', { method: 'POST' })
     setSyncMsg(data.message || data.error)
     loadSyncStatus()
+    loadCoverage()
     setTimeout(() => setSyncMsg(''), 5000)
   }
 
@@ -334,16 +647,26 @@ function AdminPanel({ onBack, user }) {
       if (data.skipped?.length > 0) {
         msg += ` (не найдено в БД: ${data.skipped.length})`
       }
+      if (data.coverage?.gaps.length > 0) {
+        msg += `. Дыры в тарифах: ${data.coverage.gaps.join(', ')}`
+      }
+      if (data.coverage?.overlaps.length > 0) {
+        msg += `. Пересечения цен: ${data.coverage.overlaps.join(', ')}`
+      }
       setSyncMsg(msg)
     } else {
       setSyncMsg(data.error || 'Ошибка синхронизации')
     }
     loadSyncStatus()
+    loadCoverage()
     setTimeout(() => setSyncMsg(''), 8000)
   }
 
   const isAdmin = user.role === 'admin'
   const isEditorOrAdmin = user.role === 'admin' || user.role === 'editor'
+  // Дубли строк на расчёт не влияют — в таблице только их количество
+  const coverageIssues = coverage.filter(c => c.kind !== 'duplicate')
+  const coverageDuplicates = coverage.length - coverageIssues.length
 
   return (
     <div className="admin-panel">
@@ -363,6 +686,18 @@ function AdminPanel({ onBack, user }) {
           <button className={`admin-tab ${tab === 'sync' ? 'active' : ''}`}
             onClick={() => setTab('sync')}>Синхронизация</button>
         )}
+        {isEditorOrAdmin && (
+          <button className={`admin-tab ${tab === 'holidays' ? 'active' : ''}`}
+            onClick={() => setTab('holidays')}>Праздники</button>
+        )}
+        {isAdmin && (
+          <button className={`admin-tab ${tab === 'stats' ? 'active' : ''}`}
+            onClick={() => setTab('stats')}>Статистика</button>
+        )}
+        {isAdmin && (
+          <button className={`admin-tab ${tab === 'simulation' ? 'active' : ''}`}
+            onClick={() => setTab('simulation')}>Симуляция</button>
+        )}
       </div>
 
       {/* === Users Tab === */}
@@ -383,7 +718,7 @@ function AdminPanel({ onBack, user }) {
                 <tr key={u.id}>
                   <td className="admin-avatar-cell">
                     <div className="admin-avatar-wrapper">
-                      <UserAvatar avatar={u.avatar} name={u.display_name} size={36} />
+                      <UserAvatar urls={u.avatar_urls} name={u.display_name} size={36} />
                       <label className="avatar-upload-label">
                         <input type="file" accept="image/png,image/jpeg,image/webp" hidden
                           onChange={e => { if (e.target.files[0]) handleAvatarUpload(u.id, e.target.files[0]); e.target.value = '' }} />
@@ -469,6 +804,369 @@ function AdminPanel({ onBack, user }) {
           <p className="sync-hint">
             Синхронизация обновляет цены из teplohod-restoran.ru. Причалы, уборка и ссылки — вручную на вкладке «Теплоходы».
           </p>
+
+          <h3>Версии цен</h3>
+          <p className="sync-hint">
+            Каждая синхронизация и загрузка цен сохраняется отдельной версией. Откат — выбрать версию, переимпорт не нужен.
+          </p>
+          <table className="admin-table">
+            <thead>
+              <tr>
+                <th>Версия</th>
+                <th>Источник</th>
+                <th>Строк цен</th>
+                <th>Создана</th>
+                <th></th>
+              </tr>
+            </thead>
+            <tbody>
+              {pricingVersions.map(v => (
+                <tr key={v.id}>
+                  <td>{v.id}{v.comment && ` — ${v.comment}`}</td>
+                  <td>{PRICING_SOURCES[v.source] || v.source}</td>
+                  <td>{v.prices_count}</td>
+                  <td>{new Date(v.created_at + 'Z').toLocaleString('ru-RU')}</td>
+                  <td>
+                    {v.active
+                      ? <strong>Активна</strong>
+                      : <button className="btn-small" onClick={() => handleActivateVersion(v)}>Сделать активной</button>}
+                  </td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+
+          <h3>Покрытие тарифов</h3>
+          {coverageDuplicates > 0 && (
+            <p className="sync-hint">Дублирующихся строк цен: {coverageDuplicates} (на расчёт не влияют)</p>
+          )}
+          {coverageIssues.length === 0 ? (
+            <p className="sync-hint">Дыр и пересечений в тарифной сетке нет.</p>
+          ) : (
+            <table className="admin-table coverage-table">
+              <thead>
+                <tr>
+                  <th>Теплоход</th>
+                  <th>Даты</th>
+                  <th>Дни</th>
+                  <th>Время</th>
+                  <th>Проблема</th>
+                  <th>Цены</th>
+                </tr>
+              </thead>
+              <tbody>
+                {coverageIssues.map((c, i) => (
+                  <tr key={i} className={`coverage-${c.kind}`}>
+                    <td>{c.name}</td>
+                    <td>{c.date_start} — {c.date_end}</td>
+                    <td>{c.day_range}</td>
+                    <td>{c.time_start}–{c.time_end}</td>
+                    <td>{COVERAGE_LABELS[c.kind] || c.kind}</td>
+                    <td>{c.prices}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          )}
+        </div>
+      )}
+
+      {/* === Holidays Tab === */}
+      {tab === 'holidays' && isEditorOrAdmin && (
+        <div className="sync-panel">
+          <p className="sync-hint">
+            Праздник считается по тарифу выбранного дня недели. Дата без года (dd.mm) — каждый год,
+            с годом (dd.mm.yyyy) — только в этот день.
+          </p>
+          <div className="stats-filters">
+            <input placeholder="dd.mm или dd.mm.yyyy" value={holidayForm.date}
+              onChange={e => setHolidayForm({ ...holidayForm, date: e.target.value })} />
+            <input placeholder="Название" value={holidayForm.name}
+              onChange={e => setHolidayForm({ ...holidayForm, name: e.target.value })} />
+            <label>По тарифу
+              <select value={holidayForm.priced_as}
+                onChange={e => setHolidayForm({ ...holidayForm, priced_as: e.target.value })}>
+                {WEEKDAY_LABELS.map((label, i) => <option key={i} value={i}>{label}</option>)}
+              </select>
+            </label>
+            <button className="btn btn-primary" onClick={handleAddHoliday} disabled={!holidayForm.date.trim()}>
+              Добавить
+            </button>
+          </div>
+          {holidayError && <div className="login-error">{holidayError}</div>}
+          {holidays.length === 0 ? (
+            <p className="sync-hint">Праздников нет — все дни считаются по своему дню недели.</p>
+          ) : (
+            <table className="admin-table">
+              <thead>
+                <tr>
+                  <th>Дата</th>
+                  <th>Название</th>
+                  <th>По тарифу</th>
+                  <th></th>
+                </tr>
+              </thead>
+              <tbody>
+                {holidays.map(h => (
+                  <tr key={h.id}>
+                    <td>{h.date}</td>
+                    <td>{h.name}</td>
+                    <td>{WEEKDAY_LABELS[h.priced_as]}</td>
+                    <td>
+                      <button className="btn-small btn-danger" onClick={() => handleDeleteHoliday(h.id)}>Удалить</button>
+                    </td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          )}
+        </div>
+      )}
+
+      {/* === Stats Tab === */}
+      {tab === 'stats' && isAdmin && (
+        <div className="sync-panel">
+          <div className="stats-filters">
+            <label>С
+              <input type="date" value={statsRange.from}
+                onChange={e => setStatsRange({ ...statsRange, from: e.target.value })} />
+            </label>
+            <label>По
+              <input type="date" value={statsRange.to}
+                onChange={e => setStatsRange({ ...statsRange, to: e.target.value })} />
+            </label>
+          </div>
+
+          {stats && (
+            <>
+              <div className="sync-stats">
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{stats.totals.calculations}</span>
+                  <span className="sync-stat-label">Запросов</span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{stats.totals.quotes}</span>
+                  <span className="sync-stat-label">Расчётов (ошибок: {stats.totals.errors})</span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{formatMoney(stats.totals.average_total)}</span>
+                  <span className="sync-stat-label">Средняя сумма</span>
+                </div>
+              </div>
+
+              <h3>Менеджеры</h3>
+              <table className="admin-table">
+                <thead>
+                  <tr>
+                    <th>Менеджер</th>
+                    <th>Запросов</th>
+                    <th>Расчётов</th>
+                    <th>Средняя сумма</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {stats.managers.map(m => (
+                    <tr key={m.user_id}>
+                      <td>{m.display_name || `Удалён (#${m.user_id})`}</td>
+                      <td>{m.calculations}</td>
+                      <td>{m.quotes}</td>
+                      <td>{formatMoney(m.average_total)}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+
+              <h3>Популярные теплоходы</h3>
+              <table className="admin-table">
+                <thead>
+                  <tr>
+                    <th>Теплоход</th>
+                    <th>Расчётов</th>
+                    <th>Средняя сумма</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {stats.top_boats.map(b => (
+                    <tr key={b.boat}>
+                      <td>{b.boat}</td>
+                      <td>{b.quotes}</td>
+                      <td>{formatMoney(b.average_total)}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+
+              <h3>Популярные даты</h3>
+              <table className="admin-table">
+                <thead>
+                  <tr>
+                    <th>Дата аренды</th>
+                    <th>Расчётов</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {stats.top_dates.map(d => (
+                    <tr key={d.date}>
+                      <td>{new Date(d.date).toLocaleDateString('ru-RU')}</td>
+                      <td>{d.quotes}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            </>
+          )}
+
+          {maintenance && (
+            <>
+              <h3>База данных</h3>
+              <div className="sync-stats">
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{formatBytes(maintenance.database.size_bytes)}</span>
+                  <span className="sync-stat-label">
+                    Размер (свободно {formatBytes(maintenance.database.free_bytes)}, WAL {formatBytes(maintenance.database.wal_bytes)})
+                  </span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">
+                    {maintenance.last_run
+                      ? new Date(maintenance.last_run.started_at + 'Z').toLocaleString('ru-RU')
+                      : 'Никогда'}
+                  </span>
+                  <span className="sync-stat-label">
+                    Последнее обслуживание
+                    {maintenance.last_run?.status === 'running' && ' (идёт)'}
+                    {maintenance.last_run?.status === 'error' && ` (ошибка: ${maintenance.last_run.error})`}
+                  </span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{maintenance.backups.length}</span>
+                  <span className="sync-stat-label">
+                    Бекапов{maintenance.backups[0] && `, последний ${maintenance.backups[0].name}`}
+                  </span>
+                </div>
+              </div>
+              <div className="sync-actions">
+                <button className="btn btn-secondary" onClick={handleRunMaintenance}
+                  disabled={maintenance.last_run?.status === 'running'}>
+                  Бекап и обслуживание сейчас
+                </button>
+              </div>
+            </>
+          )}
+        </div>
+      )}
+
+      {/* === Simulation Tab === */}
+      {tab === 'simulation' && isAdmin && (
+        <div className="sync-panel">
+          <p className="sync-hint">
+            Расчёты из истории пересчитываются по новой сетке цен и сравниваются с тем, что получили менеджеры.
+            Действующие цены не меняются: сетка сохраняется черновой версией, её можно сделать активной на вкладке «Синхронизация».
+          </p>
+          <div className="stats-filters">
+            <label>Цены, %
+              <input type="number" value={simForm.percent} disabled={!!simForm.file}
+                onChange={e => setSimForm({ ...simForm, percent: e.target.value })} />
+            </label>
+            <label>или файл цен
+              <input type="file" accept=".csv,.xlsx"
+                onChange={e => setSimForm({ ...simForm, file: e.target.files[0] || null })} />
+            </label>
+          </div>
+          <div className="stats-filters">
+            <label>История с
+              <input type="date" value={simForm.from}
+                onChange={e => setSimForm({ ...simForm, from: e.target.value })} />
+            </label>
+            <label>по
+              <input type="date" value={simForm.to}
+                onChange={e => setSimForm({ ...simForm, to: e.target.value })} />
+            </label>
+            <button className="btn btn-primary" onClick={handleStartSimulation}
+              disabled={simJob?.status === 'running' || (!simForm.file && simForm.percent === '')}>
+              Запустить
+            </button>
+          </div>
+          {simError && <div className="login-error">{simError}</div>}
+
+          {simJob?.status === 'running' && (
+            <div className="update-status">Пересчитано {simJob.done} из {simJob.total || '…'}</div>
+          )}
+          {simJob?.status === 'error' && <div className="login-error">{simJob.error}</div>}
+          {simJob?.status === 'done' && simJob.result && (
+            <>
+              <div className="sync-stats">
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{simJob.result.quotes}</span>
+                  <span className="sync-stat-label">Расчётов (версия цен {simJob.version_id})</span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{formatMoney(simJob.result.totals.original)}</span>
+                  <span className="sync-stat-label">Было</span>
+                </div>
+                <div className="sync-stat">
+                  <span className="sync-stat-value">{formatMoney(simJob.result.totals.simulated)}</span>
+                  <span className="sync-stat-label">
+                    Стало ({simJob.result.totals.delta_pct ?? 0}%)
+                  </span>
+                </div>
+              </div>
+              {simJob.result.unmatched + simJob.result.failed + simJob.result.skipped > 0 && (
+                <p className="sync-hint">
+                  Не пересчитано: теплохода нет в новой сетке — {simJob.result.unmatched}, нет цены — {simJob.result.failed},
+                  старые записи без разбивки — {simJob.result.skipped}
+                </p>
+              )}
+
+              <h3>По теплоходам</h3>
+              <table className="admin-table">
+                <thead>
+                  <tr>
+                    <th>Теплоход</th>
+                    <th>Расчётов</th>
+                    <th>Было</th>
+                    <th>Стало</th>
+                    <th>Разница</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {simJob.result.by_boat.map(b => (
+                    <tr key={b.boat}>
+                      <td>{b.boat}</td>
+                      <td>{b.quotes}</td>
+                      <td>{formatMoney(b.original)}</td>
+                      <td>{formatMoney(b.simulated)}</td>
+                      <td>{formatMoney(b.delta)}{b.delta_pct !== null && ` (${b.delta_pct}%)`}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+
+              <h3>По месяцам мероприятия</h3>
+              <table className="admin-table">
+                <thead>
+                  <tr>
+                    <th>Месяц</th>
+                    <th>Расчётов</th>
+                    <th>Было</th>
+                    <th>Стало</th>
+                    <th>Разница</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {simJob.result.by_month.map(m => (
+                    <tr key={m.month}>
+                      <td>{m.month}</td>
+                      <td>{m.quotes}</td>
+                      <td>{formatMoney(m.original)}</td>
+                      <td>{formatMoney(m.simulated)}</td>
+                      <td>{formatMoney(m.delta)}{m.delta_pct !== null && ` (${m.delta_pct}%)`}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            </>
+          )}
         </div>
       )}
     </div>
@@ -486,27 +1184,66 @@ function App() {
   const [history, setHistory] = useState([])
   const [expandedDate, setExpandedDate] = useState(null)
   const [showAdmin, setShowAdmin] = useState(false)
+  const [bootstrap, setBootstrap] = useState(null)
   const [showHint, setShowHint] = useState(() => localStorage.getItem('navibot_hide_hint') !== '1')
 
+  const loadBootstrap = async () => {
+    const { ok, data } = await fetchBootstrap()
+    if (ok) {
+      setUser(data.me)
+      setHistory(data.history)
+      setBootstrap(data)
+    }
+    return ok
+  }
+
   useEffect(() => {
     const token = getToken()
     if (!token) { setAuthChecked(true); return }
-    apiFetch('/me').then(({ ok, data }) => {
-      if (ok) setUser(data.user)
-      else removeToken()
+    loadBootstrap().then(ok => {
+      if (!ok) removeToken()
       setAuthChecked(true)
     })
   }, [])
 
+  // Живые события: пока пользователь в системе, держим поток /api/events
+  useEffect(() => {
+    if (!user) return
+    const controller = new AbortController()
+    listenServerEvents(controller.signal)
+    return () => controller.abort()
+  }, [user?.id])
+
+  // Каталог или пользователи изменились — перечитать bootstrap (придут только изменившиеся
+  // секции). Серия изменений (синхронизация) схлопывается в один запрос
+  const versionsRef = useRef(null)
+  const refreshTimer = useRef(null)
+  const scheduleRefresh = () => {
+    clearTimeout(refreshTimer.current)
+    refreshTimer.current = setTimeout(loadBootstrap, 1000)
+  }
+  useServerEvent('ready', (versions) => {
+    // После переподключения — догнать то, что пропустили
+    const seen = versionsRef.current
+    if (seen && (seen.catalog !== versions.catalog || seen.users !== versions.users)) scheduleRefresh()
+    versionsRef.current = versions
+  })
+  useServerEvent('catalog', ({ version }) => {
+    versionsRef.current = { ...versionsRef.current, catalog: version }
+    scheduleRefresh()
+  })
+  useServerEvent('users', ({ version }) => {
+    versionsRef.current = { ...versionsRef.current, users: version }
+    scheduleRefresh()
+  })
+  // Поток событий не принят (503) — перечитать bootstrap по ETag вместо событий
+  useServerEvent('poll', scheduleRefresh)
+
   const loadHistory = async () => {
     const { ok, data } = await apiFetch('/history')
     if (ok) setHistory(data.history)
   }
 
-  useEffect(() => {
-    if (user) loadHistory()
-  }, [user])
-
   const handleCalculate = async () => {
     if (!text.trim()) return
     setLoading(true)
@@ -524,10 +1261,62 @@ function App() {
     }
   }
 
+  // Подсказки теплоходов для строки с курсором: запрос на каждое нажатие,
+  // устаревшие ответы отменяются
+  const textareaRef = useRef(null)
+  const suggestAbort = useRef(null)
+  const [suggest, setSuggest] = useState(null)  // { line, items, active }
+
+  const updateSuggest = async (value, caret) => {
+    const line = boatLineAt(value, caret)
+    suggestAbort.current?.abort()
+    if (!line) { setSuggest(null); return }
+    const controller = new AbortController()
+    suggestAbort.current = controller
+    try {
+      const { ok, data } = await apiFetch(`/boats/suggest?q=${encodeURIComponent(line.query)}`, { signal: controller.signal })
+      if (!ok) return
+      const items = data.suggestions.filter(b => b.name !== line.query)
+      setSuggest(items.length ? { line, items, active: 0 } : null)
+    } catch (e) {
+      if (e.name !== 'AbortError') setSuggest(null)
+    }
+  }
+
+  const handleTextChange = (e) => {
+    setText(e.target.value)
+    updateSuggest(e.target.value, e.target.selectionStart)
+  }
+
+  const acceptSuggest = (boat) => {
+    const { start, end } = suggest.line
+    const next = text.slice(0, start) + boat.name + text.slice(end)
+    const caret = start + boat.name.length
+    setText(next)
+    setSuggest(null)
+    requestAnimationFrame(() => {
+      const el = textareaRef.current
+      if (el) { el.focus(); el.setSelectionRange(caret, caret) }
+    })
+  }
+
   const handleKeyDown = (e) => {
     if (e.key === 'Enter' && e.ctrlKey) {
       e.preventDefault()
+      setSuggest(null)
       handleCalculate()
+      return
+    }
+    if (!suggest) return
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+      e.preventDefault()
+      const step = e.key === 'ArrowDown' ? 1 : -1
+      setSuggest({ ...suggest, active: (suggest.active + step + suggest.items.length) % suggest.items.length })
+    } else if (e.key === 'Enter' || e.key === 'Tab') {
+      e.preventDefault()
+      acceptSuggest(suggest.items[suggest.active])
+    } else if (e.key === 'Escape') {
+      setSuggest(null)
     }
   }
 
@@ -536,6 +1325,7 @@ function App() {
     setUser(null)
     setResults(null)
     setHistory([])
+    setBootstrap(null)
     setShowHistory(false)
     setShowAdmin(false)
   }
@@ -557,11 +1347,11 @@ function App() {
   const canAccessAdmin = user && (user.role === 'admin' || user.role === 'editor')
 
   if (!authChecked) return <div className="loading">Загрузка...</div>
-  if (!user) return <LoginScreen onLogin={setUser} />
+  if (!user) return <LoginScreen onLogin={(u) => { setUser(u); loadBootstrap() }} />
   if (showAdmin) return (
     <div className="app">
       <main className="main">
-        <AdminPanel onBack={() => setShowAdmin(false)} user={user} />
+        <AdminPanel onBack={() => { setShowAdmin(false); loadBootstrap() }} user={user} initial={bootstrap} />
       </main>
     </div>
   )
@@ -573,7 +1363,7 @@ function App() {
         <h1>NaviBot</h1>
         <p className="subtitle">Расчёт стоимости аренды теплоходов</p>
         <div className="user-bar">
-          <UserAvatar avatar={user.avatar} name={user.display_name} size={28} />
+          <UserAvatar urls={user.avatar_urls} name={user.display_name} size={28} />
           <span className="user-name">{user.display_name}</span>
           {canAccessAdmin && (
             <button className="btn-small" onClick={() => setShowAdmin(true)}>
@@ -591,22 +1381,37 @@ function App() {
               <button className="hint-close" onClick={() => { setShowHint(false); localStorage.setItem('navibot_hide_hint', '1') }}>&times;</button>
               <strong>Формат запроса:</strong>
               <div className="format-example">
-                <code>Дата (dd.mm.yy)</code>
+                <code>Дата (dd.mm.yy, «пт», «завтра»)</code>
                 <code>Название теплохода</code>
-                <code>Время (HH:MM-HH:MM или HH:MM-HH:MM-HH:MM-HH:MM)</code>
+                <code>Время (18-23, 18.00-23.30, с 18 до 23 или 16-17-23-23:30)</code>
               </div>
-              <p className="hint-note">Можно отправить несколько запросов — по 3 строки на каждый</p>
+              <p className="hint-note">Можно отправить несколько запросов — по 3 строки на каждый; ошибка в одном не мешает остальным</p>
             </div>
           )}
 
-          <textarea
-            className="input-textarea"
-            value={text}
-            onChange={(e) => setText(e.target.value)}
-            onKeyDown={handleKeyDown}
-            placeholder={"16.08.26\nХемингуэй\n16-17-23-23:30"}
-            rows={6}
-          />
+          <div className="input-wrap">
+            <textarea
+              ref={textareaRef}
+              className="input-textarea"
+              value={text}
+              onChange={handleTextChange}
+              onKeyDown={handleKeyDown}
+              onBlur={() => setSuggest(null)}
+              placeholder={"16.08.26\nХемингуэй\n16-17-23-23:30"}
+              rows={6}
+            />
+            {suggest && (
+              <ul className="boat-suggest">
+                {suggest.items.map((boat, i) => (
+                  <li key={boat.id} className={i === suggest.active ? 'active' : ''}
+                    onMouseDown={(e) => { e.preventDefault(); acceptSuggest(boat) }}>
+                    <span className="boat-suggest-name">{boat.name}</span>
+                    {boat.dock && <span className="boat-suggest-dock">{boat.dock}</span>}
+                  </li>
+                ))}
+              </ul>
+            )}
+          </div>
 
           <div className="buttons">
             <button className="btn btn-primary" onClick={handleCalculate}
@@ -694,8 +1499,9 @@ function App() {
                             </div>
                             {entry.results?.map((item, i) => (
                               <div key={i} className="history-result">
-                                {item.result ? (
-                                  <pre className="result-text" dangerouslySetInnerHTML={{ __html: formatResult(item.result) }} />
+                                {item.result || item.quote ? (
+                                  <pre className="result-text"
+                                    dangerouslySetInnerHTML={{ __html: formatResult(item.result ?? quoteMarkdown(item.quote)) }} />
                                 ) : (
                                   <div className="result-error">{item.error}</div>
                                 )}
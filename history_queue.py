@@ -0,0 +1,172 @@
+"""
+Отложенная запись истории расчётов (write-behind).
+
+/api/calculate кладёт расчёт в ограниченную очередь процесса и сразу отвечает;
+фоновый поток забирает всё накопившееся и пишет пачкой одной транзакцией
+(save_calculations_batch). Пока идёт один commit, следующие расчёты копятся
+и уходят следующей пачкой — искусственной задержки нет.
+
+Очередь полна (БД надолго заблокирована) — расчёт пишется синхронно, как раньше.
+При остановке процесса (atexit) очередь дописывается до конца.
+
+Каждый расчёт получает номер; flush() (перед /api/history и /api/bootstrap) ждёт
+только номера, выданные до вызова, и не дольше FLUSH_TIMEOUT.
+
+Поток запускается лениво при первом расчёте в процессе: с gunicorn --preload
+мастер форкает воркеры, а потоки через fork не переживают.
+"""
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+
+from database import save_calculations_batch
+
+logger = logging.getLogger(__name__)
+
+# Сколько расчётов может ждать записи
+QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', '1000'))
+
+# Максимум расчётов в одной транзакции
+BATCH_SIZE = 200
+
+# Сколько ждать фоновый поток при остановке, секунд
+SHUTDOWN_TIMEOUT = 5
+
+# Сколько /api/history и /api/bootstrap ждут записи своих расчётов, секунд
+FLUSH_TIMEOUT = 2
+
+_STOP = object()
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_lock = threading.Lock()
+_state = {'pid': None, 'thread': None, 'seq': 0}
+
+# Номера расчётов, поставленных в очередь и ещё не записанных; _written будит flush()
+_pending = set()
+_written = threading.Condition()
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _write(batch):
+    try:
+        save_calculations_batch(batch)
+    except Exception as e:
+        # Пачка не записалась — пробуем по одному, чтобы не терять остальные
+        logger.error("Не удалось записать пачку истории (%d): %s", len(batch), e)
+        for row in batch:
+            try:
+                save_calculations_batch([row])
+            except Exception as row_error:
+                logger.error("Расчёт пользователя %s не сохранён: %s", row[0], row_error)
+
+
+def _drain(first=None):
+    """
+    Забрать из очереди всё, что уже есть (не больше BATCH_SIZE): элементы — (номер, расчёт).
+    Возвращает (пачка, встретился ли стоп).
+    """
+    batch = [] if first is None else [first]
+    while len(batch) < BATCH_SIZE:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _write_numbered(batch):
+    """Записать пачку (номер, расчёт) и снять её номера с ожидания (flush ждёт их)."""
+    try:
+        _write([row for _, row in batch])
+    finally:
+        with _written:
+            _pending.difference_update(seq for seq, _ in batch)
+            _written.notify_all()
+
+
+def _worker():
+    while True:
+        item = _queue.get()
+        if item is _STOP:
+            return
+        batch, stop = _drain(item)
+        _write_numbered(batch)
+        if stop:
+            return
+
+
+def _ensure_worker():
+    pid = os.getpid()
+    if _state['pid'] == pid and _state['thread'].is_alive():
+        return
+    with _lock:
+        if _state['pid'] == pid and _state['thread'].is_alive():
+            return
+        thread = threading.Thread(target=_worker, name='history-writer', daemon=True)
+        thread.start()
+        _state['pid'] = pid
+        _state['thread'] = thread
+
+
+def enqueue_calculation(user_id, input_text, results):
+    """Поставить расчёт в очередь записи; очередь полна — записать сразу."""
+    row = (user_id, input_text, results, _now())
+    _ensure_worker()
+    with _written:
+        _state['seq'] += 1
+        item = (_state['seq'], row)
+        _pending.add(item[0])
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        logger.warning("Очередь истории заполнена — пишу синхронно")
+        _write_numbered([item])
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """
+    Дождаться записи расчётов, поставленных в очередь до вызова (и тех, что фоновый
+    поток уже забрал и пишет), но не дольше timeout секунд. Поставленные после вызова
+    не ждёт — под потоком /api/calculate ожидание не растёт. Фонового потока нет
+    (остановлен) — очередь дописывается здесь же. Возвращает False, если не дождались.
+    """
+    with _written:
+        target = _state['seq']
+    thread = _state['thread']
+    if thread is None or _state['pid'] != os.getpid() or not thread.is_alive():
+        while True:
+            batch, _ = _drain()
+            if not batch:
+                break
+            _write_numbered(batch)
+            if batch[-1][0] >= target:
+                break
+    with _written:
+        done = _written.wait_for(lambda: not _pending or min(_pending) > target, timeout)
+    if not done:
+        logger.warning("История не дописана за %s с — ответ может не содержать последних расчётов", timeout)
+    return done
+
+
+def shutdown():
+    """Остановить фоновый поток и дописать очередь — вызывается при выходе процесса."""
+    thread = _state['thread']
+    if thread is not None and _state['pid'] == os.getpid() and thread.is_alive():
+        try:
+            _queue.put(_STOP, timeout=SHUTDOWN_TIMEOUT)
+        except queue.Full:
+            pass
+        thread.join(SHUTDOWN_TIMEOUT)
+    flush()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,534 @@
+"""
+Потоковый импорт теплоходов и тарифов из XLSX/CSV.
+
+Книга читается openpyxl в режиме read_only построчно, без pandas:
+память не растёт с размером файла. Строки проверяются пачками,
+валидные вставляются через executemany в одной транзакции, ошибки
+собираются построчно в отчёт.
+
+Формат листов совпадает с rental_data.xlsx:
+    "Теплоходы": Название теплохода | Ссылка | Адрес причала | Стоимость уборки | Время подготовки (ч) | Время разгрузки (ч)
+    "Цены":      Название теплохода | Сезон | Дата начала | Дата окончания | День недели | Время | Стоимость (руб/ч)
+
+CSV содержит один из этих листов — тип определяется по заголовку.
+"""
+import csv
+import datetime
+import logging
+import os
+import re
+
+from tariff_coverage import analyze_coverage
+from database import (
+    bump_cache_version, bump_catalog_version, create_pricing_version, day_range_mask, get_db, insert_price_rows,
+    set_active_pricing_version,
+)
+
+logger = logging.getLogger(__name__)
+
+BOATS_SHEET = 'Теплоходы'
+PRICES_SHEET = 'Цены'
+
+# Сколько строк проверять и вставлять за один executemany
+BATCH_SIZE = 1000
+
+# Не копим бесконечный список ошибок на "битом" файле
+MAX_ERRORS = 500
+
+# Строк цен одного теплохода в файле: пары пересечений растут квадратично,
+# у настоящих теплоходов строк — десятки
+MAX_BOAT_ROWS = 2000
+
+# Сторона блока при поиске пересечений: промежуточные матрицы — не больше 1024×1024
+OVERLAP_TILE = 1024
+
+_TIME_RE = re.compile(r'^(\d{1,2})[:.](\d{2})$')
+_DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%Y-%m-%d %H:%M:%S')
+
+
+class ImportReport:
+    """Итог импорта: счётчики и построчные ошибки."""
+
+    def __init__(self):
+        self.boats_added = 0
+        self.boats_updated = 0
+        self.prices_added = 0
+        self.errors = []
+        self.errors_total = 0
+        self.pricing_version = None
+
+    def add_error(self, sheet, row_no, message):
+        self.errors_total += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'sheet': sheet, 'row': row_no, 'error': message})
+
+    def to_dict(self):
+        return {
+            'boats_added': self.boats_added,
+            'boats_updated': self.boats_updated,
+            'prices_added': self.prices_added,
+            'errors': self.errors,
+            'errors_total': self.errors_total,
+            'pricing_version': self.pricing_version,
+        }
+
+
+# === Чтение строк ===
+
+def _row_dicts(rows):
+    """Превращает поток кортежей (первый — заголовок) в (номер строки, dict)."""
+    header = None
+    for row_no, values in enumerate(rows, start=1):
+        if header is None:
+            header = [str(h).strip() if h is not None else '' for h in values]
+            continue
+        if all(v is None or (isinstance(v, str) and not v.strip()) for v in values):
+            continue
+        yield row_no, dict(zip(header, values))
+
+
+def iter_xlsx_sheets(path, titles):
+    """Генератор (имя листа, поток строк) по книге в режиме read_only — в порядке titles."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for title in titles:
+            if title in wb.sheetnames:
+                yield title, _row_dicts(wb[title].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def iter_csv_rows(path):
+    """Поток строк CSV. Разделитель (',' или ';') определяется по заголовку."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        first = f.readline()
+        delimiter = ';' if first.count(';') > first.count(',') else ','
+        f.seek(0)
+        yield from _row_dicts(csv.reader(f, delimiter=delimiter))
+
+
+def _csv_sheet_name(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+    return PRICES_SHEET if 'Время' in header and 'Стоимость (руб/ч)' in header else BOATS_SHEET
+
+
+# === Разбор значений ===
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _number(value, default):
+    if value is None or _text(value) == '':
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(_text(value).replace(' ', '').replace('\xa0', '').replace(',', '.'))
+
+
+def parse_date_cell(value):
+    """datetime / date / строка → 'YYYY-MM-DD'."""
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    text = _text(value)
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Неверная дата: '{text}'")
+
+
+def parse_time_cell(text):
+    """'9:00' / '09.00' → '09:00'. '24:00' встречается в тарифах как полночь."""
+    m = _TIME_RE.match(text.strip())
+    ok = m and (int(m.group(1)) <= 23 and int(m.group(2)) <= 59 or m.group(0) in ('24:00', '24.00'))
+    if not ok:
+        raise ValueError(f"Неверное время: '{text}'")
+    return f"{int(m.group(1)):02d}:{m.group(2)}"
+
+
+def split_time_range(text):
+    """'10:00 - 18:00' → ('10:00', '18:00')."""
+    parts = [t.strip() for t in re.split(r'[-–]', text)]
+    if len(parts) != 2:
+        raise ValueError(f"Не удалось распарсить время '{text}'")
+    return parse_time_cell(parts[0]), parse_time_cell(parts[1])
+
+
+def _wp_slug(link):
+    if 'product/' in link:
+        return link.rstrip('/').split('product/')[-1].strip('/')
+    return None
+
+
+def _parse_boat_row(row):
+    name = _text(row.get('Название теплохода'))
+    if not name:
+        raise ValueError("Пустое название теплохода")
+    link = _text(row.get('Ссылка'))
+    return (
+        name,
+        link,
+        _text(row.get('Адрес причала')),
+        _number(row.get('Стоимость уборки'), 3000.0),
+        _number(row.get('Время подготовки (ч)'), 1.0),
+        _number(row.get('Время разгрузки (ч)'), 0.5),
+        _wp_slug(link),
+    )
+
+
+def _parse_price_row(row, boat_ids):
+    boat_name = _text(row.get('Название теплохода'))
+    if not boat_name:
+        raise ValueError("Пустое название теплохода")
+    boat_id = boat_ids.get(boat_name.lower())
+    if boat_id is None:
+        raise ValueError(f"Теплоход '{boat_name}' не найден")
+
+    d_start = parse_date_cell(row.get('Дата начала'))
+    d_end = parse_date_cell(row.get('Дата окончания'))
+    t_start, t_end = split_time_range(_text(row.get('Время')))
+    try:
+        price = _number(row.get('Стоимость (руб/ч)'), None)
+    except ValueError:
+        price = None
+    if price is None:
+        raise ValueError(f"Неверная цена: '{_text(row.get('Стоимость (руб/ч)'))}'")
+
+    return (
+        boat_id,
+        _text(row.get('Сезон')),
+        d_start,
+        d_end,
+        _text(row.get('День недели')),
+        t_start,
+        t_end,
+        price,
+    )
+
+
+# === Запись пачками ===
+
+def _load_boat_ids(conn):
+    return {row['name'].strip().lower(): row['id'] for row in conn.execute("SELECT id, name FROM boats")}
+
+
+def _flush_boats(conn, batch, boat_ids, report):
+    inserts = {}
+    updates = []
+    for values in batch:
+        key = values[0].lower()
+        boat_id = boat_ids.get(key)
+        if boat_id is None:
+            # Повтор имени внутри пачки — берём последнюю строку
+            inserts[key] = values
+        else:
+            updates.append(values[1:] + (boat_id,))
+
+    if updates:
+        conn.executemany(
+            "UPDATE boats SET link=?, dock=?, cleaning_cost=?, prep_hours=?, unload_hours=?, wp_slug=?, updated_at=datetime('now') WHERE id=?",
+            updates
+        )
+    if inserts:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM boats").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO boats (name, link, dock, cleaning_cost, prep_hours, unload_hours, wp_slug) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            list(inserts.values())
+        )
+        for row in conn.execute("SELECT id, name FROM boats WHERE id > ?", (last_id,)):
+            boat_ids[row['name'].strip().lower()] = row['id']
+    report.boats_added += len(inserts)
+    report.boats_updated += len(updates)
+
+
+def _flush_prices(conn, batch, report):
+    insert_price_rows(conn, batch, report.pricing_version)
+    report.prices_added += len(batch)
+
+
+def _import_rows(conn, sheet, rows, boat_ids, report):
+    batch = []
+    for row_no, row in rows:
+        try:
+            if sheet == BOATS_SHEET:
+                batch.append(_parse_boat_row(row))
+            else:
+                batch.append(_parse_price_row(row, boat_ids))
+        except ValueError as e:
+            report.add_error(sheet, row_no, str(e))
+            continue
+        if len(batch) >= BATCH_SIZE:
+            _flush(conn, sheet, batch, boat_ids, report)
+            batch = []
+    if batch:
+        _flush(conn, sheet, batch, boat_ids, report)
+
+
+def _flush(conn, sheet, batch, boat_ids, report):
+    if sheet == BOATS_SHEET:
+        _flush_boats(conn, batch, boat_ids, report)
+    else:
+        _flush_prices(conn, batch, report)
+
+
+def import_tariff_file(path):
+    """
+    Импорт XLSX (листы "Теплоходы" и "Цены") или CSV (один из листов).
+    Всё пишется одной транзакцией; при сбое БД изменения откатываются.
+    Строки с ошибками пропускаются и попадают в отчёт.
+    Цены дописываются к активным в новой версии цен (report.pricing_version).
+    Возвращает ImportReport.
+    """
+    report = ImportReport()
+    is_csv = os.path.splitext(path)[1].lower() == '.csv'
+
+    conn = get_db()
+    try:
+        boat_ids = _load_boat_ids(conn)
+        report.pricing_version = create_pricing_version(conn, 'excel_migration', os.path.basename(path))
+        if is_csv:
+            _import_rows(conn, _csv_sheet_name(path), iter_csv_rows(path), boat_ids, report)
+        else:
+            # Лист теплоходов первым — цены ссылаются на них по имени
+            found = False
+            for title, rows in iter_xlsx_sheets(path, (BOATS_SHEET, PRICES_SHEET)):
+                found = True
+                _import_rows(conn, title, rows, boat_ids, report)
+            if not found:
+                raise ValueError(f"В книге нет листов '{BOATS_SHEET}' и '{PRICES_SHEET}'")
+        set_active_pricing_version(conn, report.pricing_version)
+        bump_cache_version(conn, 'catalog')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_catalog_version()
+    analyze_coverage()
+
+    for err in report.errors[:20]:
+        logger.warning("Импорт: лист '%s', строка %d: %s", err['sheet'], err['row'], err['error'])
+    return report
+
+
+# === Загрузка тарифной сетки (POST /api/prices/import) ===
+
+PRICE_FIELDS = ('boat_name', 'season_name', 'date_start', 'date_end', 'day_range', 'time_start', 'time_end', 'price_per_hour')
+
+# Заголовки листа "Цены" → колонки таблицы prices
+_PRICE_HEADER_ALIASES = {
+    'Название теплохода': 'boat_name',
+    'Сезон': 'season_name',
+    'Дата начала': 'date_start',
+    'Дата окончания': 'date_end',
+    'День недели': 'day_range',
+    'Стоимость (руб/ч)': 'price_per_hour',
+    'boat': 'boat_name',
+}
+
+
+def _price_record(row):
+    """Строка файла (заголовки листа "Цены" или колонки prices) → dict с PRICE_FIELDS."""
+    rec = {_PRICE_HEADER_ALIASES.get(k, k): v for k, v in row.items()}
+    if 'Время' in rec and not rec.get('time_start'):
+        parts = re.split(r'\s*[-–]\s*', _text(rec.pop('Время')))
+        if len(parts) == 2:
+            rec['time_start'], rec['time_end'] = parts
+    return {f: rec.get(f) for f in PRICE_FIELDS}
+
+
+def price_records(items):
+    """Строки цен из JSON ([dict] с PRICE_FIELDS или заголовками листа "Цены") → [(номер строки, dict)]."""
+    return [(n, _price_record(r)) for n, r in enumerate(items, start=1) if isinstance(r, dict)]
+
+
+def read_price_upload(path):
+    """Все строки загруженного файла с ценами: [(номер строки, dict)]. В XLSX — лист "Цены" или первый лист."""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return [(n, _price_record(r)) for n, r in iter_csv_rows(path)]
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[PRICES_SHEET] if PRICES_SHEET in wb.sheetnames else wb.worksheets[0]
+        return [(n, _price_record(r)) for n, r in _row_dicts(ws.iter_rows(values_only=True))]
+    finally:
+        wb.close()
+
+
+def _time_minutes(text):
+    try:
+        t = parse_time_cell(_text(text))
+    except ValueError:
+        return -1
+    return int(t[:2]) * 60 + int(t[3:])
+
+
+def _mask_or_invalid(text):
+    try:
+        return day_range_mask(_text(text)) or -1
+    except ValueError:
+        return -1
+
+
+def _date_ordinal(value):
+    try:
+        return datetime.date.fromisoformat(parse_date_cell(value)).toordinal()
+    except ValueError:
+        return -1
+
+
+def _price_or_invalid(value):
+    try:
+        price = _number(value, None)
+    except ValueError:
+        return -1.0
+    return -1.0 if price is None else price
+
+
+def _column(values, convert, memo):
+    """Преобразует колонку через словарь уже встреченных значений — уникальных значений мало."""
+    out = []
+    for v in values:
+        key = v if isinstance(v, (str, int, float, type(None))) else str(v)
+        if key not in memo:
+            memo[key] = convert(v)
+        out.append(memo[key])
+    return out
+
+
+def _find_overlaps(boat, mask, ds, de, ts, te):
+    """
+    Пары пересекающихся строк внутри теплохода: общие даты, общие дни недели
+    и общее время. Интервал через полночь продолжается за 24:00 (как в расписании).
+    Возвращает список пар индексов (i < j).
+    """
+    import numpy as np
+
+    pairs = []
+    order = np.argsort(boat, kind='stable')
+    bounds = np.flatnonzero(np.diff(boat[order])) + 1
+    for group in np.split(order, bounds):
+        if len(group) < 2:
+            continue
+        # Блоками по обеим осям, чтобы матрица n×n не разрасталась на одном огромном теплоходе;
+        # индексы в группе возрастают, поэтому блоки j левее блока i пар (i < j) не дают
+        for i_start in range(0, len(group), OVERLAP_TILE):
+            i = group[i_start:i_start + OVERLAP_TILE][:, None]
+            for j_start in range(i_start, len(group), OVERLAP_TILE):
+                j = group[None, j_start:j_start + OVERLAP_TILE]
+                hit = (
+                    (i < j)
+                    & ((mask[i] & mask[j]) != 0)
+                    & (ds[i] <= de[j]) & (ds[j] <= de[i])
+                    & (ts[i] < te[j]) & (ts[j] < te[i])
+                )
+                ii, jj = np.nonzero(hit)
+                pairs.extend(zip(i[ii, 0].tolist(), j[0, jj].tolist()))
+    return pairs
+
+
+def validate_price_rows(rows, boat_ids):
+    """
+    Векторная проверка загруженных цен.
+    rows — [(номер строки, dict)], boat_ids — {имя в нижнем регистре: id}.
+    Проверяет теплоход, даты, формат времени, дни недели (WEEK_DAYS),
+    цену и пересечения интервалов. Пересечение с разной ценой — ошибка,
+    с одинаковой (дубли, общий день на стыке сезонов) — предупреждение.
+    Возвращает (prices_by_boat, errors, warnings).
+    """
+    import numpy as np
+
+    row_nos = [n for n, _ in rows]
+    col = {f: [r[f] for _, r in rows] for f in PRICE_FIELDS}
+    time_memo = {}
+    boat = np.array(_column(col['boat_name'], lambda v: boat_ids.get(_text(v).lower(), -1), {}), dtype=np.int64)
+    mask = np.array(_column(col['day_range'], _mask_or_invalid, {}), dtype=np.int64)
+    date_memo = {}
+    ds = np.array(_column(col['date_start'], _date_ordinal, date_memo), dtype=np.int64)
+    de = np.array(_column(col['date_end'], _date_ordinal, date_memo), dtype=np.int64)
+    ts = np.array(_column(col['time_start'], _time_minutes, time_memo), dtype=np.int64)
+    te = np.array(_column(col['time_end'], _time_minutes, time_memo), dtype=np.int64)
+    price = np.array(_column(col['price_per_hour'], _price_or_invalid, {}), dtype=np.float64)
+
+    checks = [
+        (boat < 0, lambda k: f"Теплоход '{_text(col['boat_name'][k])}' не найден"),
+        ((ds < 0) | (de < 0), lambda k: f"Неверная дата: '{_text(col['date_start'][k])}' – '{_text(col['date_end'][k])}'"),
+        ((ds >= 0) & (de >= 0) & (ds > de), lambda k: "Дата начала позже даты окончания"),
+        ((ts < 0) | (te < 0), lambda k: f"Неверное время: '{_text(col['time_start'][k])}' – '{_text(col['time_end'][k])}'"),
+        (mask < 0, lambda k: f"Неверный день недели: '{_text(col['day_range'][k])}'"),
+        (price <= 0, lambda k: f"Неверная цена: '{_text(col['price_per_hour'][k])}'"),
+    ]
+    errors = []
+    bad = np.zeros(len(rows), dtype=bool)
+    for failed, message in checks:
+        for k in np.flatnonzero(failed):
+            errors.append({'row': row_nos[k], 'error': message(k)})
+        bad |= failed
+
+    # Слишком много строк у одного теплохода — ошибка на первой его строке, пересечения не ищутся
+    known = boat >= 0
+    counts = np.bincount(boat[known]) if known.any() else np.zeros(0, dtype=np.int64)
+    for boat_id in np.flatnonzero(counts > MAX_BOAT_ROWS):
+        rows_of_boat = boat == boat_id
+        k = int(np.argmax(rows_of_boat))
+        errors.append({'row': row_nos[k], 'error': f"Теплоход '{_text(col['boat_name'][k])}': "
+                                                   f"{int(counts[boat_id])} строк цен, допустимо не больше {MAX_BOAT_ROWS}"})
+        bad |= rows_of_boat
+
+    # Интервал через полночь (23:00-10:00) продолжается до 10:00 следующего дня
+    te = np.where((te >= 0) & (te <= ts), te + 1440, te)
+    good = np.flatnonzero(~bad)
+    warnings = []
+    for a, b in _find_overlaps(boat[good], mask[good], ds[good], de[good], ts[good], te[good]):
+        a, b = good[a], good[b]
+        if price[a] != price[b]:
+            errors.append({'row': row_nos[b], 'error': f"Пересекается со строкой {row_nos[a]} с другой ценой"})
+        else:
+            warnings.append({'row': row_nos[b], 'error': f"Пересекается со строкой {row_nos[a]} (цена совпадает)"})
+
+    errors.sort(key=lambda e: e['row'])
+    if errors:
+        return {}, errors, warnings
+
+    prices_by_boat = {}
+    for k, (_, r) in enumerate(rows):
+        prices_by_boat.setdefault(int(boat[k]), []).append({
+            'season_name': _text(r['season_name']),
+            'date_start': datetime.date.fromordinal(int(ds[k])).isoformat(),
+            'date_end': datetime.date.fromordinal(int(de[k])).isoformat(),
+            'day_range': _text(r['day_range']),
+            'time_start': parse_time_cell(_text(r['time_start'])),
+            'time_end': parse_time_cell(_text(r['time_end'])),
+            'price_per_hour': float(price[k]),
+        })
+    return prices_by_boat, errors, warnings
+
+
+def _price_key(p):
+    return (p['season_name'], p['date_start'], p['date_end'], p['day_range'], p['time_start'], p['time_end'], float(p['price_per_hour']))
+
+
+def diff_prices(current, new):
+    """Разница между текущими и новыми ценами теплохода: (added, removed, unchanged)."""
+    from collections import Counter
+
+    cur = Counter(_price_key(p) for p in current)
+    nxt = Counter(_price_key(p) for p in new)
+    keys = ('season_name', 'date_start', 'date_end', 'day_range', 'time_start', 'time_end', 'price_per_hour')
+    added = [dict(zip(keys, k)) for k in (nxt - cur).elements()]
+    removed = [dict(zip(keys, k)) for k in (cur - nxt).elements()]
+    return added, removed, sum((cur & nxt).values())
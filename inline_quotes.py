@@ -0,0 +1,177 @@
+"""
+Inline-режим бота: «@navibot 14.06.26 Сицилия 18-22» в любом чате — расчёт
+прямо в списке результатов, без перехода в чат с ботом.
+
+Запрос разбирается по мере набора (request_parser.parse_partial):
+    дата, время и начало названия — расчёт для подходящих теплоходов
+        (до MAX_RESULTS; подсказки — boat_index, дерево в памяти);
+    времени ещё нет — карточки подходящих теплоходов (недонабранное время,
+        «Сицилия 18», поиску названия не мешает);
+    нет даты или теплохода — подсказка формата.
+
+Telegram присылает новый запрос на каждую набранную букву. Готовые результаты
+хранятся в памяти процесса по (теплоход, дата, время) и сбрасываются целиком,
+когда меняется снимок тарифов (версия каталога или цен): повтор, стирание и
+набор заново не считают ничего второй раз. Ошибки расчёта не запоминаются.
+Telegram тоже кеширует ответ на тот же текст (cache_time), поэтому срок зависит
+от версии цен: только что активированная (моложе FRESH_VERSION_SECONDS — её могут
+откатить) — CACHE_TIME_FRESH, устоявшаяся — CACHE_TIME, и не дольше чем до полуночи
+(«завтра», «пт» зависят от даты). Версия цен входит в id результатов.
+"""
+import datetime
+import html
+import logging
+import re
+
+from boat_index import suggest_boats
+from database import get_active_pricing_version, get_boat_by_name, get_catalog_version, get_pricing_activated_at
+from pricing_snapshot import get_snapshot
+from rental_calculator import price_quote
+from request_parser import parse_partial
+
+logger = logging.getLogger(__name__)
+
+# Сколько теплоходов показывать в результатах
+MAX_RESULTS = 5
+
+# Срок кеша ответа на стороне Telegram, секунд: устоявшаяся версия цен / свежая
+CACHE_TIME = 300
+CACHE_TIME_FRESH = 10
+
+# Версия цен моложе — считается свежей, секунд
+FRESH_VERSION_SECONDS = 3600
+
+# Сколько готовых результатов держать в памяти
+QUOTE_CACHE_MAX = 2048
+
+FORMAT_HINT = "Формат: 14.06.26 Сицилия 18-22"
+
+_state = {'stamp': None, 'quotes': {}}
+
+# Недонабранное время в конце запроса: «18», «18:», «18-», «с», «до»
+_PARTIAL_TIME_WORD = re.compile(r'^(?:[\d:.\-–—]+|с|до)$', re.IGNORECASE)
+
+
+def _fmt_times(times):
+    return "–".join(t.strftime('%H:%M') for t in times)
+
+
+def _stamp(snap):
+    """Версия данных, по которым считаются результаты: (каталог, цены)."""
+    if snap is not None:
+        return snap.version, snap.pricing_version
+    return get_catalog_version(), get_active_pricing_version()
+
+
+def _find_boat(snap, name):
+    return snap.find_boat(name) if snap is not None else get_boat_by_name(name)
+
+
+def _lookup_boats(snap, boat_text):
+    """Точное совпадение названия — один теплоход, иначе подсказки по началу слов."""
+    exact = _find_boat(snap, boat_text)
+    if exact:
+        return [exact]
+    boats = (_find_boat(snap, b['name']) for b in suggest_boats(boat_text, MAX_RESULTS))
+    return [b for b in boats if b]
+
+
+def _matching_boats(snap, boat_text):
+    """
+    Теплоходы по набранному названию. Ничего не нашлось — в конце может быть
+    недонабранное время («Сицилия 18», «Сицилия с»): такие слова отбрасываются
+    по одному, пока что-то не найдётся.
+    """
+    words = boat_text.split()
+    while words:
+        boats = _lookup_boats(snap, ' '.join(words))
+        if boats or not _PARTIAL_TIME_WORD.match(words[-1]):
+            return boats
+        words.pop()
+    return []
+
+
+def _quote_result(snap, stamp, boat, date, times):
+    """Результат с расчётом — из кеша или посчитанный. Ошибки расчёта не кешируются."""
+    if _state['stamp'] != stamp:
+        _state['quotes'] = {}
+        _state['stamp'] = stamp
+    quotes = _state['quotes']
+    key = (boat['id'], date, tuple(times))
+    result = quotes.get(key)
+    if result is not None:
+        return result
+
+    pricing_version = stamp[1]
+    result_id = f"q{pricing_version}-{boat['id']}-{date:%y%m%d}-{'-'.join(t.strftime('%H%M') for t in times)}"
+    try:
+        quote = price_quote(boat, date, times, snap, pricing_version)
+        result = {
+            'id': result_id,
+            'title': f"{quote.boat_name} — {int(quote.total):,} ₽".replace(",", " "),
+            'description': f"{date:%d.%m.%y} {_fmt_times(times)} · {quote.dock}",
+            'text': quote.to_telegram(),
+        }
+    except Exception as e:
+        logger.error("Ошибка inline-расчёта %s: %s", boat['name'], e)
+        return {
+            'id': result_id,
+            'title': f"{boat['name']} — ошибка расчёта",
+            'description': str(e),
+            'text': html.escape(f"Ошибка при обработке запроса: {boat['name']}, {date:%d.%m.%y} "
+                                f"{_fmt_times(times)}\nОшибка: {e}"),
+        }
+    if len(quotes) >= QUOTE_CACHE_MAX:
+        quotes.clear()
+    quotes[key] = result
+    return result
+
+
+def _boat_card(stamp, boat, date):
+    """Теплоход без времени: карточка с причалом и ссылкой."""
+    return {
+        'id': f"b{stamp[1]}-{boat['id']}",
+        'title': boat['name'],
+        'description': f"Добавьте время{f' на {date:%d.%m.%y}' if date else ''}, например 18-22 · {boat.get('dock') or ''}",
+        'text': f"<b>{html.escape(boat['name'])}</b> - {html.escape(boat.get('link') or '')}\n"
+                f"Причал: {html.escape(boat.get('dock') or '')}",
+    }
+
+
+def cache_time(now=None):
+    """Срок кеша ответа в Telegram по возрасту активной версии цен, не дольше чем до полуночи."""
+    now = now or datetime.datetime.now()
+    seconds = CACHE_TIME
+    try:
+        activated = datetime.datetime.strptime(get_pricing_activated_at(), '%Y-%m-%d %H:%M:%S')
+        age = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - activated
+        if age.total_seconds() < FRESH_VERSION_SECONDS:
+            seconds = CACHE_TIME_FRESH
+    except (TypeError, ValueError):
+        seconds = CACHE_TIME_FRESH
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return max(0, min(seconds, int((midnight - now).total_seconds())))
+
+
+def answer(text, today=None):
+    """
+    Текст inline-запроса → {'results': [{'id', 'title', 'description', 'text' (HTML)}],
+    'hint': подсказка, если результатов нет, 'cache_time': секунд}.
+    Блокирующая часть (снимок, SQLite) — вызывать в пуле потоков.
+    """
+    date, boat_text, times = parse_partial(text, today)
+    snap = get_snapshot()
+    stamp = _stamp(snap)
+    boats = _matching_boats(snap, boat_text)
+
+    if date is not None and times is not None:
+        results = [_quote_result(snap, stamp, boat, date, times) for boat in boats]
+    else:
+        results = [_boat_card(stamp, boat, date) for boat in boats]
+
+    hint = None
+    if not results:
+        hint = f"Теплоход «{boat_text}» не найден" if boat_text and date is not None else FORMAT_HINT
+    elif date is None:
+        hint = FORMAT_HINT
+    return {'results': results, 'hint': hint, 'cache_time': cache_time()}
@@ -0,0 +1,96 @@
+"""
+JSON для API и истории: orjson, если установлен, иначе стандартный json.
+
+Ответы почти целиком кириллица: стандартный jsonify (ensure_ascii) пишет каждую
+букву как \\uXXXX — 6 байт вместо 2 в UTF-8. FastJSONProvider отдаёт UTF-8 как
+есть и с orjson собирает тело сразу в bytes, без промежуточной строки. Даты,
+dataclass и прочее, что orjson умеет сам, всё равно идут через default Flask —
+формат ответов не меняется. Порядок ключей — как в словаре (без sort_keys).
+
+compress_response — gzip для больших JSON-ответов: меньше COMPRESS_MIN_BYTES
+не сжимается (заголовки дороже выигрыша), больше COMPRESS_FAST_ABOVE — быстрым
+уровнем, чтобы не упираться в CPU воркера.
+
+Замер: python3 benchmarks/json_bench.py
+"""
+import gzip
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Ответ меньше — не сжимается, байт
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+# Уровень gzip; для ответов больше COMPRESS_FAST_ABOVE — COMPRESS_FAST_LEVEL
+COMPRESS_LEVEL = 6
+COMPRESS_FAST_ABOVE = 1024 * 1024
+COMPRESS_FAST_LEVEL = 1
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def dumps(obj):
+    """Компактная строка JSON без \\u-экранирования (для хранения в TEXT)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=_OPTIONS).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    """str / bytes JSON → объект (results_json истории и т.п.)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify / request.get_json через orjson; без него — json с ensure_ascii=False."""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress_response(response, accept_encodings):
+    """gzip для JSON-ответа 200 не меньше COMPRESS_MIN_BYTES, если клиент его принимает."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not accept_encodings['gzip']:
+        return response
+
+    level = COMPRESS_FAST_LEVEL if len(data) > COMPRESS_FAST_ABOVE else COMPRESS_LEVEL
+    response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # Сжатое тело — другое представление: ETag становится слабым, как у nginx gzip
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,341 @@
+"""
+Обслуживание navibot.db: онлайн-бекап, статистика планировщика запросов, освобождение места.
+
+Синхронизации и загрузки пишут цены новыми версиями, история растёт — файл
+пухнет, освободившиеся страницы остаются внутри. Раз в INTERVAL_HOURS один из
+процессов сервера выполняет:
+    1. бекап через SQLite online backup API за один проход: в режиме WAL
+       это одна читающая транзакция, запись в БД её не ждёт; файл
+       backups/navibot-YYYYmmdd-HHMMSS.db проверяется quick_check,
+       хранятся BACKUP_KEEP последних;
+    2. удаление старых версий цен (database.prune_pricing_versions): хранятся
+       PRICING_VERSIONS_KEEP последних, активная и те, по которым есть расчёты
+       в истории или симуляции;
+    3. ANALYZE (с analysis_limit) и PRAGMA optimize — статистика для планировщика;
+    4. PRAGMA incremental_vacuum — свободные страницы отдаются ОС порциями
+       по VACUUM_STEP_PAGES, каждая — своя короткая транзакция;
+    5. PRAGMA wal_checkpoint(TRUNCATE) — WAL переносится в БД и обрезается.
+БД, созданную до auto_vacuum = INCREMENTAL, обслуживание не переводит: для
+этого нужен полный VACUUM, который на всё время держит запись. Шаг 4 для неё
+пропускается; перевод — вручную, один раз, в тихое время:
+    python3 maintenance.py convert-auto-vacuum
+
+Запуск — строка maintenance_runs, вставленная под BEGIN IMMEDIATE: из
+нескольких воркеров gunicorn обслуживание выполняет один. Поток расписания —
+свой в каждом процессе, запускается лениво (ensure_scheduler), как в events.py.
+"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import database
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Как часто обслуживать, часов (0 — только вручную)
+INTERVAL_HOURS = float(os.environ.get('MAINTENANCE_INTERVAL_HOURS', '24'))
+
+# Каталог бекапов; пусто — backups/ рядом с БД
+BACKUP_DIR = os.environ.get('BACKUP_DIR', '')
+
+# Сколько последних бекапов хранить
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '7'))
+
+# Сколько последних версий цен хранить (0 — не удалять)
+PRICING_VERSIONS_KEEP = int(os.environ.get('PRICING_VERSIONS_KEEP', '30'))
+
+# Страниц за одну порцию incremental_vacuum и пауза между порциями, секунд
+VACUUM_STEP_PAGES = 512
+VACUUM_STEP_SLEEP = 0.05
+
+# Строк индекса, которые ANALYZE просматривает (приближённая статистика)
+ANALYSIS_LIMIT = 1000
+
+# Как часто поток расписания проверяет, не пора ли, секунд
+CHECK_INTERVAL = 600
+
+_AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+_lock = threading.Lock()
+_state = {'pid': None, 'thread': None}
+
+
+class MaintenanceBusy(RuntimeError):
+    """Обслуживание уже идёт."""
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def backup_dir():
+    return BACKUP_DIR or os.path.join(os.path.dirname(database.DB_PATH), 'backups')
+
+
+# === Состояние БД ===
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _database_stats(conn):
+    page_size = _pragma(conn, 'page_size')
+    page_count = _pragma(conn, 'page_count')
+    freelist = _pragma(conn, 'freelist_count')
+    wal_path = database.DB_PATH + '-wal'
+    return {
+        'size_bytes': page_size * page_count,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+        'free_bytes': page_size * freelist,
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        'journal_mode': _pragma(conn, 'journal_mode'),
+        'auto_vacuum': _AUTO_VACUUM.get(_pragma(conn, 'auto_vacuum')),
+    }
+
+
+def database_info():
+    """Размер файла, свободные страницы, WAL и режимы журнала / auto_vacuum."""
+    conn = get_db()
+    try:
+        return _database_stats(conn)
+    finally:
+        conn.close()
+
+
+def get_backups():
+    """Файлы бекапов, новые первыми: [{name, size_bytes, created_at}]."""
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not (name.startswith('navibot-') and name.endswith('.db')):
+            continue
+        st = os.stat(os.path.join(directory, name))
+        backups.append({
+            'name': name,
+            'size_bytes': st.st_size,
+            'created_at': datetime.datetime.fromtimestamp(st.st_mtime, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    return backups
+
+
+# === Шаги ===
+
+def backup():
+    """
+    Онлайн-бекап в backups/ → (имя файла, байт). Пишется во временный файл и
+    переименовывается после проверки; лишние старые бекапы удаляются.
+    """
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"navibot-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d-%H%M%S}.db"
+    path = os.path.join(directory, name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    src = get_db()
+    dst = sqlite3.connect(tmp)
+    try:
+        # Один проход (pages=-1): при копировании шагами любая запись в источник
+        # между шагами начинает бекап заново — под постоянной записью истории,
+        # событий и синхронизаций он мог бы не закончиться. В WAL читающая
+        # транзакция прохода писателей не блокирует
+        src.backup(dst)
+        check = dst.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            raise RuntimeError(f"Бекап не прошёл проверку: {check}")
+    except Exception:
+        dst.close()
+        os.remove(tmp)
+        raise
+    finally:
+        src.close()
+    dst.close()
+    os.replace(tmp, path)
+
+    for old in get_backups()[BACKUP_KEEP:]:
+        os.remove(os.path.join(directory, old['name']))
+    return name, os.path.getsize(path)
+
+
+def convert_auto_vacuum():
+    """
+    Перевести БД на auto_vacuum = INCREMENTAL полным VACUUM → True, если переводили.
+    На всё время VACUUM запись в БД ждёт — только вручную (CLI), не из сервера.
+    """
+    conn = get_db()
+    try:
+        if _pragma(conn, 'auto_vacuum') == 2:
+            return False
+        started = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info("БД переведена на auto_vacuum = INCREMENTAL (VACUUM %.1f с)", time.monotonic() - started)
+        return True
+    finally:
+        conn.close()
+
+
+def _incremental_vacuum(conn):
+    if _pragma(conn, 'auto_vacuum') != 2:
+        logger.info("incremental_vacuum пропущен: БД без auto_vacuum = INCREMENTAL "
+                    "(перевод: python3 maintenance.py convert-auto-vacuum)")
+        return
+    free = _pragma(conn, 'freelist_count')
+    while free:
+        # fetchall — прагма освобождает страницы по мере чтения результата
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+        left = _pragma(conn, 'freelist_count')
+        if left >= free:
+            break
+        free = left
+        time.sleep(VACUUM_STEP_SLEEP)
+
+
+def _checkpoint(conn):
+    busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return 'busy' if busy else 'ok'
+
+
+# === Задание ===
+
+def _update(job_id, **fields):
+    conn = get_db()
+    try:
+        conn.execute(
+            f"UPDATE maintenance_runs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+            list(fields.values()) + [job_id]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run(job_id):
+    started = time.monotonic()
+    conn = get_db()
+    try:
+        before = _database_stats(conn)
+        _update(job_id, size_before=before['size_bytes'], freelist_before=before['freelist_pages'])
+
+        name, size = backup()
+        _update(job_id, backup_name=name, backup_bytes=size)
+
+        if PRICING_VERSIONS_KEEP > 0:
+            database.prune_pricing_versions(PRICING_VERSIONS_KEEP)
+
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        _incremental_vacuum(conn)
+        checkpoint = _checkpoint(conn)
+
+        after = _database_stats(conn)
+        _update(job_id, status='done', checkpoint=checkpoint, size_after=after['size_bytes'],
+                freelist_after=after['freelist_pages'], finished_at=_now())
+        logger.info("Обслуживание БД %d: бекап %s, размер %d → %d, свободных страниц %d → %d, %.1f с",
+                    job_id, name, before['size_bytes'], after['size_bytes'],
+                    before['freelist_pages'], after['freelist_pages'], time.monotonic() - started)
+    except Exception as e:
+        logger.error("Обслуживание БД %d не выполнено: %s", job_id, e)
+        _update(job_id, status='error', error=str(e), finished_at=_now())
+    finally:
+        conn.close()
+
+
+def _claim(kind, due_only=False):
+    """
+    Строка нового запуска → id. Уже идёт — MaintenanceBusy; due_only и с прошлого
+    запуска не прошло INTERVAL_HOURS — None.
+    """
+    with _lock:
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM maintenance_runs WHERE status = 'running'").fetchone():
+                raise MaintenanceBusy("Обслуживание БД уже идёт")
+            if due_only:
+                cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                          - datetime.timedelta(hours=INTERVAL_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+                if conn.execute("SELECT 1 FROM maintenance_runs WHERE started_at > ?", (cutoff,)).fetchone():
+                    conn.rollback()
+                    return None
+            job_id = conn.execute("INSERT INTO maintenance_runs (kind) VALUES (?)", (kind,)).lastrowid
+            conn.commit()
+            return job_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def start_maintenance():
+    """Запустить обслуживание вручную в фоновом потоке → id; идёт другое — MaintenanceBusy."""
+    job_id = _claim('manual')
+    threading.Thread(target=_run, args=(job_id,), name=f'maintenance-{job_id}', daemon=True).start()
+    return job_id
+
+
+def _schedule():
+    while True:
+        time.sleep(CHECK_INTERVAL)
+        try:
+            job_id = _claim('schedule', due_only=True)
+        except MaintenanceBusy:
+            continue
+        except Exception as e:
+            logger.error("Ошибка расписания обслуживания БД: %s", e)
+            continue
+        if job_id is not None:
+            _run(job_id)
+
+
+def ensure_scheduler():
+    """Поток расписания в этом процессе (после fork потоки мастера не существуют)."""
+    pid = os.getpid()
+    if INTERVAL_HOURS <= 0 or _state['pid'] == pid:
+        return
+    with _lock:
+        if _state['pid'] == pid:
+            return
+        thread = threading.Thread(target=_schedule, name='maintenance-scheduler', daemon=True)
+        thread.start()
+        _state['pid'] = pid
+        _state['thread'] = thread
+
+
+def get_maintenance_runs(limit=10):
+    """Последние запуски, новые первыми."""
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def fail_interrupted():
+    """Запуски, оставшиеся 'running' после остановки сервера, — в ошибку (при старте)."""
+    conn = get_db()
+    try:
+        conn.execute(
+            "UPDATE maintenance_runs SET status = 'error', error = 'Прервано перезапуском сервера', "
+            "finished_at = datetime('now') WHERE status = 'running'"
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    if sys.argv[1:] != ['convert-auto-vacuum']:
+        sys.exit("Использование: python3 maintenance.py convert-auto-vacuum")
+    if not convert_auto_vacuum():
+        print("БД уже в режиме auto_vacuum = INCREMENTAL")
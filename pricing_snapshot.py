@@ -0,0 +1,283 @@
+"""
+Бинарный снимок тарифов, общий для всех процессов (воркеры Gunicorn, Telegram-бот).
+
+Файл navibot.pricing рядом с БД содержит теплоходы, индекс имён и собранные
+таблицы тарифных дней (tariff_days.py). Каждый процесс отображает его через mmap
+и читает записи struct.unpack_from прямо из страниц файла — страницы лежат
+в page cache один раз на все процессы, сколько бы воркеров ни было.
+
+Снимок помечен версией каталога (database.get_catalog_version) и хранит цены
+активной версии цен (номер — в заголовке). После записи в boats / prices и
+после смены активной версии цен версия каталога меняется, и первый же читатель
+пересобирает снимок; синхронизация и импорт пересобирают его сразу (refresh_snapshot).
+Запись атомарная: временный файл + os.replace.
+
+Формат (little-endian):
+    HEADER    magic, версия формата, версия каталога, версия цен, число теплоходов / имён / классов /
+              расписаний / интервалов / разовых праздников, размер строк
+    BOATS     id, уборка, подготовка, разгрузка, смещения строк name/link/dock
+    NAMES     отсортированные нормализованные имена → индекс теплохода (бинарный поиск)
+    DAYS      по 366 значений на теплоход: класс * 8 + слот праздника
+    WEEKS     класс → 7 номеров расписаний (Пн..Вс)
+    SCHEDULES первый интервал и число интервалов расписания
+    SLOTS     time_start_min, time_end_min, price — интервалы расписаний по времени начала
+    DATED     разовые праздники: ordinal даты, день недели тарифа
+    STRINGS   UTF-8
+"""
+import datetime
+import logging
+import mmap
+import os
+import struct
+import threading
+
+import database
+from database import get_db, get_catalog_version
+from tariff_days import DAYS_IN_TABLE, DayTables, date_index, priced_weekday, split_holidays
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NBPS'
+FORMAT_VERSION = 3
+
+HEADER = struct.Struct('<4sH32sIIIIIIII')
+BOAT = struct.Struct('<idddIIIIII')
+NAME = struct.Struct('<III')
+DAY = struct.Struct('<i')
+WEEK = struct.Struct('<7I')
+SCHEDULE = struct.Struct('<II')
+SLOT = struct.Struct('<HHd')
+DATED = struct.Struct('<iB')
+
+_lock = threading.Lock()
+_state = {'stat': None, 'snapshot': None}
+
+
+def snapshot_path():
+    return os.path.splitext(database.DB_PATH)[0] + '.pricing'
+
+
+def normalize_name(name):
+    """Ключ поиска теплохода: без регистра и различия ё/е — как get_boat_by_name."""
+    return name.strip().lower().replace('ё', 'е')
+
+
+# === Запись ===
+
+def build_snapshot(pricing_version=None, path=None):
+    """
+    Собирает снимок из SQLite и атомарно заменяет файл. Возвращает версию каталога снимка.
+    pricing_version / path — снимок другой версии цен в отдельный файл (симулятор тарифов).
+    """
+    # Версию берём до чтения данных: если запись случится во время сборки,
+    # снимок окажется устаревшим и будет пересобран, а не наоборот
+    version = get_catalog_version()
+
+    conn = get_db()
+    try:
+        # Одна транзакция чтения: цены и номер версии цен согласованы
+        conn.execute("BEGIN")
+        if pricing_version is None:
+            pricing_version = conn.execute("SELECT version_id FROM pricing_active").fetchone()[0]
+        boats = conn.execute("SELECT * FROM boats ORDER BY id").fetchall()
+        prices = conn.execute(
+            "SELECT boat_id, season_start_md, season_end_md, time_start_min, time_end_min, weekday_mask, price_per_hour "
+            "FROM prices WHERE version_id = ? AND season_start_md IS NOT NULL AND time_start_min IS NOT NULL "
+            "AND time_end_min IS NOT NULL AND weekday_mask IS NOT NULL "
+            "ORDER BY boat_id, time_start_min, id",
+            (pricing_version,)
+        ).fetchall()
+        holidays = conn.execute("SELECT month, day, year, priced_as FROM holidays").fetchall()
+    finally:
+        conn.rollback()
+        conn.close()
+
+    strings = bytearray()
+
+    def add_string(text):
+        data = (text or '').encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    by_boat = {}
+    for row in prices:
+        by_boat.setdefault(row['boat_id'], []).append(tuple(row)[1:])
+    recurring, dated = split_holidays(tuple(h) for h in holidays)
+
+    tables = DayTables()
+    boat_blob = bytearray()
+    day_blob = bytearray()
+    names = []
+    for idx, b in enumerate(boats):
+        day_blob += tables.add_boat(by_boat.get(b['id'], []), recurring).tobytes()
+        name = add_string(b['name'])
+        link = add_string(b['link'])
+        dock = add_string(b['dock'])
+        boat_blob += BOAT.pack(
+            b['id'], float(b['cleaning_cost'] or 0), float(b['prep_hours'] or 0), float(b['unload_hours'] or 0),
+            *name, *link, *dock
+        )
+        names.append((normalize_name(b['name']).encode('utf-8'), idx))
+
+    names.sort()
+    name_blob = bytearray()
+    for key, idx in names:
+        offset, length = add_string(key.decode('utf-8'))
+        name_blob += NAME.pack(offset, length, idx)
+
+    week_blob = b''.join(WEEK.pack(*week) for week in tables.weeks)
+    schedule_blob = bytearray()
+    slot_blob = bytearray()
+    first = 0
+    for intervals in tables.schedules:
+        schedule_blob += SCHEDULE.pack(first, len(intervals))
+        for t_start, t_end, price in intervals:
+            slot_blob += SLOT.pack(t_start, t_end, float(price))
+        first += len(intervals)
+    dated_blob = b''.join(DATED.pack(ordinal, weekday) for ordinal, weekday in sorted(dated.items()))
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, version.encode('ascii')[:32], pricing_version,
+                         len(boats), len(names), len(tables.weeks), len(tables.schedules), first,
+                         len(dated), len(strings))
+
+    path = path or snapshot_path()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(boat_blob)
+        f.write(name_blob)
+        f.write(day_blob)
+        f.write(week_blob)
+        f.write(schedule_blob)
+        f.write(slot_blob)
+        f.write(dated_blob)
+        f.write(strings)
+    os.replace(tmp, path)
+    return version
+
+
+# === Чтение ===
+
+class PricingSnapshot:
+    """Снимок, отображённый в память. Записи читаются по требованию, без копирования таблиц."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, fmt, version, self.pricing_version, self.n_boats, self.n_names, n_weeks, n_schedules, n_slots,
+         n_dated, strings_size) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError("Неизвестный формат снимка тарифов")
+        self.version = version.rstrip(b'\0').decode('ascii')
+        self._boats_off = HEADER.size
+        self._names_off = self._boats_off + self.n_boats * BOAT.size
+        self._days_off = self._names_off + self.n_names * NAME.size
+        self._weeks_off = self._days_off + self.n_boats * DAYS_IN_TABLE * DAY.size
+        self._schedules_off = self._weeks_off + n_weeks * WEEK.size
+        self._slots_off = self._schedules_off + n_schedules * SCHEDULE.size
+        dated_off = self._slots_off + n_slots * SLOT.size
+        self._strings_off = dated_off + n_dated * DATED.size
+        # Разовых праздников единицы — держим словарём
+        self.dated = dict(DATED.unpack_from(self._mm, dated_off + i * DATED.size) for i in range(n_dated))
+
+    def _string(self, offset, length):
+        start = self._strings_off + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _boat(self, idx):
+        (boat_id, cleaning, prep, unload,
+         name_off, name_len, link_off, link_len, dock_off, dock_len) = BOAT.unpack_from(self._mm, self._boats_off + idx * BOAT.size)
+        return {
+            'id': boat_id,
+            'name': self._string(name_off, name_len),
+            'link': self._string(link_off, link_len),
+            'dock': self._string(dock_off, dock_len),
+            'cleaning_cost': cleaning,
+            'prep_hours': prep,
+            'unload_hours': unload,
+            '_index': idx,
+        }
+
+    def boats(self):
+        """Все теплоходы снимка (в порядке id)."""
+        return [self._boat(idx) for idx in range(self.n_boats)]
+
+    def find_boat(self, name):
+        """Бинарный поиск по нормализованному имени → dict теплохода или None."""
+        key = normalize_name(name).encode('utf-8')
+        lo, hi = 0, self.n_names
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, idx = NAME.unpack_from(self._mm, self._names_off + mid * NAME.size)
+            start = self._strings_off + offset
+            probe = self._mm[start:start + length]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return self._boat(idx)
+        return None
+
+    def schedule(self, boat, day):
+        """Тарифные интервалы теплохода на дату — как get_pricing_schedule_db: индекс в таблице дней."""
+        value, = DAY.unpack_from(self._mm, self._days_off + (boat['_index'] * DAYS_IN_TABLE + date_index(day)) * DAY.size)
+        week = WEEK.unpack_from(self._mm, self._weeks_off + (value >> 3) * WEEK.size)
+        first, count = SCHEDULE.unpack_from(self._mm, self._schedules_off + week[priced_weekday(day, value, self.dated)] * SCHEDULE.size)
+        day_start = datetime.datetime.combine(day, datetime.time())
+        schedule = []
+        offset = self._slots_off + first * SLOT.size
+        for _ in range(count):
+            t_start, t_end, price = SLOT.unpack_from(self._mm, offset)
+            offset += SLOT.size
+            dt_start = day_start + datetime.timedelta(minutes=t_start)
+            dt_end = day_start + datetime.timedelta(minutes=t_end)
+            if t_start >= t_end:
+                dt_end += datetime.timedelta(days=1)
+            schedule.append((dt_start, dt_end, price))
+        return schedule
+
+
+def _open_current():
+    """Открыть файл снимка, если он сменился с прошлого раза (один stat())."""
+    path = snapshot_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _state['stat'] != key:
+        try:
+            _state['snapshot'] = PricingSnapshot(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Не удалось открыть снимок тарифов: %s", e)
+            _state['snapshot'] = None
+        _state['stat'] = key
+    return _state['snapshot']
+
+
+def get_snapshot():
+    """
+    Актуальный снимок текущей версии каталога. Если файла нет или он устарел —
+    пересобирает. При ошибке возвращает None, вызывающий идёт в SQLite.
+    """
+    snap = _open_current()
+    if snap is not None and snap.version == get_catalog_version():
+        return snap
+    with _lock:
+        snap = _open_current()
+        if snap is not None and snap.version == get_catalog_version():
+            return snap
+        try:
+            build_snapshot()
+        except Exception as e:
+            logger.error("Не удалось собрать снимок тарифов: %s", e)
+            return None
+        return _open_current()
+
+
+def refresh_snapshot():
+    """Пересобрать снимок после синхронизации / импорта / правки, если он устарел."""
+    get_snapshot()
+
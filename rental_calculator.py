@@ -1,6 +1,9 @@
 import datetime
+import html
 import logging
-from database import get_boat_by_name, get_pricing_schedule_db, get_boat_count
+from database import get_boat_by_name, get_pricing_schedule_db, get_boat_count, get_active_pricing_version, get_pricing_version
+from pricing_snapshot import get_snapshot
+from request_parser import parse_message
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,88 +24,314 @@ def parse_time_range(range_str):
     return start, end
 
 
-def compute_overlap(seg_start, seg_end, int_start, int_end):
-    latest_start = max(seg_start, int_start)
-    earliest_end = min(seg_end, int_end)
-    delta = (earliest_end - latest_start).total_seconds() / 3600.0
-    return max(delta, 0)
+def day_schedule(boat, day, snap=None, version_id=None):
+    """Тарифные интервалы теплохода на один тарифный день (без снимка — версии цен version_id)."""
+    if snap:
+        return snap.schedule(boat, day)
+    return get_pricing_schedule_db(boat['name'], day, version_id)
 
 
-def calculate_segment_cost_and_hours(seg_start, seg_end, schedule, discount_factor=1.0):
-    total_hours = (seg_end - seg_start).total_seconds() / 3600.0
-    effective_hours = total_hours * discount_factor
+def build_rental_schedule(boat, window_start, window_end, snap=None, version_id=None):
+    """
+    Сводное расписание на всё окно аренды: интервалы всех тарифных дней,
+    которых касается окно, без пересечений, по возрастанию времени.
+
+    Берутся дни с предыдущего (его ночной тариф заходит в утро первого дня)
+    по день окончания. Тарифный день D действует с начала своего первого
+    интервала до начала первого интервала дня D+1 — так ночной интервал
+    "22:00-10:00" принадлежит дню, в который начался, а смена сезона или дня
+    недели в полночь учитывается. Пересечения внутри дня — как раньше:
+    интервал, начавшийся раньше, имеет приоритет.
+    """
+    first_day = window_start.date() - datetime.timedelta(days=1)
+    days = (window_end.date() - first_day).days + 1
+    per_day = [sorted(day_schedule(boat, first_day + datetime.timedelta(days=i), snap, version_id), key=lambda x: x[0])
+               for i in range(days)]
+    per_day = [intervals for intervals in per_day if intervals]
+
+    candidates = []
+    for i, intervals in enumerate(per_day):
+        limit = per_day[i + 1][0][0] if i + 1 < len(per_day) else None
+        for int_start, int_end, price in intervals:
+            if limit is not None:
+                int_end = min(int_end, limit)
+            if int_end > int_start:
+                candidates.append((int_start, int_end, price))
+
+    timeline = []
+    covered_until = None
+    for int_start, int_end, price in candidates:
+        if covered_until is not None:
+            int_start = max(int_start, covered_until)
+        if int_end > int_start:
+            timeline.append((int_start, int_end, price))
+            covered_until = int_end
+    return timeline
+
+
+def _gap_price(timeline, moment):
+    """Цена для часов вне тарифов: последний интервал до момента, иначе первый после."""
+    price = timeline[0][2]
+    for int_start, _, int_price in timeline:
+        if int_start > moment:
+            break
+        price = int_price
+    return price
+
+
+def price_segments(segments, timeline):
+    """
+    Стоимость всех сегментов аренды одним проходом по сводному расписанию.
+    segments — [(начало, конец, коэффициент)] по возрастанию и без пересечений.
+    Возвращает (стоимость, breakdown [(начало, цена, эффективные часы)], [стоимость каждого сегмента]).
+
+    Дыры в сетке здесь не ищутся и не логируются — их заранее находит
+    tariff_coverage.py при записи цен; здесь они просто считаются по ближайшей цене.
+    """
     cost = 0.0
     breakdown = []
-    current_time = seg_start
-
-    overlaps = []
-    for int_start, int_end, price in schedule:
-        overlap = compute_overlap(seg_start, seg_end, int_start, int_end)
-        if overlap > 0:
-            overlap_start = max(seg_start, int_start)
-            overlap_end = min(seg_end, int_end)
-            overlaps.append((overlap_start, overlap_end, price, overlap))
-
-    overlaps.sort(key=lambda x: x[0])
-
-    hours_covered = 0.0
-    for overlap_start, overlap_end, price, overlap_hours in overlaps:
-        if current_time < seg_end and overlap_start <= seg_end:
-            segment_end = min(overlap_end, seg_end)
-            hours = (segment_end - max(current_time, overlap_start)).total_seconds() / 3600.0
+    segment_costs = []
+    # Дыры добиваем ближайшей ценой, только если тарифы на окно вообще есть;
+    # теплоход вне сезона считается как раньше — одна уборка
+    window_start, window_end = segments[0][0], segments[-1][1]
+    fill_gaps = any(int_start < window_end and int_end > window_start for int_start, int_end, _ in timeline)
+    i = 0
+    for seg_start, seg_end, factor in segments:
+        current = seg_start
+        cost_before = cost
+        # Интервалы, закончившиеся до сегмента, больше не понадобятся
+        while i < len(timeline) and timeline[i][1] <= seg_start:
+            i += 1
+        j = i
+        while current < seg_end and j < len(timeline) and timeline[j][0] < seg_end:
+            int_start, int_end, price = timeline[j]
+            if int_start > current:
+                # Дыра в тарифах
+                hours = (int_start - current).total_seconds() / 3600.0
+                gap_price = _gap_price(timeline, current)
+                cost += gap_price * hours * factor
+                breakdown.append((current, gap_price, hours * factor))
+                current = int_start
+            piece_end = min(int_end, seg_end)
+            hours = (piece_end - current).total_seconds() / 3600.0
             if hours > 0:
-                effective_hours_segment = hours * discount_factor
-                cost += price * effective_hours_segment
-                breakdown.append((max(current_time, overlap_start), price, effective_hours_segment))
-                hours_covered += hours
-                current_time = max(current_time, segment_end)
+                cost += price * hours * factor
+                breakdown.append((current, price, hours * factor))
+                current = piece_end
+            j += 1
+        if current < seg_end:
+            hours = (seg_end - current).total_seconds() / 3600.0
+            if fill_gaps:
+                gap_price = _gap_price(timeline, current)
+                cost += gap_price * hours * factor
+                breakdown.append((current, gap_price, hours * factor))
+        segment_costs.append(cost - cost_before)
+    return cost, breakdown, segment_costs
 
-    if abs(hours_covered - total_hours) > 0.01:
-        logging.warning(f"Сегмент {seg_start}–{seg_end}: не все часы покрыты тарифами ({total_hours - hours_covered:.2f} ч остались)")
-        if schedule:
-            last_price = schedule[-1][2]
-            remaining_hours = total_hours - hours_covered
-            cost += last_price * (remaining_hours * discount_factor)
-            breakdown.append((seg_end, last_price, remaining_hours * discount_factor))
 
-    return cost, breakdown, effective_hours
+def parse_request(message_text):
+    """Первый запрос из текста → (дата, теплоход, времена); ошибка — ValueError с местом."""
+    blocks = parse_message(message_text)
+    if not blocks:
+        raise ValueError("Пустой запрос.")
+    block = blocks[0]
+    if not block.ok:
+        raise ValueError(block.error_message())
+    return block.date, block.boat_name, block.times
 
 
-def parse_request(message_text):
-    lines = [line.strip() for line in message_text.splitlines() if line.strip()]
-    if len(lines) < 3:
-        raise ValueError("Некорректный формат запроса. Должны быть не менее 3 строк.")
-    date_str = lines[0]
-    boat_name = lines[1]
-    times_str = lines[2]
-    time_parts = times_str.split("-")
-    normalized_times = []
-    for part in time_parts:
-        if ":" in part:
-            normalized_times.append(part)
+SEGMENT_KINDS = {
+    'prep': 'Подготовка',
+    'main': 'Аренда',
+    'unload': 'Разгрузка',
+}
+
+
+def _money(value):
+    return f"{int(value):,}".replace(",", " ")
+
+
+class QuoteResult:
+    """
+    Результат расчёта: времена, сегменты, часы по ставкам, уборка, итог и версия цен.
+    Текст строится лениво и только в нужном виде: to_markdown() (веб, история),
+    to_telegram() (HTML для бота), to_text() (без разметки), to_dict() (JSON API).
+    str(quote) — Markdown, как раньше возвращал calculate_rental.
+    """
+
+    __slots__ = (
+        'date', 'boat_name', 'link', 'dock', 'full_format',
+        'prep_start', 'boarding', 'disembarking', 'unloading',
+        'segments', 'rates', 'cleaning_cost', 'total', 'pricing_version', '_markdown',
+    )
+
+    def __init__(self, date, boat_name, link, dock, full_format,
+                 prep_start, boarding, disembarking, unloading,
+                 segments, rates, cleaning_cost, total, pricing_version=None):
+        self.date = date
+        self.boat_name = boat_name
+        self.link = link
+        self.dock = dock
+        self.full_format = full_format
+        self.prep_start = prep_start
+        self.boarding = boarding
+        self.disembarking = disembarking
+        self.unloading = unloading
+        # [(kind, начало, конец, коэффициент, стоимость)]
+        self.segments = segments
+        # [(цена за час, эффективные часы)] в порядке появления ставки
+        self.rates = rates
+        self.cleaning_cost = cleaning_cost
+        self.total = total
+        # Версия цен, по которой посчитано (None — записи истории до версий)
+        self.pricing_version = pricing_version
+        self._markdown = None
+
+    def __str__(self):
+        return self.to_markdown()
+
+    def __repr__(self):
+        return f"<QuoteResult {self.boat_name} {self.date:%d.%m.%y} {int(self.total)}>"
+
+    # --- Рендеры ---
+
+    def _lines(self, bold):
+        fmt = lambda dt: dt.strftime("%H:%M")
+        rates = " + ".join(f"({_money(price)}₽/ч x {hours:.2f}ч)" for price, hours in self.rates)
+        lines = [
+            bold(self.date.strftime('%d.%m.%y')),
+            "",
+            f"{bold(self.boat_name)} - {self.link}",
+        ]
+        if self.full_format:
+            lines.append(f"{fmt(self.prep_start)} - Подготовка (50%)")
+        lines.append(f"{fmt(self.boarding)} - Посадка")
+        lines.append(f"{fmt(self.disembarking)} - Высадка")
+        if self.full_format:
+            lines.append(f"{fmt(self.unloading)} - Разгрузка (50%)")
+        lines.append(f"Причал: {self.dock}")
+        lines.append(f"Аренда: {rates} + {int(self.cleaning_cost)}₽ (уборка) = {bold(_money(self.total))}₽")
+        # Как в прежнем форматировании: запятые во всём тексте (и в причале) заменяются пробелами
+        return [line.replace(",", " ") for line in lines]
+
+    def to_markdown(self):
+        """Markdown с **жирным** — так результат показывает фронтенд и хранит история."""
+        if self._markdown is None:
+            self._markdown = "\n".join(self._lines(lambda t: f"**{t}**"))
+        return self._markdown
+
+    def to_telegram(self):
+        """HTML для Telegram (parse_mode=HTML): весь текст экранируется, жирное — <b>."""
+        text = "\n".join(self._lines(lambda t: f"\x01{t}\x02"))
+        return html.escape(text, quote=False).replace("\x01", "<b>").replace("\x02", "</b>")
+
+    def to_text(self):
+        """Обычный текст без разметки."""
+        return "\n".join(self._lines(lambda t: t))
+
+    def to_dict(self):
+        """Структура для JSON API."""
+        iso = lambda dt: dt.isoformat(timespec='minutes')
+        return {
+            'date': self.date.isoformat(),
+            'boat': self.boat_name,
+            'link': self.link,
+            'dock': self.dock,
+            'times': {
+                'prep_start': iso(self.prep_start) if self.full_format else None,
+                'boarding': iso(self.boarding),
+                'disembarking': iso(self.disembarking),
+                'unloading': iso(self.unloading) if self.full_format else None,
+            },
+            'segments': [
+                {'kind': kind, 'start': iso(start), 'end': iso(end), 'factor': factor, 'cost': round(cost, 2)}
+                for kind, start, end, factor, cost in self.segments
+            ],
+            'rates': [{'price': price, 'hours': round(hours, 4)} for price, hours in self.rates],
+            'cleaning_cost': self.cleaning_cost,
+            'total': int(self.total),
+            'pricing_version': self.pricing_version,
+        }
+
+    # --- Компактная форма для истории ---
+
+    def to_compact(self):
+        """
+        Короткий JSON-совместимый список для calculations.results_json:
+        [формат, дата, теплоход, ссылка, причал, полный формат, [времена], [сегменты], [ставки], уборка, итог, версия цен].
+        Времена — минуты от полуночи даты мероприятия. Формат 1 (без версии цен) читается тоже.
+        """
+        base = datetime.datetime.combine(self.date, datetime.time())
+        minutes = lambda dt: int((dt - base).total_seconds() // 60)
+        return [
+            2, self.date.toordinal(), self.boat_name, self.link, self.dock, int(self.full_format),
+            [minutes(self.prep_start), minutes(self.boarding), minutes(self.disembarking), minutes(self.unloading)],
+            [[kind, minutes(start), minutes(end), factor, round(cost, 2)] for kind, start, end, factor, cost in self.segments],
+            [[price, round(hours, 6)] for price, hours in self.rates],
+            self.cleaning_cost, round(self.total, 2), self.pricing_version,
+        ]
+
+    @classmethod
+    def from_compact(cls, data):
+        (_, ordinal, boat_name, link, dock, full_format, times, segments, rates, cleaning_cost, total) = data[:11]
+        date = datetime.date.fromordinal(ordinal)
+        base = datetime.datetime.combine(date, datetime.time())
+        at = lambda m: base + datetime.timedelta(minutes=m)
+        return cls(
+            date, boat_name, link, dock, bool(full_format),
+            *(at(m) for m in times),
+            [(kind, at(start), at(end), factor, cost) for kind, start, end, factor, cost in segments],
+            [(price, hours) for price, hours in rates],
+            cleaning_cost, total, data[11] if len(data) > 11 else None,
+        )
+
+
+def expand_saved_results(results, markdown=True):
+    """
+    Записи истории (results_json) → [{'result': Markdown, 'quote': dict} | {'error', 'input'}].
+    markdown=False — только 'quote', без текста (история в SPA: текст строит фронтенд,
+    сервер не рендерит его для каждой из сотен записей). Старые записи с готовым
+    текстом отдаются как есть.
+    """
+    expanded = []
+    for item in results:
+        if 'quote' in item:
+            quote = QuoteResult.from_compact(item['quote'])
+            if markdown:
+                expanded.append({'result': quote.to_markdown(), 'quote': quote.to_dict()})
+            else:
+                expanded.append({'quote': quote.to_dict()})
         else:
-            normalized_times.append(part + ":00")
-    if len(normalized_times) not in [2, 4]:
-        raise ValueError("Ожидается 2 или 4 временных значения.")
-    try:
-        date_obj = datetime.datetime.strptime(date_str, "%d.%m.%y").date()
-    except Exception as e:
-        raise ValueError("Неверный формат даты, ожидается dd.mm.yy.") from e
-    times = []
-    for t_str in normalized_times:
-        try:
-            t_obj = datetime.datetime.strptime(t_str, "%H:%M").time()
-            times.append(t_obj)
-        except Exception as e:
-            raise ValueError(f"Неверный формат времени: {t_str}") from e
-    return date_obj, boat_name, times
-
-
-def calculate_rental(date_obj, boat_name, times):
-    boat = get_boat_by_name(boat_name)
+            expanded.append(item)
+    return expanded
+
+
+def calculate_rental(date_obj, boat_name, times, pricing_version=None):
+    """
+    Расчёт стоимости аренды → QuoteResult. pricing_version — посчитать по
+    сохранённой версии цен (None — по активной).
+    """
+    # Один снимок на весь расчёт; без снимка или для другой версии цен — напрямую из SQLite
+    snap = get_snapshot()
+    if pricing_version is not None and (snap is None or snap.pricing_version != pricing_version):
+        if not get_pricing_version(pricing_version):
+            raise ValueError(f"Версия цен {pricing_version} не найдена.")
+        snap = None
+    if snap is None and pricing_version is None:
+        pricing_version = get_active_pricing_version()
+    boat = snap.find_boat(boat_name) if snap else get_boat_by_name(boat_name)
     if not boat:
         raise ValueError(f"Теплоход '{boat_name}' не найден.")
+    return price_quote(boat, date_obj, times, snap, pricing_version)
+
 
+def price_quote(boat, date_obj, times, snap=None, pricing_version=None):
+    """
+    Расчёт для уже найденного теплохода: интервалы — из снимка snap, без него —
+    из SQLite по версии цен pricing_version. Общий для calculate_rental и симулятора.
+    """
+    if snap:
+        pricing_version = snap.pricing_version
     link = boat.get('link', '')
     dock = boat.get('dock', 'Неизвестный причал')
     cleaning_cost = float(boat.get('cleaning_cost', 3000))
@@ -128,58 +357,32 @@ def calculate_rental(date_obj, boat_name, times):
         prep_start = boarding_dt
         unloading_dt = disembarking_dt
 
-    boarding_date = boarding_dt.date()
-    schedule = get_pricing_schedule_db(boat['name'], boarding_date)
-
     if full_format:
-        prep_cost, prep_breakdown, prep_hours = calculate_segment_cost_and_hours(prep_start, boarding_dt, schedule, discount_factor=0.5)
-        main_cost, main_breakdown, main_hours = calculate_segment_cost_and_hours(boarding_dt, disembarking_dt, schedule, discount_factor=1.0)
-        unload_cost, unload_breakdown, unload_hours = calculate_segment_cost_and_hours(disembarking_dt, unloading_dt, schedule, discount_factor=0.5)
-        total_cost = prep_cost + main_cost + unload_cost + cleaning_cost
-        all_breakdown = prep_breakdown + main_breakdown + unload_breakdown
+        segments = [
+            ('prep', prep_start, boarding_dt, 0.5),
+            ('main', boarding_dt, disembarking_dt, 1.0),
+            ('unload', disembarking_dt, unloading_dt, 0.5),
+        ]
     else:
-        main_cost, main_breakdown, main_hours = calculate_segment_cost_and_hours(boarding_dt, disembarking_dt, schedule, discount_factor=1.0)
-        total_cost = main_cost + cleaning_cost
-        all_breakdown = main_breakdown
+        segments = [('main', boarding_dt, disembarking_dt, 1.0)]
 
-    # Агрегируем breakdown
+    timeline = build_rental_schedule(boat, prep_start, unloading_dt, snap, pricing_version)
+    rental_cost, all_breakdown, segment_costs = price_segments([seg[1:] for seg in segments], timeline)
+    total_cost = rental_cost + cleaning_cost
+
+    # Часы по ставкам: в порядке первого появления ставки
     all_breakdown.sort(key=lambda x: x[0])
     agg = {}
-    order = []
-    for start_time, price, hours in all_breakdown:
-        if price not in agg:
-            agg[price] = 0
-            order.append((start_time, price))
-        agg[price] += hours
-
-    order.sort(key=lambda x: x[0])
-    breakdown = [(price, agg[price]) for _, price in order]
-    breakdown_str = " + ".join(f"({int(price):,}₽/ч x {hours:.2f}ч)".replace(",", " ") for price, hours in breakdown)
+    for _, price, hours in all_breakdown:
+        agg[price] = agg.get(price, 0) + hours
 
-    def fmt_time(dt):
-        return dt.strftime("%H:%M")
-
-    if full_format:
-        result = (
-            f"**{date_obj.strftime('%d.%m.%y')}**\n\n"
-            f"**{boat['name']}** - {link}\n"
-            f"{fmt_time(prep_start)} - Подготовка (50%)\n"
-            f"{fmt_time(boarding_dt)} - Посадка\n"
-            f"{fmt_time(disembarking_dt)} - Высадка\n"
-            f"{fmt_time(unloading_dt)} - Разгрузка (50%)\n"
-            f"Причал: {dock}\n"
-            f"Аренда: {breakdown_str} + {int(cleaning_cost)}₽ (уборка) = **{int(total_cost):,}**₽".replace(",", " ")
-        )
-    else:
-        result = (
-            f"**{date_obj.strftime('%d.%m.%y')}**\n\n"
-            f"**{boat['name']}** - {link}\n"
-            f"{fmt_time(boarding_dt)} - Посадка\n"
-            f"{fmt_time(disembarking_dt)} - Высадка\n"
-            f"Причал: {dock}\n"
-            f"Аренда: {breakdown_str} + {int(cleaning_cost)}₽ (уборка) = **{int(total_cost):,}**₽".replace(",", " ")
-        )
-    return result
+    return QuoteResult(
+        date_obj, boat['name'], link, dock, full_format,
+        prep_start, boarding_dt, disembarking_dt, unloading_dt,
+        [seg + (cost,) for seg, cost in zip(segments, segment_costs)],
+        list(agg.items()),
+        cleaning_cost, total_cost, pricing_version,
+    )
 
 
 def refresh_data():
@@ -0,0 +1,391 @@
+"""
+Разбор запроса менеджера: всё сообщение за один проход, без strptime.
+
+Запрос — блоки из трёх строк: дата, теплоход, время. Пустые строки не важны.
+    Дата:  16.08.26, 16.08.2026, 16/08/26; день недели ("пт", "в субботу") —
+           ближайший такой день начиная с сегодня; "сегодня", "завтра", "послезавтра".
+           Дата с днём недели ("пт 16.08.26") проверяется на совпадение.
+    Время: 2 или 4 значения через "-", "–", "—" или "до", с необязательным "с" в начале:
+           "18-22", "18.00-23.00", "18:00 - 23:30", "с 18 до 23", "16-17-23-23:30".
+
+Новый блок начинается со строки, похожей на дату (число с двумя разделителями
+или день недели), — по ней разбор восстанавливается после ошибки: плохой блок
+становится ошибкой с номером строки и символа, остальные разбираются как обычно.
+Строки вне блоков (до первой даты, после времени) — отдельная ошибка.
+
+parse_partial — та же лексика для запроса в одну строку, пока его набирают
+(inline-режим бота): что уже разбирается — разобрано, остальное — название.
+"""
+import datetime
+
+WEEKDAYS = {
+    'пн': 0, 'понедельник': 0,
+    'вт': 1, 'вторник': 1,
+    'ср': 2, 'среда': 2, 'среду': 2,
+    'чт': 3, 'четверг': 3,
+    'пт': 4, 'пятница': 4, 'пятницу': 4,
+    'сб': 5, 'суббота': 5, 'субботу': 5,
+    'вс': 6, 'воскресенье': 6,
+}
+
+RELATIVE_DAYS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+# Первые буквы слов, с которых может начинаться строка даты
+_WORD_STARTS = frozenset(c for w in list(WEEKDAYS) + list(RELATIVE_DAYS) + ['в', 'во'] for c in (w[0], w[0].upper()))
+
+WEEKDAY_NAMES = ('понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье')
+
+_DIGITS = frozenset('0123456789')
+_DIGITS_STR = '0123456789'
+_DATE_SEPARATORS = frozenset('./')
+_TIME_SEPARATORS = frozenset('-–—')
+_WORD_TRIM = '.,;:()'
+
+
+class _ParseError(Exception):
+    def __init__(self, message, pos):
+        super().__init__(message)
+        self.message = message
+        self.pos = pos
+
+
+class RequestBlock:
+    """Один запрос из сообщения: дата, теплоход, времена — или ошибка с позицией."""
+
+    __slots__ = ('line', 'lines', 'date', 'boat_name', 'times', 'error', 'error_line', 'error_column')
+
+    def __init__(self, line):
+        self.line = line            # номер первой строки блока (с 1, считая пустые)
+        self.lines = []             # строки блока как введены (без пробелов по краям)
+        self.date = None
+        self.boat_name = None
+        self.times = None
+        self.error = None
+        self.error_line = None
+        self.error_column = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def fail(self, message, line, column):
+        if self.error is None:
+            self.error = message
+            self.error_line = line
+            self.error_column = column
+
+    def error_message(self):
+        """Текст ошибки с местом: "… (строка 4, символ 7)"."""
+        return f"{self.error} (строка {self.error_line}, символ {self.error_column})"
+
+    def __repr__(self):
+        if self.error:
+            return f"<RequestBlock line={self.line} error={self.error!r}>"
+        return f"<RequestBlock line={self.line} {self.date} {self.boat_name!r} {self.times}>"
+
+
+# === Лексика ===
+
+# Все моменты суток заранее: time() на каждое значение дороже поиска в списке
+_CLOCK = [datetime.time(m // 60, m % 60) for m in range(24 * 60)]
+
+# Строка времени только из цифр, ":" и "-" — её разбирает быстрый путь
+_FAST_TIME_CHARS = str.maketrans('', '', '0123456789:-')
+
+
+def _scan_int(s, i, n):
+    """Цифры с позиции i → (значение, позиция после, число цифр)."""
+    rest = s[i:].lstrip(_DIGITS_STR)
+    end = n - len(rest)
+    return (int(s[i:end]) if end > i else 0), end, end - i
+
+
+def _skip_spaces(s, i, n):
+    while i < n and s[i] == ' ':
+        i += 1
+    return i
+
+
+def _first_word(s):
+    end = s.find(' ')
+    return (s if end < 0 else s[:end]).strip(_WORD_TRIM).lower()
+
+
+def _column(raw, pos):
+    """Позиция в строке без отступа → номер символа в исходной строке (с 1)."""
+    return len(raw) - len(raw.lstrip()) + pos + 1
+
+
+def _looks_like_date(s):
+    """Строка начинает новый блок: число с двумя разделителями или день недели."""
+    if s[0] in _DIGITS:
+        rest = s.lstrip(_DIGITS_STR)
+        sep = rest[:1]
+        if sep not in _DATE_SEPARATORS:
+            return False
+        tail = rest[1:].lstrip(_DIGITS_STR)
+        return len(tail) < len(rest) - 1 and tail[:1] == sep
+    if s[0] not in _WORD_STARTS:
+        return False
+    word = _first_word(s)
+    if word in ('в', 'во'):
+        word = _first_word(s[s.find(' ') + 1:])
+    return word in WEEKDAYS or word in RELATIVE_DAYS
+
+
+def _looks_like_times(s):
+    if s[0] in _DIGITS:
+        return True
+    return len(s) > 2 and s[0] in 'сСcC' and s[1] == ' ' and s[2] in _DIGITS
+
+
+# === Дата ===
+
+def _parse_numeric_date(s, i, n):
+    """dd.mm.yy / dd.mm.yyyy (или через /) с позиции i → (date, позиция после)."""
+    day, j, digits = _scan_int(s, i, n)
+    if not 1 <= digits <= 2:
+        raise _ParseError("Неверный формат даты, ожидается dd.mm.yy.", i)
+    sep = s[j]
+    month, k, digits = _scan_int(s, j + 1, n)
+    if not 1 <= digits <= 2 or k >= n or s[k] != sep:
+        raise _ParseError("Неверный формат даты, ожидается dd.mm.yy.", i)
+    year, end, digits = _scan_int(s, k + 1, n)
+    if digits == 2:
+        year += 2000
+    elif digits != 4:
+        raise _ParseError("Неверный формат даты, ожидается dd.mm.yy.", k + 1)
+    if end < n and s[end] not in ' (,':
+        raise _ParseError("Неверный формат даты, ожидается dd.mm.yy.", end)
+    try:
+        return datetime.date(year, month, day), end
+    except ValueError:
+        raise _ParseError(f"Такой даты нет: {s[i:end]}", i)
+
+
+def _parse_date(s, today):
+    """Строка даты → date. День недели рядом с числом должен с ним совпадать."""
+    # Быстрый путь: ровно dd.mm.yy
+    if len(s) == 8 and s[2] == '.' and s[5] == '.' and s.isascii():
+        day, month, year = s[:2], s[3:5], s[6:]
+        if day.isdigit() and month.isdigit() and year.isdigit():
+            try:
+                return datetime.date(2000 + int(year), int(month), int(day))
+            except ValueError:
+                pass        # ошибку с позицией даст общий разбор
+    n = len(s)
+    date = None
+    weekday = None
+    weekday_pos = 0
+    i = 0
+    while i < n:
+        i = _skip_spaces(s, i, n)
+        if i >= n:
+            break
+        if s[i] in _DIGITS:
+            if date is not None:
+                raise _ParseError("Лишнее после даты", i)
+            date, i = _parse_numeric_date(s, i, n)
+            continue
+        end = s.find(' ', i)
+        if end < 0:
+            end = n
+        word = s[i:end].strip(_WORD_TRIM).lower()
+        if word in WEEKDAYS:
+            weekday, weekday_pos = WEEKDAYS[word], i
+        elif word in RELATIVE_DAYS:
+            if date is not None:
+                raise _ParseError("Лишнее после даты", i)
+            date = today + datetime.timedelta(days=RELATIVE_DAYS[word])
+        elif word not in ('в', 'во', ''):
+            raise _ParseError("Неверный формат даты, ожидается dd.mm.yy или день недели.", i)
+        i = end
+
+    if date is None:
+        if weekday is None:
+            raise _ParseError("Неверный формат даты, ожидается dd.mm.yy или день недели.", 0)
+        return today + datetime.timedelta(days=(weekday - today.weekday()) % 7)
+    if weekday is not None and date.weekday() != weekday:
+        raise _ParseError(f"{date:%d.%m.%y} — {WEEKDAY_NAMES[date.weekday()]}, а не {WEEKDAY_NAMES[weekday]}", weekday_pos)
+    return date
+
+
+# === Время ===
+
+def _parse_times(s):
+    """
+    Строка времени → [time] (2 или 4 значения). 24 (= 00:00) — только время
+    окончания («22-24»): начало в 24 — это уже следующий день, ошибка.
+    """
+    if s.isascii() and not s.translate(_FAST_TIME_CHARS):
+        times = _parse_times_fast(s)
+        if times is not None:
+            return times
+    n = len(s)
+    i = _skip_spaces(s, 0, n)
+    if i + 1 < n and s[i] in 'сСcC' and s[i + 1] == ' ':
+        i += 2
+    times = []
+    midnight = []       # (номер значения, позиция) для «24»
+    while True:
+        i = _skip_spaces(s, i, n)
+        if i >= n or s[i] not in _DIGITS:
+            raise _ParseError("Ожидается время", i)
+        start = i
+        hour, i, digits = _scan_int(s, i, n)
+        if digits > 2:
+            raise _ParseError(f"Неверный формат времени: {s[start:i]}", start)
+        minute = 0
+        if i + 1 < n and s[i] in ':.' and s[i + 1] in _DIGITS:
+            minute, i, digits = _scan_int(s, i + 1, n)
+            if digits != 2:
+                raise _ParseError(f"Неверный формат времени: {s[start:i]}", start)
+        if minute > 59 or hour > 24 or (hour == 24 and minute):
+            raise _ParseError(f"Неверный формат времени: {s[start:i]}", start)
+        if hour == 24:
+            midnight.append((len(times), start))
+        times.append(_CLOCK[hour % 24 * 60 + minute])
+
+        i = _skip_spaces(s, i, n)
+        if i >= n:
+            break
+        if s[i] in _TIME_SEPARATORS:
+            i += 1
+        elif s[i:i + 2].lower() == 'до':
+            i += 2
+        else:
+            raise _ParseError(f"Неожиданный символ «{s[i]}» во времени", i)
+
+    if len(times) not in (2, 4):
+        raise _ParseError("Ожидается 2 или 4 временных значения.", 0)
+    for index, pos in midnight:
+        if index < len(times) // 2:
+            raise _ParseError("24:00 — только время окончания; начало после полуночи — 00:00 следующей даты", pos)
+    return times
+
+
+def _parse_times_fast(s):
+    """"18-23", "16-17-23-23:30" без пробелов → [time]; всё необычное → None (общий разбор)."""
+    parts = s.split('-')
+    if len(parts) != 2 and len(parts) != 4:
+        return None
+    times = []
+    for index, part in enumerate(parts):
+        hour, colon, minute = part.partition(':')
+        if not hour or len(hour) > 2 or not hour.isdigit():
+            return None
+        h = int(hour)
+        if colon:
+            if len(minute) != 2 or not minute.isdigit():
+                return None
+            m = int(minute)
+        else:
+            m = 0
+        if m > 59 or h > 24 or (h == 24 and (m or index < len(parts) // 2)):
+            return None
+        times.append(_CLOCK[h % 24 * 60 + m])
+    return times
+
+
+# === Сообщение ===
+
+def parse_message(text, today=None):
+    """
+    Всё сообщение → [RequestBlock] в порядке ввода. Не бросает исключений:
+    ошибки — в блоках (error, error_line, error_column).
+    """
+    if today is None:
+        today = datetime.date.today()
+    blocks = []
+    block = None
+    stray = None        # текущий блок из строк вне запросов
+
+    def close():
+        if block is not None and block.times is None and block.error is None:
+            block.fail("Неполный запрос: нужны дата, теплоход и время", block.line, 1)
+
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        s = raw.strip()
+        if not s:
+            continue
+
+        if _looks_like_date(s):
+            close()
+            block = RequestBlock(lineno)
+            block.lines.append(s)
+            blocks.append(block)
+            stray = None
+            try:
+                block.date = _parse_date(s, today)
+            except _ParseError as e:
+                block.fail(e.message, lineno, _column(raw, e.pos))
+            continue
+
+        if block is None or block.times is not None:
+            # Строка не относится ни к одному запросу
+            if stray is None:
+                stray = RequestBlock(lineno)
+                stray.fail("Ожидается дата (dd.mm.yy или день недели)", lineno, _column(raw, 0))
+                blocks.append(stray)
+            stray.lines.append(s)
+            continue
+
+        block.lines.append(s)
+        if block.boat_name is None:
+            if not _looks_like_times(s):
+                block.boat_name = s
+                continue
+            block.fail("Нет названия теплохода", lineno, _column(raw, 0))
+        try:
+            block.times = _parse_times(s)
+        except _ParseError as e:
+            block.fail(e.message, lineno, _column(raw, e.pos))
+            block.times = []
+    close()
+
+    for b in blocks:
+        if b.error is not None:
+            b.date = b.boat_name = b.times = None
+    return blocks
+
+
+def parse_partial(text, today=None):
+    """
+    Запрос, который ещё набирают в одну строку (inline-режим бота):
+    «14.06.26 Сицилия 18-22» → (date | None, начало названия теплохода, [time] | None).
+    Не бросает исключений: чего нет или что не разбирается — None, остальное
+    считается названием.
+    """
+    if today is None:
+        today = datetime.date.today()
+    words = text.split()
+    date = None
+    # Дата — самое длинное разбираемое начало: «в субботу», «пт 16.08.26», «16.08.26»
+    for k in range(min(3, len(words)), 0, -1):
+        head = ' '.join(words[:k])
+        if not _looks_like_date(head):
+            continue
+        try:
+            date = _parse_date(head, today)
+        except _ParseError:
+            continue
+        words = words[k:]
+        break
+
+    times = None
+    # Время — самый длинный разбираемый хвост: «18-22», «с 18 до 23», «18:00 - 23:30»
+    for k in range(min(5, len(words)), 0, -1):
+        tail = ' '.join(words[-k:])
+        if not _looks_like_times(tail):
+            continue
+        try:
+            times = _parse_times(tail)
+        except _ParseError:
+            continue
+        words = words[:-k]
+        break
+    return date, ' '.join(words), times
@@ -0,0 +1,272 @@
+"""
+Симулятор тарифов: что было бы с выручкой, если бы действовала другая сетка цен.
+
+Предлагаемая сетка — черновая версия цен (database.replace_prices_bulk с
+activate=False, source 'simulation') или любая сохранённая версия. Каждый
+расчёт из истории (calculations, компактная форма QuoteResult) считается
+заново по этой версии и сравнивается с итогом, который получил менеджер.
+Итоги — по теплоходам и по месяцам мероприятия.
+
+Задание выполняется в фоне: поток процесса веб-сервера собирает снимок тарифов
+черновой версии (pricing_snapshot.build_snapshot в отдельный файл) и раздаёт
+пачки расчётов пулу процессов. Процессы пула запускаются через forkserver, а
+не fork: процесс веб-сервера многопоточный (потоки gthread, истории, событий),
+fork из него небезопасен. Каждый процесс пула один раз открывает снимок по
+пути — собранные таблицы тарифных дней — и дальше только считает. Ход
+пишется в таблицу simulations и публикуется событием 'simulation' (events.py).
+
+Записи истории до QuoteResult (готовый текст) и ошибки не пересчитываются.
+Уборка, причал и праздники — текущие, они не версионируются.
+"""
+import concurrent.futures
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import threading
+
+import events
+import json_codec
+from database import get_db, iter_calculations
+from pricing_snapshot import PricingSnapshot, build_snapshot, snapshot_path
+from rental_calculator import price_quote
+
+logger = logging.getLogger(__name__)
+
+# Процессов в пуле
+WORKERS = int(os.environ.get('SIMULATION_WORKERS', str(min(os.cpu_count() or 2, 8))))
+
+# Расчётов в одной задаче пула
+CHUNK_SIZE = 2000
+
+_lock = threading.Lock()
+
+
+class SimulationBusy(RuntimeError):
+    """Уже идёт другая симуляция."""
+
+
+# === Процесс пула ===
+
+_worker = {}
+
+
+def _init_worker(path):
+    _worker['snap'] = PricingSnapshot(path)
+    _worker['boats'] = {}
+
+
+def _clock(minutes):
+    minutes %= 24 * 60
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def _price_chunk(items):
+    """
+    Пачка (ordinal, теплоход, полный формат, [минуты], итог менеджера) →
+    ({(теплоход, 'YYYY-MM'): [расчётов, было, стало]}, не найдено теплоходов, ошибок).
+    """
+    snap = _worker['snap']
+    boats = _worker['boats']
+    groups = {}
+    unmatched = failed = 0
+    for ordinal, boat_name, full_format, minutes, original in items:
+        if boat_name not in boats:
+            boats[boat_name] = snap.find_boat(boat_name)
+        boat = boats[boat_name]
+        if boat is None:
+            unmatched += 1
+            continue
+        day = datetime.date.fromordinal(ordinal)
+        times = [_clock(m) for m in (minutes if full_format else minutes[1:3])]
+        try:
+            total = price_quote(boat, day, times, snap).total
+        except Exception:
+            failed += 1
+            continue
+        group = groups.setdefault((boat['name'], f"{day:%Y-%m}"), [0, 0.0, 0.0])
+        group[0] += 1
+        group[1] += original
+        group[2] += total
+    return groups, unmatched, failed
+
+
+# === Задание ===
+
+def _history_quotes(date_from=None, date_to=None):
+    """Расчёты из истории → ([(ordinal, теплоход, полный формат, [минуты], итог)], пропущено записей)."""
+    quotes = []
+    skipped = 0
+    for row in iter_calculations(date_from=date_from, date_to=date_to):
+        try:
+            results = json_codec.loads(row['results_json'])
+        except ValueError:
+            continue
+        for item in results:
+            data = item.get('quote')
+            if data is None:
+                skipped += 'result' in item
+                continue
+            quotes.append((data[1], data[2], data[5], data[6], data[10]))
+    return quotes, skipped
+
+
+def _delta(original, simulated):
+    return {
+        'original': round(original),
+        'simulated': round(simulated),
+        'delta': round(simulated - original),
+        'delta_pct': round((simulated - original) / original * 100, 2) if original else None,
+    }
+
+
+def _summarize(groups, skipped, unmatched, failed):
+    by_boat, by_month = {}, {}
+    for (boat, month), (count, original, simulated) in groups.items():
+        for table, key in ((by_boat, boat), (by_month, month)):
+            acc = table.setdefault(key, [0, 0.0, 0.0])
+            acc[0] += count
+            acc[1] += original
+            acc[2] += simulated
+    quotes = sum(acc[0] for acc in by_boat.values())
+    original = sum(acc[1] for acc in by_boat.values())
+    simulated = sum(acc[2] for acc in by_boat.values())
+    boats = [dict(_delta(acc[1], acc[2]), boat=boat, quotes=acc[0]) for boat, acc in by_boat.items()]
+    boats.sort(key=lambda b: (-abs(b['delta']), b['boat']))
+    return {
+        'quotes': quotes,
+        'skipped': skipped,
+        'unmatched': unmatched,
+        'failed': failed,
+        'totals': _delta(original, simulated),
+        'by_boat': boats,
+        'by_month': [dict(_delta(acc[1], acc[2]), month=month, quotes=acc[0]) for month, acc in sorted(by_month.items())],
+    }
+
+
+def _update(job_id, **fields):
+    conn = get_db()
+    try:
+        conn.execute(
+            f"UPDATE simulations SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+            list(fields.values()) + [job_id]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run(job_id, version_id, date_from, date_to):
+    path = f"{snapshot_path()}.sim-{job_id}"
+    try:
+        build_snapshot(version_id, path)
+        quotes, skipped = _history_quotes(date_from, date_to)
+        total = len(quotes)
+        _update(job_id, total=total)
+        events.publish('simulation', {'id': job_id, 'stage': 'running', 'done': 0, 'total': total})
+
+        groups = {}
+        unmatched = failed = done = 0
+        chunks = [quotes[i:i + CHUNK_SIZE] for i in range(0, total, CHUNK_SIZE)]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max(1, min(WORKERS, len(chunks))), initializer=_init_worker, initargs=(path,),
+            mp_context=multiprocessing.get_context('forkserver'),
+        ) as pool:
+            futures = {pool.submit(_price_chunk, chunk): len(chunk) for chunk in chunks}
+            for future in concurrent.futures.as_completed(futures):
+                part, part_unmatched, part_failed = future.result()
+                for key, (count, original, simulated) in part.items():
+                    acc = groups.setdefault(key, [0, 0.0, 0.0])
+                    acc[0] += count
+                    acc[1] += original
+                    acc[2] += simulated
+                unmatched += part_unmatched
+                failed += part_failed
+                done += futures[future]
+                _update(job_id, done=done)
+                events.publish('simulation', {'id': job_id, 'stage': 'running', 'done': done, 'total': total})
+
+        result = _summarize(groups, skipped, unmatched, failed)
+        _update(job_id, status='done', result_json=json.dumps(result, ensure_ascii=False, separators=(',', ':')),
+                finished_at=datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        events.publish('simulation', {'id': job_id, 'stage': 'done', 'done': done, 'total': total})
+        logger.info("Симуляция %d: расчётов %d, было %s, стало %s", job_id, result['quotes'],
+                    result['totals']['original'], result['totals']['simulated'])
+    except Exception as e:
+        logger.error("Симуляция %d не выполнена: %s", job_id, e)
+        _update(job_id, status='error', error=str(e),
+                finished_at=datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        events.publish('simulation', {'id': job_id, 'stage': 'error', 'message': str(e)})
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def start_simulation(version_id, user_id, date_from=None, date_to=None):
+    """
+    Запустить пересчёт истории (date — created_at, включительно) по версии цен
+    version_id в фоновом потоке. Возвращает id задания; идёт другое — SimulationBusy.
+    """
+    with _lock:
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM simulations WHERE status = 'running'").fetchone():
+                raise SimulationBusy("Уже идёт симуляция — дождитесь её окончания")
+            job_id = conn.execute(
+                "INSERT INTO simulations (version_id, date_from, date_to, created_by) VALUES (?, ?, ?, ?)",
+                (version_id, date_from and date_from.isoformat(), date_to and date_to.isoformat(), user_id)
+            ).lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    thread = threading.Thread(target=_run, args=(job_id, version_id, date_from, date_to),
+                              name=f'simulation-{job_id}', daemon=True)
+    thread.start()
+    return job_id
+
+
+def simulation_running():
+    conn = get_db()
+    row = conn.execute("SELECT 1 FROM simulations WHERE status = 'running' LIMIT 1").fetchone()
+    conn.close()
+    return row is not None
+
+
+def _job_dict(row, with_result):
+    job = {k: row[k] for k in row.keys() if k != 'result_json'}
+    if with_result:
+        job['result'] = json.loads(row['result_json']) if row['result_json'] else None
+    return job
+
+
+def get_simulation(job_id):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM simulations WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return _job_dict(row, True) if row else None
+
+
+def get_simulations(limit=20):
+    """Последние задания без результатов, новые первыми."""
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM simulations ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [_job_dict(r, False) for r in rows]
+
+
+def fail_interrupted():
+    """Задания, оставшиеся 'running' после остановки сервера, — в ошибку (при старте)."""
+    conn = get_db()
+    try:
+        conn.execute(
+            "UPDATE simulations SET status = 'error', error = 'Прервано перезапуском сервера', "
+            "finished_at = datetime('now') WHERE status = 'running'"
+        )
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,273 @@
+"""
+Анализ покрытия тарифной сетки: дыры и пересечения интервалов.
+
+Запускается после записи цен (replace_prices_bulk, импорт, синхронизация) и
+правки праздников, а не при каждом расчёте. Результат лежит в таблице
+tariff_coverage и показывается в админке и в отчёте синхронизации.
+
+Покрытие считается по тем же данным, что и расчёт: таблица тарифных дней
+(tariff_days.DayTables) из сезонных правил season_*_md и праздников, как в
+снимке тарифов. Тарифный класс — отрезок дней года с одним набором строк цен
+и группа дней недели с одним расписанием. Сутки каждого расписания
+проверяются по кругу (ночной "22:00-10:00" закрывает утро следующего дня
+того же класса):
+    gap       — время, не покрытое ни одним интервалом;
+    overlap   — время, покрытое интервалами с разной ценой (при расчёте
+                действует начавшийся раньше);
+    duplicate — время, покрытое несколькими интервалами с одной ценой (дубли строк);
+    no_tariff — дни внутри сезонов теплохода, на которые нет ни одной строки
+                (самый длинный отрезок года без цен — межсезонье — не считается).
+Отрезки дат — месяц-день (MM-DD), каждый год; начало позже конца — через Новый
+год. Праздник — отдельная строка на свою дату (разовый — YYYY-MM-DD, прошедшие
+пропускаются) с днями «праздник (Сб)»: в этот день действует расписание
+выбранного дня недели.
+"""
+import datetime
+import logging
+
+from database import ACTIVE_PRICES, get_db, mask_to_day_range
+from tariff_days import DAYS_IN_TABLE, DayTables, date_index, day_index, split_holidays
+
+logger = logging.getLogger(__name__)
+
+DAY_MINUTES = 24 * 60
+
+SUMMARY_KEYS = {'gap': 'gaps', 'overlap': 'overlaps', 'duplicate': 'duplicates', 'no_tariff': 'no_tariff'}
+
+
+def _fmt_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _fmt_day(idx):
+    """Индекс таблицы дней → MM-DD (год — високосный, как в tariff_days)."""
+    return (datetime.date(2000, 1, 1) + datetime.timedelta(days=idx)).strftime('%m-%d')
+
+
+def _day_pieces(time_start, time_end):
+    """Интервал в минутах → куски внутри суток [0, 1440), через полночь — два куска."""
+    length = time_end - time_start if time_start < time_end else time_end + DAY_MINUTES - time_start
+    start = time_start % DAY_MINUTES
+    end = start + length
+    if end <= DAY_MINUTES:
+        return [(start, end)]
+    return [(start, DAY_MINUTES), (0, end - DAY_MINUTES)]
+
+
+def analyze_class(intervals):
+    """
+    Покрытие суток набором интервалов [(time_start_min, time_end_min, price)].
+    Возвращает список (kind, start_min, end_min, prices) для дыр, пересечений и дублей.
+    """
+    events = []
+    for time_start, time_end, price in intervals:
+        for start, end in _day_pieces(time_start, time_end):
+            if end > start:
+                events.append((start, end, price))
+
+    points = sorted({0, DAY_MINUTES} | {p for start, end, _ in events for p in (start, end)})
+    issues = []
+    for lo, hi in zip(points, points[1:]):
+        active = [price for start, end, price in events if start <= lo and end >= hi]
+        prices = tuple(sorted(set(active)))
+        if not active:
+            kind = 'gap'
+        elif len(prices) > 1:
+            kind = 'overlap'
+        elif len(active) > 1:
+            kind = 'duplicate'
+        else:
+            continue
+        if issues and issues[-1][0] == kind and issues[-1][2] == lo and issues[-1][3] == prices:
+            issues[-1] = (kind, issues[-1][1], hi, prices)
+        else:
+            issues.append((kind, lo, hi, prices))
+    return issues
+
+
+def _schedule_issues(intervals, cache):
+    """Проблемы одного расписания (расписания общие — каждое проверяется один раз)."""
+    issues = cache.get(intervals)
+    if issues is None:
+        issues = cache[intervals] = analyze_class(intervals) if intervals else [('no_tariff', 0, DAY_MINUTES, ())]
+    return issues
+
+
+def _off_season(empty):
+    """Самый длинный отрезок дней без цен (по кругу года) — межсезонье, проблемой не считается."""
+    first = empty.index(False)
+    longest, run = [], []
+    for step in range(1, DAYS_IN_TABLE + 1):
+        idx = (first + step) % DAYS_IN_TABLE
+        if empty[idx]:
+            run.append(idx)
+            continue
+        if len(run) > len(longest):
+            longest = run
+        run = []
+    return set(longest)
+
+
+def analyze_boat(days, tables, recurring=(), dated=None, cache=None):
+    """
+    days — таблица дней теплохода из tables.add_boat, recurring — праздники без года
+    [(месяц, день, priced_as)], dated — разовые {ordinal: priced_as}.
+    Возвращает проблемы [(дата начала, дата конца, дни, kind, start_min, end_min, prices)].
+    """
+    cache = {} if cache is None else cache
+    classes = [value >> 3 for value in days]
+    empty = [not any(tables.schedules[sid] for sid in tables.weeks[wid]) for wid in classes]
+    if all(empty):
+        return []
+    off_season = _off_season(empty)
+
+    found = []
+    for idx, wid in enumerate(classes):
+        if idx in off_season:
+            continue
+        by_schedule = {}
+        for weekday, sid in enumerate(tables.weeks[wid]):
+            by_schedule[sid] = by_schedule.get(sid, 0) | (1 << weekday)
+        for sid, mask in by_schedule.items():
+            for kind, start, end, prices in _schedule_issues(tables.schedules[sid], cache):
+                found.append((idx, idx, mask, kind, start, end, prices))
+
+    # Склеить одинаковые проблемы на соседних днях
+    found.sort(key=lambda f: (f[2:], f[0]))
+    merged = []
+    for item in found:
+        prev = merged[-1] if merged else None
+        if prev and prev[2:] == item[2:] and prev[1] + 1 == item[0]:
+            merged[-1] = (prev[0], item[1]) + item[2:]
+        else:
+            merged.append(item)
+    # 31 декабря и 1 января — тоже соседние дни: отрезок до конца года продолжается с начала
+    last = DAYS_IN_TABLE - 1
+    heads = {item[2:]: item for item in merged if item[0] == 0 and item[1] < last}
+    tails = {item[2:]: item for item in merged if item[0] > 0 and item[1] == last}
+    joined = []
+    for item in merged:
+        key = item[2:]
+        if key in heads and key in tails:
+            if item is heads[key]:
+                continue
+            if item is tails[key]:
+                item = (item[0], heads[key][1]) + key
+        joined.append(item)
+    joined.sort(key=lambda f: (f[0], f[3], f[4]))
+    records = [(_fmt_day(ds), _fmt_day(de), mask_to_day_range(mask), kind, start, end, prices)
+               for ds, de, mask, kind, start, end, prices in joined]
+
+    # Праздник считается по расписанию выбранного дня недели в классе своей даты
+    holidays = [(day_index(month, day), f"{month:02d}-{day:02d}", priced_as) for month, day, priced_as in recurring]
+    today = datetime.date.today().toordinal()
+    for ordinal, priced_as in sorted((dated or {}).items()):
+        if ordinal >= today:
+            day = datetime.date.fromordinal(ordinal)
+            holidays.append((date_index(day), day.isoformat(), priced_as))
+    for idx, label, priced_as in holidays:
+        if empty[idx]:
+            continue
+        sid = tables.weeks[classes[idx]][priced_as]
+        day_range = f"праздник ({mask_to_day_range(1 << priced_as)})"
+        for kind, start, end, prices in _schedule_issues(tables.schedules[sid], cache):
+            records.append((label, label, day_range, kind, start, end, prices))
+    return records
+
+
+def analyze_coverage(boat_ids=None):
+    """
+    Пересчитать покрытие активной версии цен для теплоходов boat_ids (None — для всех)
+    и сохранить в tariff_coverage. Возвращает сводку coverage_summary.
+    """
+    conn = get_db()
+    try:
+        if boat_ids is None:
+            boat_ids = [r[0] for r in conn.execute("SELECT id FROM boats")]
+        boat_ids = list(boat_ids)
+        recurring, dated = split_holidays(
+            tuple(r) for r in conn.execute("SELECT month, day, year, priced_as FROM holidays")
+        )
+        tables = DayTables()
+        cache = {}
+        records = []
+        for boat_id in boat_ids:
+            rows = conn.execute(
+                "SELECT season_start_md, season_end_md, time_start_min, time_end_min, weekday_mask, price_per_hour "
+                f"FROM prices WHERE boat_id = ? AND {ACTIVE_PRICES} AND season_start_md IS NOT NULL "
+                "AND time_start_min IS NOT NULL AND time_end_min IS NOT NULL AND weekday_mask IS NOT NULL "
+                "ORDER BY time_start_min, id",
+                (boat_id,)
+            ).fetchall()
+            days = tables.add_boat([tuple(r) for r in rows], recurring)
+            for ds, de, day_range, kind, start, end, prices in analyze_boat(days, tables, recurring, dated, cache):
+                records.append((
+                    boat_id, ds, de, day_range, kind,
+                    _fmt_minutes(start), _fmt_minutes(end), ' / '.join(f"{int(p)}" for p in prices),
+                ))
+
+        conn.executemany("DELETE FROM tariff_coverage WHERE boat_id = ?", [(b,) for b in boat_ids])
+        conn.executemany(
+            "INSERT INTO tariff_coverage (boat_id, date_start, date_end, day_range, kind, time_start, time_end, prices) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            records
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info("Покрытие тарифов: теплоходов %d, найдено проблем %d", len(boat_ids), len(records))
+    return coverage_summary(boat_ids)
+
+
+def coverage_summary(boat_ids=None):
+    """Сводка для отчёта синхронизации: какие теплоходы с дырами / пересечениями / дублями."""
+    conn = get_db()
+    sql = "SELECT DISTINCT b.name, c.kind FROM tariff_coverage c JOIN boats b ON b.id = c.boat_id"
+    params = []
+    if boat_ids is not None:
+        boat_ids = list(boat_ids)
+        if not boat_ids:
+            conn.close()
+            return {key: [] for key in SUMMARY_KEYS.values()}
+        sql += f" WHERE c.boat_id IN ({','.join('?' * len(boat_ids))})"
+        params = boat_ids
+    sql += " ORDER BY b.name"
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+
+    summary = {key: [] for key in SUMMARY_KEYS.values()}
+    for row in rows:
+        summary[SUMMARY_KEYS[row['kind']]].append(row['name'])
+    return summary
+
+
+def format_summary(summary):
+    """Короткая строка для sync_log (дубли не упоминаются — на расчёт они не влияют)."""
+    parts = []
+    if summary['gaps']:
+        parts.append(f"дыры в тарифах: {len(summary['gaps'])}")
+    if summary['overlaps']:
+        parts.append(f"пересечения цен: {len(summary['overlaps'])}")
+    if summary['no_tariff']:
+        parts.append(f"дни без тарифа: {len(summary['no_tariff'])}")
+    return ', '.join(parts)
+
+
+def get_coverage(boat_id=None):
+    """Все найденные проблемы покрытия (с названием теплохода) — для админки."""
+    conn = get_db()
+    sql = (
+        "SELECT c.boat_id, b.name, c.date_start, c.date_end, c.day_range, c.kind, c.time_start, c.time_end, c.prices, c.analyzed_at "
+        "FROM tariff_coverage c JOIN boats b ON b.id = c.boat_id"
+    )
+    params = ()
+    if boat_id is not None:
+        sql += " WHERE c.boat_id = ?"
+        params = (boat_id,)
+    sql += " ORDER BY b.name, c.date_start, c.kind, c.time_start"
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
@@ -0,0 +1,150 @@
+"""
+Таблица тарифных дней: день года → тарифный класс, собирается заранее.
+
+Сезон в ценах — повторяющееся каждый год правило «с месяца-дня по месяц-день»
+(prices.season_start_md / season_end_md, ММДД; начало позже конца — сезон через
+Новый год). Год в date_start / date_end на расчёт не влияет: цены прошлой
+синхронизации действуют и в следующем году.
+
+Праздники (таблица holidays) считаются по тарифу выбранного дня недели
+(priced_as: 0 — Пн … 6 — Вс). Праздник без года повторяется каждый год и
+зашит в таблицу; праздник с годом (перенос, разовый выходной) проверяется
+отдельно по словарю дат.
+
+Для теплохода собирается:
+    days     — 366 чисел, индекс — день года по високосному календарю
+               (29 февраля — свой день, 1 марта — всегда один индекс);
+               значение = класс * 8 + слот, слот 0 — обычный день,
+               1..7 — праздник по тарифу дня недели слот - 1;
+    weeks    — класс → 7 номеров расписаний (по дням недели);
+    schedules — номер → интервалы ((time_start_min, time_end_min, price), ...).
+Расписания и классы общие для всех теплоходов (одинаковые хранятся один раз).
+Тариф на дату — один индекс в days и один в weeks (PricingSnapshot.schedule).
+"""
+import datetime
+from array import array
+
+DAYS_IN_TABLE = 366
+
+# Смещения месяцев в високосном году
+_MONTH_OFFSETS = [0]
+for _days in (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31):
+    _MONTH_OFFSETS.append(_MONTH_OFFSETS[-1] + _days)
+
+WHOLE_YEAR = (101, 1231)
+
+
+def day_index(month, day):
+    """(месяц, день) → индекс в таблице дней (0..365)."""
+    return _MONTH_OFFSETS[month - 1] + day - 1
+
+
+def date_index(day):
+    return _MONTH_OFFSETS[day.month - 1] + day.day - 1
+
+
+def month_day(day):
+    """date → ММДД (14 мая → 514)."""
+    return day.month * 100 + day.day
+
+
+def season_rule(date_start, date_end):
+    """
+    Отрезок дат строки цены → правило (start_md, end_md). Отрезок в год и
+    длиннее — весь год; отрезок через Новый год — правило с началом позже конца.
+    Конец раньше начала — (None, None), строка в расписание не попадает.
+    """
+    if date_end < date_start:
+        return None, None
+    if (date_end - date_start).days >= 365:
+        return WHOLE_YEAR
+    return month_day(date_start), month_day(date_end)
+
+
+def season_days(start_md, end_md):
+    """Индексы дней, которые покрывает правило (с переходом через Новый год)."""
+    start = day_index(start_md // 100, start_md % 100)
+    end = day_index(end_md // 100, end_md % 100)
+    if start <= end:
+        return range(start, end + 1)
+    return list(range(start, DAYS_IN_TABLE)) + list(range(0, end + 1))
+
+
+class DayTables:
+    """Таблицы дней нескольких теплоходов с общими классами и расписаниями."""
+
+    def __init__(self):
+        self.schedules = []
+        self.weeks = []
+        self._schedule_ids = {}
+        self._week_ids = {}
+
+    def _schedule_id(self, intervals):
+        sid = self._schedule_ids.get(intervals)
+        if sid is None:
+            sid = self._schedule_ids[intervals] = len(self.schedules)
+            self.schedules.append(intervals)
+        return sid
+
+    def _week_id(self, week):
+        wid = self._week_ids.get(week)
+        if wid is None:
+            wid = self._week_ids[week] = len(self.weeks)
+            self.weeks.append(week)
+        return wid
+
+    def add_boat(self, rows, holidays=()):
+        """
+        rows — цены теплохода (season_start_md, season_end_md, time_start_min, time_end_min,
+        weekday_mask, price) в порядке time_start_min, id; holidays — [(месяц, день, priced_as)]
+        без года. Возвращает days теплохода (array из 366 значений).
+        """
+        per_day = [[] for _ in range(DAYS_IN_TABLE)]
+        for i, row in enumerate(rows):
+            for idx in season_days(row[0], row[1]):
+                per_day[idx].append(i)
+
+        slots = [0] * DAYS_IN_TABLE
+        for month, day, priced_as in holidays:
+            slots[day_index(month, day)] = priced_as + 1
+
+        by_rows = {}
+        days = array('i', bytes(4 * DAYS_IN_TABLE))
+        for idx, active in enumerate(per_day):
+            key = tuple(active)
+            wid = by_rows.get(key)
+            if wid is None:
+                week = tuple(
+                    self._schedule_id(tuple((rows[i][2], rows[i][3], rows[i][5]) for i in key if rows[i][4] & (1 << weekday)))
+                    for weekday in range(7)
+                )
+                wid = by_rows[key] = self._week_id(week)
+            days[idx] = wid * 8 + slots[idx]
+        return days
+
+
+def priced_weekday(day, value, dated=None):
+    """Значение из days на дату → день недели, по тарифу которого она считается."""
+    if dated:
+        weekday = dated.get(day.toordinal())
+        if weekday is not None:
+            return weekday
+    slot = value & 7
+    return slot - 1 if slot else day.weekday()
+
+
+def split_holidays(holidays):
+    """
+    Строки holidays (month, day, year, priced_as) → (повторяющиеся [(месяц, день, priced_as)],
+    разовые {ordinal: priced_as}). Разовый праздник несуществующей даты пропускается.
+    """
+    recurring, dated = [], {}
+    for month, day, year, priced_as in holidays:
+        if year is None:
+            recurring.append((month, day, priced_as))
+            continue
+        try:
+            dated[datetime.date(year, month, day).toordinal()] = priced_as
+        except ValueError:
+            continue
+    return recurring, dated
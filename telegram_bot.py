@@ -1,14 +1,27 @@
+import asyncio
+import html
 import logging
-from telegram import Update
+from telegram import (
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputTextMessageContent,
+    LinkPreviewOptions,
+    Update,
+)
+from telegram.constants import ParseMode
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
+    InlineQueryHandler,
     MessageHandler,
     ContextTypes,
     filters,
 )
 import config
-from rental_calculator import parse_request, calculate_rental, refresh_data
+import inline_quotes
+import tg_webhook
+from rental_calculator import calculate_rental, refresh_data
+from request_parser import parse_message
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,15 +34,39 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     welcome_text = (
         "Привет! Я бот для расчёта стоимости аренды теплоходов.\n\n"
         "Формат запроса:\n"
-        "1-я строка: дата (формат dd.mm.yy)\n"
+        "1-я строка: дата (16.08.26, 16.08.2026, день недели — «пт», «в субботу», или «завтра»)\n"
         "2-я строка: название теплохода\n"
-        "3-я строка: временной интервал (либо 2 значения, либо 4 для технических часов)\n\n"
-        "Если в одном сообщении несколько запросов, отправьте их подряд (без пустых строк),\n"
-        "либо пустые строки будут игнорированы и все непустые строки будут сгруппированы по 3.\n\n"
+        "3-я строка: время — 2 значения или 4 для технических часов "
+        "(«18-23», «18.00-23.30», «с 18 до 23», «16-17-23-23:30»)\n\n"
+        "Несколько запросов можно отправить одним сообщением подряд; пустые строки не важны. "
+        "Ошибка в одном запросе не мешает остальным — в ответе будет указано, в какой строке она.\n\n"
+        "В любом чате можно набрать @имя_бота и запрос в одну строку — «14.06.26 Сицилия 18-22» — "
+        "и выбрать расчёт из списка.\n\n"
         "Для обновления базы данных отправьте команду /update_data или сообщение 'Обнови базу'."
     )
     await update.message.reply_text(welcome_text, disable_web_page_preview=True)
 
+def build_reply(text):
+    """Текст сообщения → ответ бота (HTML). Блокирующая часть: разбор, снимок, SQLite."""
+    blocks = parse_message(text)
+    if not blocks:
+        return None
+
+    responses = []
+    for block in blocks:
+        if not block.ok:
+            responses.append(html.escape(f"Ошибка в запросе:\n{block.text}\n{block.error_message()}"))
+            continue
+        try:
+            quote = calculate_rental(block.date, block.boat_name, block.times)
+            responses.append(quote.to_telegram())
+        except Exception as e:
+            logger.error("Ошибка при обработке блока: %s", e)
+            responses.append(html.escape(f"Ошибка при обработке запроса:\n{block.text}\nОшибка: {e}"))
+
+    # Объединяем ответы без разделителей, просто через двойной перенос строки
+    return "\n\n".join(responses)
+
 async def update_data_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         refresh_data()
@@ -51,42 +88,71 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await update.message.reply_text(f"Ошибка обновления базы: {e}", disable_web_page_preview=True)
         return
 
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    if not lines:
+    # Расчёт — в пуле потоков цикла: в ASGI-режиме (asgi.py) цикл общий с API
+    reply = await asyncio.get_running_loop().run_in_executor(None, build_reply, text)
+    if reply is None:
         await update.message.reply_text("Пустое сообщение.", disable_web_page_preview=True)
         return
+    await update.message.reply_text(reply, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
-    if len(lines) % 3 != 0:
-        await update.message.reply_text(
-            "Ошибка: общее число непустых строк должно быть кратно 3 (дата, название, временной интервал для каждого запроса).",
-            disable_web_page_preview=True
-        )
+# Последний inline-запрос каждого пользователя: ответ на устаревший не отправляется
+_latest_inline = {}
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+    user_id = query.from_user.id
+    _latest_inline[user_id] = query.id
+    answer = await asyncio.get_running_loop().run_in_executor(None, inline_quotes.answer, query.query)
+    # Пока считали, пользователь набрал следующую букву — этот список Telegram уже не покажет
+    if _latest_inline.get(user_id) != query.id:
         return
+    del _latest_inline[user_id]
 
-    responses = []
-    for i in range(0, len(lines), 3):
-        block_lines = lines[i:i+3]
-        block_text = "\n".join(block_lines)
-        try:
-            date_obj, boat_name, times = parse_request(block_text)
-            result = calculate_rental(date_obj, boat_name, times)
-            responses.append(result)
-        except Exception as e:
-            logger.error("Ошибка при обработке блока: %s", e)
-            responses.append(f"Ошибка при обработке запроса:\n{block_text}\nОшибка: {e}")
+    no_preview = LinkPreviewOptions(is_disabled=True)
+    results = [
+        InlineQueryResultArticle(
+            id=item['id'],
+            title=item['title'],
+            description=item['description'],
+            input_message_content=InputTextMessageContent(
+                item['text'], parse_mode=ParseMode.HTML, link_preview_options=no_preview
+            ),
+        )
+        for item in answer['results']
+    ]
+    button = InlineQueryResultsButton(text=answer['hint'], start_parameter='inline') if answer['hint'] else None
+    try:
+        # Расчёт одинаков для всех — общий кеш Telegram на текст запроса
+        await query.answer(results, cache_time=answer['cache_time'], is_personal=False, button=button)
+    except Exception as e:
+        # Запрос устарел (Telegram ждёт ответ несколько секунд) — просто пропускаем
+        logger.warning("Inline-ответ не отправлен: %s", e)
 
-    # Объединяем ответы без разделителей, просто через двойной перенос строки
-    reply = "\n\n".join(responses)
-    await update.message.reply_text(reply, disable_web_page_preview=True)
+# Сколько обновлений обрабатывается одновременно (расчёты — в пуле потоков)
+CONCURRENT_UPDATES = 16
 
-def main() -> None:
-    application = ApplicationBuilder().token(config.TOKEN).build()
+def build_application(token=None, base_url=None):
+    """
+    Application с обработчиками — для main и для ASGI-режима (asgi.py).
+    base_url — свой сервер Bot API (по умолчанию api.telegram.org).
+    """
+    builder = ApplicationBuilder().token(token or config.TOKEN).concurrent_updates(CONCURRENT_UPDATES)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("update_data", update_data_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    return application
 
-    application.run_polling()
+def main() -> None:
+    """Заданы TELEGRAM_WEBHOOK_URL и TELEGRAM_WEBHOOK_SECRET — webhook (tg_webhook.py), иначе polling."""
+    if tg_webhook.configured():
+        asyncio.run(tg_webhook.serve(build_application()))
+    else:
+        build_application().run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Webhook Telegram-бота: Telegram сам присылает обновления POST-запросами на
+https://<домен>/tg/<секрет> вместо долгого опроса getUpdates.
+
+Nginx проксирует /tg/ на лёгкий HTTP-сервер на asyncio (serve) или, в
+ASGI-режиме, на asgi.py — маршрут тот же. Обновление принимается, только если
+путь содержит секрет и заголовок X-Telegram-Bot-Api-Secret-Token с ним совпадает
+(сравнение за постоянное время). Принятое обновление кладётся в очередь
+Application, и ответ 200 уходит сразу. Application с concurrent_updates
+обрабатывает несколько обновлений одновременно: медленный расчёт не держит
+остальные, Telegram не ждёт и не повторяет доставку.
+
+Остановка (SIGTERM / SIGINT): сервер перестаёт принимать соединения, Application
+дорабатывает принятые обновления и останавливается. Webhook в Telegram остаётся —
+обновления за время перезапуска Telegram доставит позже.
+Установить webhook не удалось — бот работает через polling.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from telegram import Update
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес сайта (https://домен) — без него webhook не используется
+WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL', '').rstrip('/')
+
+# Секрет пути и заголовка: A-Z, a-z, 0-9, _ и -, до 256 символов
+WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
+
+# Адрес лёгкого сервера (отдельный процесс бота); nginx: location /tg/ → сюда
+LISTEN_HOST = '127.0.0.1'
+LISTEN_PORT = int(os.environ.get('TELEGRAM_WEBHOOK_PORT', '5002'))
+
+PATH_PREFIX = '/tg/'
+
+# Обновление Telegram — небольшой JSON
+MAX_BODY_BYTES = 1024 * 1024
+
+# Сколько соединений Telegram может держать к webhook
+MAX_CONNECTIONS = 40
+
+# Сколько держать простаивающее keep-alive соединение, секунд
+KEEPALIVE_TIMEOUT = 75
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large'}
+
+# Открытые соединения сервера: при остановке простаивающие keep-alive закрываются
+_writers = set()
+
+
+def configured():
+    return bool(WEBHOOK_URL and WEBHOOK_SECRET)
+
+
+def webhook_path():
+    return PATH_PREFIX + WEBHOOK_SECRET
+
+
+async def set_webhook(application):
+    """Зарегистрировать webhook в Telegram → True; ошибка — False (бот остаётся на polling)."""
+    try:
+        return await application.bot.set_webhook(
+            url=WEBHOOK_URL + webhook_path(),
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=MAX_CONNECTIONS,
+        )
+    except Exception as e:
+        logger.error("Webhook не установлен, бот работает через polling: %s", e)
+        return False
+
+
+async def accept_update(application, path, secret, body):
+    """
+    Запрос Telegram (путь, заголовок секрета, тело) → HTTP-статус. Обновление
+    ставится в очередь Application; обработка — после ответа.
+    """
+    if path != webhook_path():
+        return 404
+    if not secret or not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+        return 403
+    try:
+        update = Update.de_json(json_codec.loads(body), application.bot)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning("Неразборчивое обновление Telegram: %s", e)
+        return 400
+    await application.update_queue.put(update)
+    return 200
+
+
+# === Лёгкий HTTP-сервер ===
+
+async def _read_request(reader):
+    """
+    HTTP/1.1-запрос → (метод, путь, {заголовок: значение}, тело) | None, если соединение закрыто.
+    Тело None — больше MAX_BODY_BYTES, False — Content-Length не целое число ≥ 0: тело не
+    читается, где начинается следующий запрос, неизвестно.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    path = target.split('?', 1)[0]
+    length = headers.get('content-length') or '0'
+    if not (length.isascii() and length.isdigit()):
+        return method, path, headers, False
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        return method, path, headers, None
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+async def _connection(application, reader, writer):
+    _writers.add(writer)
+    try:
+        while True:
+            request = await _read_request(reader)
+            if request is None:
+                break
+            method, path, headers, body = request
+            if body is None:
+                status = 413
+            elif body is False:
+                status = 400
+            elif method != 'POST':
+                status = 405
+            else:
+                status = await accept_update(application, path, headers.get(SECRET_HEADER), body)
+            # Тело не прочитано — соединение дальше не разобрать
+            close = not isinstance(body, bytes) or headers.get('connection', '').lower() == 'close'
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Length: 0\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode()
+            )
+            await writer.drain()
+            if close:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        _writers.discard(writer)
+        writer.close()
+
+
+async def start_server(application, host=LISTEN_HOST, port=LISTEN_PORT):
+    return await asyncio.start_server(lambda r, w: _connection(application, r, w), host, port)
+
+
+async def stop_server(server):
+    """Перестать принимать соединения и закрыть открытые (принятые обновления уже в очереди)."""
+    server.close()
+    for writer in list(_writers):
+        writer.close()
+    await server.wait_closed()
+
+
+async def serve(application, host=LISTEN_HOST, port=LISTEN_PORT):
+    """
+    Отдельный процесс бота в режиме webhook (telegram_bot.main): сервер на
+    host:port, обработка до SIGTERM / SIGINT, затем плавная остановка.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await application.initialize()
+    server = None
+    if await set_webhook(application):
+        server = await start_server(application, host, port)
+        logger.info("Бот принимает webhook на %s:%d%s…", host, port, PATH_PREFIX)
+    else:
+        await application.updater.start_polling()
+    await application.start()
+    try:
+        await stopping.wait()
+    finally:
+        if server is not None:
+            await stop_server(server)
+        else:
+            await application.updater.stop()
+        # stop() дожидается обработки уже принятых обновлений
+        await application.stop()
+        await application.shutdown()
@@ -0,0 +1,229 @@
+"""
+Статистика использования: сколько расчётов делают менеджеры, какие теплоходы
+и даты спрашивают, средняя сумма расчёта.
+
+Считать её по calculations.results_json — это чтение и разбор JSON всей
+истории на каждый запрос. Вместо этого итоги копятся в сводных таблицах по
+дням (день — дата created_at, UTC):
+    stats_user_daily   — расчёты, варианты, ошибки и сумма по менеджеру;
+    stats_boat_daily   — варианты и сумма по теплоходу;
+    stats_date_daily   — сколько раз спрашивали дату аренды.
+
+Обновление инкрементальное, по отметке последнего учтённого расчёта
+(stats_state.last_calculation_id): update_usage_stats(conn) берёт только
+расчёты с id больше отметки. save_calculations_batch вызывает её в своей
+транзакции, поэтому таблицы совпадают с историей на каждый commit; при
+старте она же догоняет историю, записанную до появления таблиц.
+
+Удаление записи из истории статистику не уменьшает — считаются сделанные расчёты.
+"""
+import datetime
+import logging
+import re
+
+import json_codec
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Сколько расчётов разбирать за один проход догоняющего обновления
+CATCH_UP_BATCH = 2000
+
+STATE_KEY = 'last_calculation_id'
+
+# Записи истории до QuoteResult хранили готовый Markdown
+_LEGACY_HEAD = re.compile(r'^\*\*(\d{2}\.\d{2}\.\d{2})\*\*\n\n\*\*(.+?)\*\* - ')
+_LEGACY_TOTAL = re.compile(r'= \*\*([\d ]+)\*\*₽')
+
+
+def _quote_facts(item):
+    """Элемент results_json → (дата аренды ISO | None, теплоход | None, итог | None) или None для ошибки."""
+    if 'quote' in item:
+        data = item['quote']
+        return datetime.date.fromordinal(data[1]).isoformat(), data[2], data[10]
+    if 'result' in item:
+        text = item['result']
+        head = _LEGACY_HEAD.match(text)
+        total = _LEGACY_TOTAL.search(text)
+        day = boat = None
+        if head:
+            day = datetime.datetime.strptime(head.group(1), '%d.%m.%y').date().isoformat()
+            boat = head.group(2)
+        return day, boat, float(total.group(1).replace(' ', '')) if total else None
+    return None
+
+
+def _aggregate(rows):
+    """[(user_id, results_json, created_at)] → словари приращений для трёх таблиц."""
+    users, boats, dates = {}, {}, {}
+    for user_id, results_json, created_at in rows:
+        day = created_at[:10]
+        u = users.setdefault((day, user_id), [0, 0, 0, 0, 0.0])
+        u[0] += 1
+        try:
+            results = json_codec.loads(results_json)
+        except ValueError:
+            continue
+        for item in results:
+            facts = _quote_facts(item)
+            if facts is None:
+                u[2] += 1
+                continue
+            rental_date, boat, total = facts
+            u[1] += 1
+            if total is not None:
+                u[3] += 1
+                u[4] += total
+            if boat:
+                b = boats.setdefault((day, boat), [0, 0, 0.0])
+                b[0] += 1
+                if total is not None:
+                    b[1] += 1
+                    b[2] += total
+            if rental_date:
+                dates[(day, rental_date)] = dates.get((day, rental_date), 0) + 1
+    return users, boats, dates
+
+
+def _apply(conn, users, boats, dates):
+    conn.executemany(
+        "INSERT INTO stats_user_daily (day, user_id, calculations, quotes, errors, priced, total_sum) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (day, user_id) DO UPDATE SET "
+        "calculations = calculations + excluded.calculations, quotes = quotes + excluded.quotes, "
+        "errors = errors + excluded.errors, priced = priced + excluded.priced, total_sum = total_sum + excluded.total_sum",
+        [key + tuple(v) for key, v in users.items()]
+    )
+    conn.executemany(
+        "INSERT INTO stats_boat_daily (day, boat_name, quotes, priced, total_sum) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (day, boat_name) DO UPDATE SET "
+        "quotes = quotes + excluded.quotes, priced = priced + excluded.priced, total_sum = total_sum + excluded.total_sum",
+        [key + tuple(v) for key, v in boats.items()]
+    )
+    conn.executemany(
+        "INSERT INTO stats_date_daily (day, rental_date, quotes) VALUES (?, ?, ?) "
+        "ON CONFLICT (day, rental_date) DO UPDATE SET quotes = quotes + excluded.quotes",
+        [key + (v,) for key, v in dates.items()]
+    )
+
+
+def update_usage_stats(conn=None):
+    """
+    Учесть расчёты после отметки. С conn — внутри транзакции вызывающего
+    (commit за ним), без — своим соединением, пачками по CATCH_UP_BATCH.
+    Возвращает число учтённых расчётов.
+    """
+    own = conn is None
+    if own:
+        conn = get_db()
+    counted = 0
+    try:
+        while True:
+            mark = conn.execute("SELECT value FROM stats_state WHERE key = ?", (STATE_KEY,)).fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, user_id, results_json, created_at FROM calculations WHERE id > ? ORDER BY id LIMIT ?",
+                (mark, CATCH_UP_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            _apply(conn, *_aggregate((r['user_id'], r['results_json'], r['created_at']) for r in rows))
+            conn.execute("UPDATE stats_state SET value = ? WHERE key = ?", (rows[-1]['id'], STATE_KEY))
+            counted += len(rows)
+            if own:
+                conn.commit()
+            if len(rows) < CATCH_UP_BATCH:
+                break
+    except Exception:
+        if own:
+            conn.rollback()
+        raise
+    finally:
+        if own:
+            conn.close()
+    if own and counted:
+        logger.info("Статистика использования: учтено расчётов %d", counted)
+    return counted
+
+
+def _day_filter(date_from, date_to, column='day'):
+    clauses, params = [], []
+    if date_from:
+        clauses.append(f"{column} >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        clauses.append(f"{column} <= ?")
+        params.append(date_to.isoformat())
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _average(total_sum, priced):
+    return round(total_sum / priced) if priced else None
+
+
+def get_usage_stats(date_from=None, date_to=None, top=10):
+    """
+    Сводка за период (date — включительно, None — без границы) для /api/admin/stats.
+    Читает только сводные таблицы: размер истории на время ответа не влияет.
+    """
+    where, params = _day_filter(date_from, date_to)
+    joined_where, _ = _day_filter(date_from, date_to, 's.day')
+    conn = get_db()
+    try:
+        totals = conn.execute(
+            "SELECT COALESCE(SUM(calculations), 0) AS calculations, COALESCE(SUM(quotes), 0) AS quotes, "
+            "COALESCE(SUM(errors), 0) AS errors, COALESCE(SUM(priced), 0) AS priced, "
+            f"COALESCE(SUM(total_sum), 0) AS total_sum FROM stats_user_daily{where}",
+            params
+        ).fetchone()
+        by_day = conn.execute(
+            "SELECT s.day, s.user_id, u.username, u.display_name, s.calculations, s.quotes, s.errors, s.priced, s.total_sum "
+            f"FROM stats_user_daily s LEFT JOIN users u ON u.id = s.user_id{joined_where} "
+            "ORDER BY s.day, u.display_name",
+            params
+        ).fetchall()
+        managers = conn.execute(
+            "SELECT s.user_id, u.username, u.display_name, SUM(s.calculations) AS calculations, "
+            "SUM(s.quotes) AS quotes, SUM(s.errors) AS errors, SUM(s.priced) AS priced, SUM(s.total_sum) AS total_sum "
+            f"FROM stats_user_daily s LEFT JOIN users u ON u.id = s.user_id{joined_where} "
+            "GROUP BY s.user_id ORDER BY quotes DESC",
+            params
+        ).fetchall()
+        boats = conn.execute(
+            "SELECT boat_name, SUM(quotes) AS quotes, SUM(priced) AS priced, SUM(total_sum) AS total_sum "
+            f"FROM stats_boat_daily{where} GROUP BY boat_name ORDER BY quotes DESC, boat_name LIMIT ?",
+            params + [top]
+        ).fetchall()
+        dates = conn.execute(
+            f"SELECT rental_date, SUM(quotes) AS quotes FROM stats_date_daily{where} "
+            "GROUP BY rental_date ORDER BY quotes DESC, rental_date LIMIT ?",
+            params + [top]
+        ).fetchall()
+    finally:
+        conn.close()
+
+    def manager(r):
+        return {
+            'user_id': r['user_id'],
+            'username': r['username'],
+            'display_name': r['display_name'],
+            'calculations': r['calculations'],
+            'quotes': r['quotes'],
+            'errors': r['errors'],
+            'average_total': _average(r['total_sum'], r['priced']),
+        }
+
+    return {
+        'totals': {
+            'calculations': totals['calculations'],
+            'quotes': totals['quotes'],
+            'errors': totals['errors'],
+            'average_total': _average(totals['total_sum'], totals['priced']),
+        },
+        'managers': [manager(r) for r in managers],
+        'by_day': [dict(manager(r), day=r['day']) for r in by_day],
+        'top_boats': [
+            {'boat': r['boat_name'], 'quotes': r['quotes'], 'average_total': _average(r['total_sum'], r['priced'])}
+            for r in boats
+        ],
+        'top_dates': [{'date': r['rental_date'], 'quotes': r['quotes']} for r in dates],
+    }
@@ -19,8 +19,8 @@ MONTHS = {
     'сентябрь': 9, 'октябрь': 10, 'ноябрь': 11, 'декабрь': 12,
 }
 
-# Текущий год для формирования дат
-YEAR = date.today().year
+# Сезоны — повторяющиеся правила по месяцу-дню (tariff_days.py): год в датах
+# нужен только для записи date_start / date_end и берётся на момент разбора
 
 
 def _clean_text(text):
@@ -33,16 +33,16 @@ def _clean_text(text):
     return text
 
 
-def _parse_date(day_str, month_str):
-    """Парсит '14 мая' → date(YEAR, 5, 14)."""
+def _parse_date(day_str, month_str, year):
+    """Парсит '14 мая' → date(year, 5, 14)."""
     day = int(day_str)
     month = MONTHS.get(month_str.lower())
     if not month:
         raise ValueError(f"Неизвестный месяц: {month_str}")
-    return date(YEAR, month, day)
+    return date(year, month, day)
 
 
-def parse_season_dates(text):
+def parse_season_dates(text, year=None):
     """
     Парсит текстовое описание сезонных дат в список пар (date_start, date_end).
 
@@ -51,10 +51,14 @@ def parse_season_dates(text):
         "с 15 мая по 9 июня и с 1 июля по 15 сентября" → [(05-15, 06-09), (07-01, 09-15)]
         "с 10 июня по 30 июня" → [(06-10, 06-30)]
         "весь сезон" / пустая строка → [(01-01, 12-31)]
+
+    year — год для дат (по умолчанию текущий на момент вызова).
     """
+    if year is None:
+        year = date.today().year
     text = _clean_text(text)
     if not text or text.lower() in ('весь сезон', 'весь год', 'круглый год'):
-        return [(date(YEAR, 1, 1), date(YEAR, 12, 31))]
+        return [(date(year, 1, 1), date(year, 12, 31))]
 
     # Убираем текстовые названия сезонов в начале ("Белые ночи с 5 июня...")
     text = re.sub(r'^[А-Яа-яёЁ]+\s+[А-Яа-яёЁ]+\s+(?=с\s)', '', text)
@@ -73,45 +77,45 @@ def parse_season_dates(text):
         # "с/со DD месяца по/до DD месяца"
         m = re.match(r'(?:с|со)\s+(\d+)\s+(\w+)\s+(?:по|до)\s+(\d+)\s+(\w+)', part, re.IGNORECASE)
         if m:
-            d_start = _parse_date(m.group(1), m.group(2))
-            d_end = _parse_date(m.group(3), m.group(4))
+            d_start = _parse_date(m.group(1), m.group(2), year)
+            d_end = _parse_date(m.group(3), m.group(4), year)
             ranges.append((d_start, d_end))
             continue
 
         # "DD месяца по DD месяца" (без "с")
         m = re.match(r'(\d+)\s+(\w+)\s+по\s+(\d+)\s+(\w+)', part, re.IGNORECASE)
         if m and m.group(2).lower() in MONTHS:
-            d_start = _parse_date(m.group(1), m.group(2))
-            d_end = _parse_date(m.group(3), m.group(4))
+            d_start = _parse_date(m.group(1), m.group(2), year)
+            d_end = _parse_date(m.group(3), m.group(4), year)
             ranges.append((d_start, d_end))
             continue
 
         # "до/по DD месяца"
         m = re.match(r'(?:до|по)\s+(\d+)\s+(\w+)', part, re.IGNORECASE)
         if m:
-            d_end = _parse_date(m.group(1), m.group(2))
-            ranges.append((date(YEAR, 1, 1), d_end))
+            d_end = _parse_date(m.group(1), m.group(2), year)
+            ranges.append((date(year, 1, 1), d_end))
             continue
 
         # "с/со/от DD месяца"
         m = re.match(r'(?:с|со|от)\s+(\d+)\s+(\w+)', part, re.IGNORECASE)
         if m:
-            d_start = _parse_date(m.group(1), m.group(2))
-            ranges.append((d_start, date(YEAR, 12, 31)))
+            d_start = _parse_date(m.group(1), m.group(2), year)
+            ranges.append((d_start, date(year, 12, 31)))
             continue
 
         # Голая дата "DD месяца" — считаем как "с DD месяца"
         m = re.match(r'(\d+)\s+(\w+)$', part, re.IGNORECASE)
         if m and m.group(2).lower() in MONTHS:
-            d_start = _parse_date(m.group(1), m.group(2))
-            ranges.append((d_start, date(YEAR, 12, 31)))
+            d_start = _parse_date(m.group(1), m.group(2), year)
+            ranges.append((d_start, date(year, 12, 31)))
             continue
 
         logger.warning("Не удалось распарсить сезонные даты: '%s'", part)
 
     if not ranges:
         logger.warning("Пустой результат парсинга дат из '%s', используем весь год", text)
-        return [(date(YEAR, 1, 1), date(YEAR, 12, 31))]
+        return [(date(year, 1, 1), date(year, 12, 31))]
 
     return ranges
 
@@ -154,7 +158,7 @@ def normalize_day_range(day_range_str):
     return text
 
 
-def parse_wp_boat(boat_data):
+def parse_wp_boat(boat_data, year=None):
     """
     Преобразует данные теплохода из WP JSON в список ценовых записей для NaviBot.
 
@@ -185,7 +189,7 @@ def parse_wp_boat(boat_data):
             continue
 
         day_range = normalize_day_range(day_range_raw)
-        date_ranges = parse_season_dates(season_dates_text)
+        date_ranges = parse_season_dates(season_dates_text, year)
 
         for d_start, d_end in date_ranges:
             prices_out.append({